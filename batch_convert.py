@@ -0,0 +1,500 @@
+"""
+Headless batch conversion of many documents.
+
+Rendering and PPTX assembly run in a pool of worker processes, so CPU-heavy
+work on one file overlaps with network waits on others. All model calls go
+through a single analysis stage in the parent process (one GeminiAnalyzer,
+one rate limiter, one cache), which workers reach through RemoteAnalyzer.
+
+    python pdf2pptx.py batch docs/ "scans/**/*.pdf" @manifest.txt -o out/
+"""
+import copy
+import glob
+import itertools
+import json
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FutureTimeout
+
+import pdf2pptx
+from page_dedupe import PageHashIndex
+from pdf2pptx import ConversionCancelled, PageRender
+
+SUPPORTED_EXTENSIONS = (".pdf", ".png", ".jpg", ".jpeg", ".bmp")
+
+# Pages remembered by the shared near-duplicate index (~50 KB each)
+DEDUPE_MAX_PAGES = 1000
+
+
+def collect_inputs(specs, recursive=False):
+    """
+    Expands directories, glob patterns and @manifest files (one path per line,
+    '#' comments allowed) into a de-duplicated list of input files.
+    """
+    found = []
+
+    def add_dir(path):
+        if recursive:
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith(SUPPORTED_EXTENSIONS):
+                        found.append(os.path.join(root, name))
+        else:
+            for name in sorted(os.listdir(path)):
+                full = os.path.join(path, name)
+                if os.path.isfile(full) and name.lower().endswith(SUPPORTED_EXTENSIONS):
+                    found.append(full)
+
+    def add(spec):
+        if spec.startswith("@"):
+            with open(spec[1:], "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line and not line.startswith("#"):
+                        add(line)
+        elif os.path.isdir(spec):
+            add_dir(spec)
+        elif glob.has_magic(spec):
+            for path in sorted(glob.glob(spec, recursive=True)):
+                if os.path.isdir(path):
+                    add_dir(path)
+                elif path.lower().endswith(SUPPORTED_EXTENSIONS):
+                    found.append(path)
+        else:
+            found.append(spec)
+
+    for spec in specs:
+        add(spec)
+
+    seen = set()
+    unique = []
+    for path in found:
+        key = os.path.abspath(path)
+        if key not in seen:
+            seen.add(key)
+            unique.append(path)
+    return unique
+
+
+def plan_outputs(inputs, output_dir):
+    """Maps each input to OUTPUT_DIR/<name>.pptx, adding a suffix when names collide."""
+    used = set()
+    jobs = []
+    for path in inputs:
+        name = os.path.splitext(os.path.basename(path))[0]
+        candidate = name
+        for n in itertools.count(2):
+            if candidate.lower() not in used:
+                break
+            candidate = f"{name}_{n}"
+        used.add(candidate.lower())
+        jobs.append((path, os.path.join(output_dir, candidate + ".pptx")))
+    return jobs
+
+
+class AnalysisServer:
+    """
+    Serves analysis requests from worker processes with one shared analyzer.
+
+    Messages arrive on `request_queue` as (kind, worker_id, request_id,
+    payload). "analyze" carries a list of (encoded bytes, mime type, pixel
+    size) and is answered on response_queues[worker_id] as (request_id,
+    layouts, error). Once `cancel_event` is set, queued requests are answered
+    with an error instead of reaching the analyzer.
+
+    The near-duplicate index (`dedupe_index`) is shared by every worker, so
+    --dedupe works across files: "dedupe_find" looks up a page signature
+    (see RemoteHashIndex) and "dedupe_done" delivers the layout of a page
+    that missed, which is then passed on to every page that matched it.
+
+    `latencies` holds the duration of the most recent analyzer calls.
+    """
+    def __init__(self, analyzer, request_queue, response_queues, concurrency=8, cancel_event=None, dedupe_index=None):
+        self.analyzer = analyzer
+        self.request_queue = request_queue
+        self.response_queues = response_queues
+        self.cancel_event = cancel_event
+        self.dedupe_index = dedupe_index or PageHashIndex(max_entries=DEDUPE_MAX_PAGES)
+        self._claims = {}  # (worker_id, claim_id) -> Future of the layout, owned by the loop thread
+        self.latencies = deque(maxlen=50)
+        self.executor = ThreadPoolExecutor(max_workers=max(1, concurrency))
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.request_queue.put(None)
+        self.thread.join()
+        self.executor.shutdown(wait=True)
+
+    def cancel_claims(self):
+        """Fails pending near-duplicate lookups, so no worker waits on a page that will not be analyzed."""
+        self.request_queue.put(("cancel_claims", None, None, None))
+
+    def _loop(self):
+        # Index lookups run on this thread, so finding and claiming a page is atomic
+        while True:
+            message = self.request_queue.get()
+            if message is None:
+                break
+            kind, worker_id, request_id, payload = message
+            if kind == "analyze":
+                self.executor.submit(self._handle, worker_id, request_id, payload)
+            elif kind == "dedupe_find":
+                self._dedupe_find(worker_id, request_id, payload)
+            elif kind == "dedupe_done":
+                self._dedupe_done(worker_id, request_id, *payload)
+            elif kind == "cancel_claims":
+                for entry in self._claims.values():
+                    if not entry.done():
+                        entry.set_exception(ConversionCancelled("Cancelled"))
+                self._claims.clear()
+
+    def _dedupe_find(self, worker_id, request_ids, signature):
+        found_id, layout_id = request_ids
+        response_queue = self.response_queues[worker_id]
+        entry = self.dedupe_index.find(signature)
+        if entry is None:
+            # This worker analyzes the page; others matching it wait for the layout
+            entry = Future()
+            self.dedupe_index.add(signature, entry)
+            self._claims[(worker_id, found_id)] = entry
+            response_queue.put((found_id, False, None))
+            return
+
+        response_queue.put((found_id, True, None))
+
+        def reply(entry):
+            error = entry.exception()
+            if error is not None:
+                response_queue.put((layout_id, None, "Cancelled" if isinstance(error, ConversionCancelled) else str(error)))
+            else:
+                response_queue.put((layout_id, entry.result(), None))
+        entry.add_done_callback(reply)
+
+    def _dedupe_done(self, worker_id, claim_id, layout, error):
+        entry = self._claims.pop((worker_id, claim_id), None)
+        if entry is None or entry.done():
+            return
+        if error is not None:
+            entry.set_exception(RuntimeError(error))
+        else:
+            entry.set_result(layout)
+
+    def _handle(self, worker_id, request_id, pages):
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            self.response_queues[worker_id].put((request_id, None, "Cancelled"))
+            return
+        renders = [PageRender(data=data, mime_type=mime_type, size=size) for data, mime_type, size in pages]
+        start = time.perf_counter()
+        try:
+            if len(renders) == 1:
+                layouts = [self.analyzer.analyze_page(renders[0])]
+            else:
+                layouts = self.analyzer.analyze_pages(renders)
+            reply = (request_id, layouts, None)
+        except Exception as e:
+            reply = (request_id, None, f"{type(e).__name__}: {e}")
+        self.latencies.append(time.perf_counter() - start)
+        self.response_queues[worker_id].put(reply)
+
+
+class RemoteAnalyzer:
+    """
+    Stands in for GeminiAnalyzer inside a worker process, forwarding to the
+    AnalysisServer. Waits end with ConversionCancelled soon after
+    `cancel_event` is set, without waiting for the model to answer.
+    `model` mirrors the parent's analyzer so journals and manifests record it.
+    """
+    def __init__(self, worker_id, request_queue, response_queue, cancel_event=None, model=None):
+        self.worker_id = worker_id
+        self.model = model
+        self.request_queue = request_queue
+        self.response_queue = response_queue
+        self.cancel_event = cancel_event
+        self._ids = itertools.count()
+        self._futures = {}
+        self._lock = threading.Lock()
+        threading.Thread(target=self._dispatch, daemon=True).start()
+
+    def _dispatch(self):
+        while True:
+            request_id, result, error = self.response_queue.get()
+            with self._lock:
+                future = self._futures.pop(request_id, None)
+            if future is None:
+                continue
+            if error == "Cancelled":
+                future.set_exception(ConversionCancelled(error))
+            elif error is not None:
+                future.set_exception(RuntimeError(error))
+            else:
+                future.set_result(result)
+
+    def _send(self, kind, payload, replies=1):
+        """Sends a message to the server; returns [(request_id, Future)] for its replies."""
+        pending = [(None, Future()) for _ in range(replies)]
+        with self._lock:
+            pending = [(next(self._ids), future) for _, future in pending]
+            self._futures.update(pending)
+        ids = [request_id for request_id, _ in pending]
+        self.request_queue.put((kind, self.worker_id, ids[0] if replies == 1 else tuple(ids), payload))
+        return pending
+
+    def _call(self, renders):
+        pages = [(r.data, r.mime_type, r.size) for r in renders]
+        [(_, future)] = self._send("analyze", pages)
+        return self._wait(future)
+
+    def _wait(self, future):
+        while True:
+            try:
+                return future.result(timeout=0.2)
+            except FutureTimeout:
+                if self.cancel_event is not None and self.cancel_event.is_set():
+                    raise ConversionCancelled("Cancelled while waiting for the model")
+
+    def analyze_page(self, image):
+        return self._call([PageRender.wrap(image)])[0]
+
+    def analyze_pages(self, images):
+        return self._call([PageRender.wrap(image) for image in images])
+
+    def dedupe_find(self, signature):
+        """
+        Looks a page up in the server's shared index. Returns (Future of the
+        matching page's layout, None) on a hit, or (None, claim_id) when this
+        worker must analyze the page and report it with dedupe_done.
+        """
+        (found_id, found), (layout_id, layout) = self._send("dedupe_find", signature, replies=2)
+        if self._wait(found):
+            return layout, None
+        with self._lock:
+            self._futures.pop(layout_id, None)
+        return None, found_id
+
+    def dedupe_done(self, claim_id, future):
+        """Reports the outcome of a claimed page's analysis future to the server."""
+        if future.cancelled():
+            payload = (None, "Cancelled")
+        elif future.exception() is not None:
+            error = future.exception()
+            payload = (None, "Cancelled" if isinstance(error, ConversionCancelled) else f"{type(error).__name__}: {error}")
+        else:
+            payload = (future.result(), None)
+        self.request_queue.put(("dedupe_done", self.worker_id, claim_id, payload))
+
+
+class RemoteHashIndex(PageHashIndex):
+    """
+    PageHashIndex for worker processes, backed by the AnalysisServer's index
+    so near-duplicates are found across every file and worker. Signatures
+    are computed locally; a page that misses is claimed on the server and
+    its layout is sent there once the future passed to add() completes.
+    """
+    def __init__(self, analyzer):
+        super().__init__()
+        self.analyzer = analyzer
+        self._claims = {}
+
+    def find(self, signature):
+        layout, claim_id = self.analyzer.dedupe_find(signature)
+        if layout is not None:
+            self.hits += 1
+            return layout
+        self._claims[id(signature)] = claim_id
+        return None
+
+    def add(self, signature, value):
+        claim_id = self._claims.pop(id(signature))
+        value.add_done_callback(lambda future: self.analyzer.dedupe_done(claim_id, future))
+
+
+# Set in each worker process by _init_worker
+_worker_analyzer = None
+_worker_dedupe = None
+_worker_progress = None
+_worker_cancel = None
+
+
+def _init_worker(request_queue, response_queues, slot_queue, remote, progress_queue=None, cancel_event=None, model=None):
+    global _worker_analyzer, _worker_dedupe, _worker_progress, _worker_cancel
+    worker_id = slot_queue.get()
+    if remote:
+        _worker_analyzer = RemoteAnalyzer(worker_id, request_queue, response_queues[worker_id], cancel_event, model=model)
+        _worker_dedupe = RemoteHashIndex(_worker_analyzer)
+    _worker_progress = progress_queue
+    _worker_cancel = cancel_event
+
+
+def _convert_job(input_path, output_path, args, job_id=None):
+    """
+    Runs in a worker process. Returns the summary record for one file.
+    With a job_id, page progress is reported as (job_id, done, total) on the
+    progress queue given to _init_worker.
+    """
+    summary = {"input": input_path, "output": output_path, "status": "ok", "error": None}
+    progress = None
+    if job_id is not None and _worker_progress is not None:
+        progress = lambda done, total: _worker_progress.put((job_id, done, total))
+    start = time.perf_counter()
+    try:
+        pipeline = pdf2pptx.convert_document(input_path, output_path, _worker_analyzer, args, log=lambda msg: None,
+                                             dedupe_index=_worker_dedupe if args.dedupe else None,
+                                             progress=progress, cancel_event=_worker_cancel)
+        stats = pipeline.stats
+        summary.update({
+            "pages": pipeline.builder.slide_count,
+            "native_pages": stats["native"],
+            "gemini_pages": stats["gemini"],
+            "reused_pages": stats["reused"],
+            "resumed_pages": stats["resumed"],
+            "unchanged_pages": stats["unchanged"],
+            "api_calls": stats["requests"],
+        })
+    except ConversionCancelled:
+        summary["status"] = "cancelled"
+    except Exception as e:
+        summary["status"] = "error"
+        summary["error"] = f"{type(e).__name__}: {e}"
+    summary["seconds"] = round(time.perf_counter() - start, 3)
+    return summary
+
+
+def _noop():
+    return None
+
+
+class WorkerPool:
+    """
+    Worker processes for whole-document conversions, plus the AnalysisServer
+    that gives them one shared analyzer (None: every page must be native)
+    and one near-duplicate index for jobs run with --dedupe.
+
+    Jobs submitted with a job_id report (job_id, done, total) on
+    `progress_queue` as their pages finish. cancel() stops queued jobs and
+    makes running ones end with status "cancelled" within a fraction of a
+    second; their journals are kept for --resume.
+    """
+    def __init__(self, analyzer, workers, analysis_concurrency=8, dedupe_threshold=6):
+        self.analyzer = analyzer
+        self.workers = max(1, workers)
+        ctx = multiprocessing.get_context("spawn")
+        request_queue = ctx.Queue()
+        response_queues = [ctx.Queue() for _ in range(self.workers)]
+        self.progress_queue = ctx.Queue()
+        self.cancel_event = ctx.Event()
+        slot_queue = ctx.Queue()
+        for i in range(self.workers):
+            slot_queue.put(i)
+
+        self.server = None
+        if analyzer is not None:
+            self.server = AnalysisServer(analyzer, request_queue, response_queues,
+                                         concurrency=analysis_concurrency, cancel_event=self.cancel_event,
+                                         dedupe_index=PageHashIndex(threshold=dedupe_threshold, max_entries=DEDUPE_MAX_PAGES))
+            self.server.start()
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=ctx, initializer=_init_worker,
+            initargs=(request_queue, response_queues, slot_queue, analyzer is not None, self.progress_queue, self.cancel_event,
+                      getattr(analyzer, "model", None)),
+        )
+
+    def submit(self, input_path, output_path, args, job_id=None):
+        """Returns a Future for the job's summary record (see _convert_job)."""
+        return self.pool.submit(_convert_job, input_path, output_path, args, job_id)
+
+    def warm_up(self):
+        """Starts every worker process now so the first jobs do not pay for imports."""
+        for future in [self.pool.submit(_noop) for _ in range(self.workers)]:
+            future.result()
+
+    def latencies(self):
+        """Durations in seconds of the most recent analysis requests."""
+        return list(self.server.latencies) if self.server is not None else []
+
+    def cancel(self):
+        self.cancel_event.set()
+        if self.server is not None:
+            self.server.cancel_claims()
+
+    def close(self):
+        self.pool.shutdown(wait=True, cancel_futures=self.cancel_event.is_set())
+        if self.server is not None:
+            self.server.stop()
+
+
+def add_batch_args(parser):
+    parser.add_argument("inputs", nargs="+", help="Input files, directories, glob patterns or @manifest files")
+    parser.add_argument("-o", "--output_dir", required=True, help="Directory for the converted PPTX files")
+    parser.add_argument("--recursive", help="Search directories recursively", action="store_true")
+    parser.add_argument("--workers", help="Number of worker processes for rendering and assembly", default=os.cpu_count() or 2, type=int)
+    parser.add_argument("--analysis_concurrency", help="Number of Gemini requests in flight across all workers", default=8, type=int)
+    parser.add_argument("--summary", help="Per-file summary (JSON Lines); defaults to OUTPUT_DIR/batch_summary.jsonl")
+
+
+def cmd_batch(args):
+    inputs = collect_inputs(args.inputs, recursive=args.recursive)
+    missing = [path for path in inputs if not os.path.isfile(path)]
+    for path in missing:
+        print(f"Error: Input file {path} not found.")
+    inputs = [path for path in inputs if path not in missing]
+    if not inputs:
+        print("Error: No input files to convert.")
+        return
+
+    if not pdf2pptx._check_api_key(args):
+        return
+
+    if args.pages:
+        try:
+            pdf2pptx.parse_page_spec(args.pages)
+        except pdf2pptx.PageSelectionError as e:
+            print(f"Error: {e}")
+            return
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    jobs = plan_outputs(inputs, args.output_dir)
+    summary_path = args.summary or os.path.join(args.output_dir, "batch_summary.jsonl")
+    workers = max(1, min(args.workers, len(jobs)))
+
+    analyzer = pdf2pptx._make_analyzer(args)
+    # Workers never talk to the API themselves
+    job_args = copy.copy(args)
+    job_args.api_key = None
+
+    pool = WorkerPool(analyzer, workers, analysis_concurrency=args.analysis_concurrency, dedupe_threshold=args.dedupe_threshold)
+
+    print(f"Converting {len(jobs)} files with {workers} workers...")
+    start = time.perf_counter()
+    results = []
+    try:
+        with open(summary_path, "w", encoding="utf-8") as summary_file:
+            futures = [pool.submit(input_path, output_path, job_args) for input_path, output_path in jobs]
+            for done, future in enumerate(as_completed(futures), 1):
+                summary = future.result()
+                results.append(summary)
+                summary_file.write(json.dumps(summary, ensure_ascii=False) + "\n")
+                summary_file.flush()
+                if summary["status"] == "ok":
+                    print(f"[{done}/{len(jobs)}] {summary['input']}: {summary['pages']} pages, "
+                          f"{summary['api_calls']} API calls, {summary['seconds']:.1f}s")
+                else:
+                    print(f"[{done}/{len(jobs)}] {summary['input']}: {summary['error']}")
+    finally:
+        pool.close()
+
+    elapsed = time.perf_counter() - start
+    ok = [r for r in results if r["status"] == "ok"]
+    pages = sum(r["pages"] for r in ok)
+    calls = sum(r["api_calls"] for r in ok)
+    print(f"Done: {len(ok)}/{len(results)} files, {pages} pages, {calls} API calls in {elapsed:.1f}s")
+    if args.dedupe:
+        print(f"Near-duplicate pages: {sum(r['reused_pages'] for r in ok)} API calls saved")
+    print(f"Summary saved to {summary_path}")
@@ -0,0 +1,96 @@
+"""
+Regression check and benchmark for near-duplicate page detection (--dedupe).
+
+Usage:
+    python benchmarks/bench_dedupe.py [--pages 200]
+
+Renders invoice-like pages that differ in a single small number ("Qty 18" vs
+"Qty 19", "4,150" vs "4,750", ...) both with a text layer and as image-only
+pages, and checks that PageHashIndex never reuses a layout between them
+while identical pages still match. Then times signature() and find() over an
+index of --pages pages.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz  # pymupdf
+import numpy as np
+
+from page_dedupe import PageHashIndex
+
+# (first page, second page, font size) differing in one field
+PAIRS = [
+    ("Qty 18", "Qty 19", 11),
+    ("Amount due: 4,150 EUR", "Amount due: 4,750 EUR", 9),
+    ("Amount due: 4,150 EUR", "Amount due: 4,750 EUR", 10),
+    ("Total: $1,200", "Total: $1,300", 10),
+]
+
+
+def make_page(field, fontsize, text_layer=True, zoom=2.0):
+    """(RGB pixels, text layer) of a page with a fixed template and one variable field."""
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((72, 100), "INVOICE", fontsize=20)
+    page.insert_textbox(fitz.Rect(72, 130, 520, 600), "Terms and conditions of the order. " * 40, fontsize=10)
+    page.insert_text((72, 650), field, fontsize=fontsize)
+    if not text_layer:
+        # The same page as a scan: an image with no text layer
+        scan = fitz.open()
+        scanned = scan.new_page(width=page.rect.width, height=page.rect.height)
+        scanned.insert_image(scanned.rect, pixmap=page.get_pixmap(matrix=fitz.Matrix(zoom, zoom)))
+        page = scanned
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+    pixels = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)[..., :3]
+    return pixels, page.get_text()
+
+
+def check_pairs():
+    failures = []
+    for text_layer in (True, False):
+        kind = "text layer" if text_layer else "image only"
+        for first, second, fontsize in PAIRS + [(PAIRS[0][0], PAIRS[0][0], PAIRS[0][2])]:
+            index = PageHashIndex()
+            index.add(index.signature(*make_page(first, fontsize, text_layer)), first)
+            reused = index.find(index.signature(*make_page(second, fontsize, text_layer))) is not None
+            ok = reused == (first == second)
+            print(f"{kind:<11}{first!r:>26} vs {second!r:<26}{fontsize:>3}pt  {'reused' if reused else 'analyzed':<9}"
+                  f"{'OK' if ok else 'WRONG'}")
+            if not ok:
+                failures.append(f"{kind}: {first!r} vs {second!r} at {fontsize}pt")
+    return failures
+
+
+def bench(pages):
+    index = PageHashIndex()
+    renders = [make_page(f"Invoice number {n:05d}", 10) for n in range(min(pages, 20))]
+    start = time.perf_counter()
+    signatures = [index.signature(*renders[n % len(renders)]) for n in range(pages)]
+    signed = time.perf_counter()
+    for signature in signatures:
+        if index.find(signature) is None:
+            index.add(signature, None)
+    found = time.perf_counter()
+    print(f"{pages} pages: signature {(signed - start) / pages * 1000:.1f} ms/page, "
+          f"find {(found - signed) / pages * 1000:.2f} ms/page, {index.hits} reused")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that near-duplicate detection never merges pages with different text.")
+    parser.add_argument("--pages", type=int, default=200)
+    args = parser.parse_args()
+
+    failures = check_pairs()
+    bench(args.pages)
+    if failures:
+        for failure in failures:
+            print(f"FAIL reused a layout across different pages: {failure}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
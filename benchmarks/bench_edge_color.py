@@ -0,0 +1,113 @@
+"""
+Micro-benchmark: PPTXBuilder.get_edge_colors vs. the original per-pixel sampler.
+
+Usage:
+    python benchmarks/bench_edge_color.py [--blocks 150] [--repeat 3]
+
+Builds a synthetic zoom-2.0 A4 page with text-like noise, checks that the
+NumPy sampler returns exactly the same colors as the original getpixel loop
+for every box, and prints the timings of both.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw
+
+from pdf2pptx import PPTXBuilder
+
+
+def legacy_edge_color(image, box_2d):
+    """The original getpixel/Counter implementation, kept as the reference."""
+    ymin, xmin, ymax, xmax = box_2d
+    w, h = image.size
+    left = max(0, int((xmin / 1000.0) * w))
+    top = max(0, int((ymin / 1000.0) * h))
+    right = min(w, int((xmax / 1000.0) * w))
+    bottom = min(h, int((ymax / 1000.0) * h))
+    if right <= left or bottom <= top:
+        return (255, 255, 255)
+
+    cropped_rgb = image.crop((left, top, right, bottom)).convert("RGB")
+    cw, ch = cropped_rgb.size
+    depth = 2
+    pixels = []
+    for y in range(min(depth, ch)):
+        for x in range(cw):
+            pixels.append(cropped_rgb.getpixel((x, y)))
+            pixels.append(cropped_rgb.getpixel((x, ch - 1 - y)))
+    for x in range(min(depth, cw)):
+        for y in range(ch):
+            pixels.append(cropped_rgb.getpixel((x, y)))
+            pixels.append(cropped_rgb.getpixel((cw - 1 - x, y)))
+    if not pixels:
+        return (255, 255, 255)
+    return Counter(pixels).most_common(1)[0][0]
+
+
+def make_page(num_blocks, seed=0):
+    rng = random.Random(seed)
+    image = Image.new("RGB", (1190, 1684), (250, 250, 250))
+    draw = ImageDraw.Draw(image)
+    boxes = []
+    for _ in range(num_blocks):
+        ymin = rng.randint(0, 960)
+        xmin = rng.randint(0, 900)
+        ymax = min(1000, ymin + rng.randint(0, 40))
+        xmax = min(1000, xmin + rng.randint(0, 300))
+        boxes.append([ymin, xmin, ymax, xmax])
+
+        # Colored panel with some "glyph" noise inside
+        fill = rng.choice([(250, 250, 250), (30, 60, 120), (255, 240, 200)])
+        px = [xmin * 1190 // 1000, ymin * 1684 // 1000, xmax * 1190 // 1000, ymax * 1684 // 1000]
+        draw.rectangle(px, fill=fill)
+        for _ in range(20):
+            x = rng.randint(px[0], max(px[0], px[2]))
+            y = rng.randint(px[1], max(px[1], px[3]))
+            draw.point((x, y), fill=(rng.randint(0, 255), 0, 0))
+
+    # A few degenerate and out-of-range boxes
+    boxes += [[500, 500, 500, 600], [990, 990, 1200, 1200], [10, 10, 11, 11]]
+    return image, boxes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark edge-color sampling.")
+    parser.add_argument("--blocks", type=int, default=150)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    image, boxes = make_page(args.blocks)
+    builder = PPTXBuilder(os.devnull, mode="text_focus")
+
+    expected = [legacy_edge_color(image, b) for b in boxes]
+    actual = builder.get_edge_colors(image, boxes)
+    mismatches = [i for i, (a, b) in enumerate(zip(expected, actual)) if a != b]
+    if mismatches:
+        print(f"MISMATCH in {len(mismatches)} boxes, e.g. box {mismatches[0]}: {expected[mismatches[0]]} != {actual[mismatches[0]]}")
+        sys.exit(1)
+
+    def best_of(fn):
+        best = float("inf")
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - t0)
+        return best
+
+    legacy = best_of(lambda: [legacy_edge_color(image, b) for b in boxes])
+    batched = best_of(lambda: builder.get_edge_colors(image, boxes))
+
+    print(f"boxes:   {len(boxes)} on a {image.size[0]}x{image.size[1]} page (results identical)")
+    print(f"legacy:  {legacy * 1000:8.1f} ms")
+    print(f"numpy:   {batched * 1000:8.1f} ms")
+    print(f"speedup: {legacy / batched:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
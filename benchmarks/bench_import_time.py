@@ -0,0 +1,155 @@
+"""
+Startup benchmark and regression check for lazy imports.
+
+Usage:
+    python benchmarks/bench_import_time.py [--repeat 5] [--budget_ms 150] [--output results.jsonl]
+
+Runs each startup path in a fresh interpreter under `python -X importtime`
+and reports the wall time of the process, the time spent in imports after
+interpreter startup (`site`) and the slowest of those imports. Fails if a
+path loads a dependency it must not need or if `import pdf2pptx` takes
+longer than --budget_ms:
+
+    import   `import pdf2pptx`           no fitz, NumPy, PIL, pptx, lxml, Gemini SDK
+    help     `pdf2pptx.py --help`        same
+    gui      `import gui_app`            same (skipped without tkinter/tkinterdnd2)
+    native   convert with --engine native  no Gemini SDK or httpx
+
+Bytecode is compiled before measuring, so the numbers match an installed copy
+rather than a first run after editing.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.abspath(os.path.dirname(__file__)))
+
+HEAVY = ("fitz", "numpy", "PIL.Image", "pptx", "lxml.etree", "google.genai", "httpx")
+API = ("google.genai", "httpx")
+
+
+def parse_importtime(stderr):
+    """
+    ({module: cumulative_us}, [(module, cumulative_us)] of the top-level
+    imports made after interpreter startup) from `-X importtime` output.
+    """
+    modules = {}
+    top_level = []
+    started = False
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = int(cumulative_us)
+        if name.startswith(" ") and not name.startswith("  "):
+            if started:
+                top_level.append((name.strip(), int(cumulative_us)))
+            elif name.strip() == "site":
+                started = True
+    return modules, top_level
+
+
+def make_pdf(path):
+    import fitz  # pymupdf
+    doc = fitz.open()
+    for n in range(3):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Startup benchmark page {n + 1}", fontsize=20)
+        page.insert_textbox(fitz.Rect(72, 110, 520, 700), "Body text of the page. " * 60, fontsize=11)
+    doc.save(path)
+
+
+def scenarios(workdir):
+    pdf_path = os.path.join(workdir, "startup.pdf")
+    make_pdf(pdf_path)
+    script = os.path.join(ROOT, "pdf2pptx.py")
+    return [
+        ("import", [sys.executable, "-X", "importtime", "-c", "import pdf2pptx"], HEAVY),
+        ("help", [sys.executable, "-X", "importtime", script, "--help"], HEAVY),
+        ("gui", [sys.executable, "-X", "importtime", "-c", "import gui_app"], HEAVY),
+        ("native", [sys.executable, "-X", "importtime", script, pdf_path, os.path.join(workdir, "out.pptx"),
+                    "--engine", "native", "--no_cache"], API),
+    ]
+
+
+def run(command):
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    env.pop("GOOGLE_API_KEY", None)
+    start = time.perf_counter()
+    proc = subprocess.run(command, cwd=ROOT, env=env, capture_output=True, text=True)
+    return time.perf_counter() - start, proc
+
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure CLI and GUI startup and check that heavy imports stay lazy.")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per path; the median is reported")
+    parser.add_argument("--budget_ms", type=float, default=150, help="Maximum import time of `import pdf2pptx` (0 = no limit)")
+    parser.add_argument("--top", type=int, default=5, help="Number of slowest imports to list per path")
+    parser.add_argument("--output", help="Append results to this JSON Lines file")
+    args = parser.parse_args()
+
+    subprocess.run([sys.executable, "-m", "compileall", "-q", ROOT], check=True)
+    workdir = tempfile.mkdtemp(prefix="pdf2pptx-startup-")
+    failures = []
+    results = []
+
+    print(f"{'path':<8}{'wall ms':>9}{'import ms':>11}  slowest imports (ms)")
+    for name, command, forbidden in scenarios(workdir):
+        walls, imports = [], []
+        for _ in range(max(1, args.repeat)):
+            wall, proc = run(command)
+            modules, top_level = parse_importtime(proc.stderr)
+            if proc.returncode != 0:
+                break
+            walls.append(wall * 1000)
+            imports.append(sum(us for _, us in top_level) / 1000)
+        if proc.returncode != 0:
+            if name == "gui" and ("tkinter" in proc.stderr or "tkinterdnd2" in proc.stderr):
+                print(f"{name:<8}skipped (tkinter/tkinterdnd2 not available)")
+                continue
+            failures.append(f"{name}: exited with {proc.returncode}")
+            print(f"{name:<8}failed: {proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else proc.returncode}")
+            continue
+
+        wall_ms, import_ms = statistics.median(walls), statistics.median(imports)
+        slowest = sorted(top_level, key=lambda item: item[1], reverse=True)[:args.top]
+        print(f"{name:<8}{wall_ms:>9.0f}{import_ms:>11.1f}  " + ", ".join(f"{m} {us / 1000:.0f}" for m, us in slowest))
+
+        loaded = [m for m in forbidden if m in modules]
+        if loaded:
+            failures.append(f"{name}: loads {', '.join(loaded)}")
+        if name == "import" and args.budget_ms and import_ms > args.budget_ms:
+            failures.append(f"import: pdf2pptx takes {import_ms:.0f} ms to import (budget {args.budget_ms:g} ms)")
+        results.append({"path": name, "wall_ms": round(wall_ms, 1), "import_ms": round(import_ms, 1),
+                        "loaded": sorted(m for m in HEAVY if m in modules)})
+
+    if args.output:
+        revision = _git_revision()
+        timestamp = time.strftime("%Y-%m-%dT%H:%M:%S")
+        with open(args.output, "a", encoding="utf-8") as f:
+            for result in results:
+                f.write(json.dumps({"time": timestamp, "revision": revision, **result}) + "\n")
+        print(f"Results appended to {args.output}")
+
+    if failures:
+        for failure in failures:
+            print(f"FAIL {failure}")
+        sys.exit(1)
+    print("OK: heavy dependencies stay lazy on every startup path")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Regression check and benchmark for text-layer extraction (NativeAnalyzer).
+
+Usage:
+    python benchmarks/bench_native_extract.py [--pages 50]
+
+Builds pages with a filled rectangle and a line of text at every page
+rotation (0/90/180/270), renders them and checks that the boxes
+NativeAnalyzer returns match where the rectangle and the text ink actually
+appear in the rendered image. Then times analyze_page over --pages pages.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz  # pymupdf
+import numpy as np
+
+from native_extract import NativeAnalyzer
+
+TOLERANCE = 3  # in 1000ths of the page
+
+
+def make_page(doc, rotation):
+    page = doc.new_page(width=595, height=842)
+    page.draw_rect(fitz.Rect(50, 50, 200, 300), color=(1, 0, 0), fill=(1, 0, 0))
+    page.insert_text((300, 600), "Text layer extraction check on a rotated page", fontsize=12)
+    page.set_rotation(rotation)
+    return page
+
+
+def ink_box(mask):
+    """box_2d of the True pixels of a mask."""
+    h, w = mask.shape
+    (y0, x0), (y1, x1) = np.argwhere(mask).min(0), np.argwhere(mask).max(0) + 1
+    return [round(y0 / h * 1000), round(x0 / w * 1000), round(y1 / h * 1000), round(x1 / w * 1000)]
+
+
+def check_rotations():
+    failures = []
+    for rotation in (0, 90, 180, 270):
+        doc = fitz.open()
+        page = make_page(doc, rotation)
+        pix = page.get_pixmap()
+        pixels = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+        red = ink_box((pixels[..., 0] > 200) & (pixels[..., 1] < 50))
+        text = ink_box(pixels[..., :3].sum(axis=-1) < 200)
+
+        layout = NativeAnalyzer(doc).analyze_page(0)
+        image_box = layout["image_regions"][0]["box_2d"] if layout["image_regions"] else None
+        text_box = layout["text_blocks"][0]["box_2d"] if layout["text_blocks"] else None
+
+        image_ok = image_box is not None and max(abs(a - b) for a, b in zip(image_box, red)) <= TOLERANCE
+        # The text box is the font's line box, so it must contain the ink rather than match it
+        text_ok = text_box is not None and (
+            text_box[0] <= text[0] + TOLERANCE and text_box[1] <= text[1] + TOLERANCE
+            and text_box[2] >= text[2] - TOLERANCE and text_box[3] >= text[3] - TOLERANCE)
+        print(f"rotate {rotation:>3}: figure {image_box} (rendered {red}), text {text_box} (ink {text})"
+              f"  {'OK' if image_ok and text_ok else 'MISPLACED'}")
+        if not (image_ok and text_ok):
+            failures.append(rotation)
+    return failures
+
+
+def bench(pages):
+    doc = fitz.open()
+    for n in range(pages):
+        page = make_page(doc, (0, 90, 180, 270)[n % 4])
+        page.insert_textbox(fitz.Rect(60, 320, 540, 780), "Body text of the page. " * 80, fontsize=10)
+    analyzer = NativeAnalyzer(doc)
+    start = time.perf_counter()
+    for n in range(pages):
+        analyzer.analyze_page(n)
+    elapsed = time.perf_counter() - start
+    print(f"{pages} pages in {elapsed:.2f}s ({elapsed / pages * 1000:.1f} ms/page)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check and time layout extraction from the PDF text layer.")
+    parser.add_argument("--pages", type=int, default=50)
+    args = parser.parse_args()
+
+    failures = check_rotations()
+    bench(args.pages)
+    if failures:
+        print(f"FAIL: boxes misplaced at rotation {', '.join(map(str, failures))}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""
+End-to-end pipeline benchmark without network access.
+
+Usage:
+    python benchmarks/bench_pipeline.py [--kinds text image scanned poster] [--pages 1 10 100]
+        [--modes standard text_focus] [--latency 0.0] [--stream] [--tile_threshold 0]
+        [--output results.jsonl]
+
+Generates synthetic PDFs (text-heavy, image-heavy, scanned and A0 poster pages) in a
+work directory, converts each one with ReplayAnalyzer standing in for
+Gemini, and reports pages/second, peak RSS and output size per case. Every
+case runs in its own process so peak memory is measured per case.
+
+With --output, results are appended as JSON Lines together with the time and
+git revision, so numbers can be tracked across commits. --pages 1000 is
+supported but takes a while.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import fitz  # pymupdf
+import numpy as np
+from PIL import Image, ImageDraw
+
+KINDS = ("text", "image", "scanned", "poster")
+MODES = ("standard", "text_focus")
+
+_WORDS = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore".split()
+
+
+def _paragraph(rng, words):
+    return " ".join(rng.choice(_WORDS) for _ in range(words))
+
+
+def _photo(rng, size=(640, 480)):
+    """A noisy gradient that compresses like a photo."""
+    w, h = size
+    x = np.linspace(0, 255, w, dtype=np.float32)
+    y = np.linspace(0, 255, h, dtype=np.float32)[:, None]
+    base = np.stack([x + 0 * y, y + 0 * x, (x + y) / 2], axis=-1)
+    noise = np.random.default_rng(rng.randint(0, 2 ** 31)).normal(0, 20, base.shape)
+    stream = io.BytesIO()
+    Image.fromarray(np.clip(base + noise, 0, 255).astype(np.uint8)).save(stream, format="JPEG", quality=85)
+    return stream.getvalue()
+
+
+def _scan(rng, size=(1240, 1754)):
+    """A grayscale 'scanned' page with text-like lines and paper noise."""
+    image = Image.new("L", size, 245)
+    draw = ImageDraw.Draw(image)
+    y = 120
+    while y < size[1] - 120:
+        x = 100
+        while x < size[0] - 140:
+            word = rng.randint(20, 90)
+            draw.rectangle([x, y, x + word, y + 14], fill=rng.randint(20, 60))
+            x += word + 14
+        y += rng.choice([28, 28, 28, 60])
+    noise = np.random.default_rng(rng.randint(0, 2 ** 31)).normal(0, 6, (size[1], size[0]))
+    pixels = np.clip(np.asarray(image, dtype=np.float32) + noise, 0, 255).astype(np.uint8)
+    stream = io.BytesIO()
+    Image.fromarray(pixels).save(stream, format="PNG")
+    return stream.getvalue()
+
+
+def make_pdf(path, kind, pages, seed=0):
+    rng = random.Random(seed)
+    doc = fitz.open()
+    # A few distinct images shared across pages keep large files quick to build
+    if kind in ("image", "poster"):
+        images = [_photo(rng) for _ in range(3)]
+    elif kind == "scanned":
+        images = [_scan(rng) for _ in range(4)]
+    xrefs = {}
+
+    def insert(page, rect, index):
+        if index in xrefs:
+            page.insert_image(rect, xref=xrefs[index])
+        else:
+            xrefs[index] = page.insert_image(rect, stream=images[index])
+
+    for n in range(pages):
+        # A0 for posters
+        page = doc.new_page(width=2384, height=3370) if kind == "poster" else doc.new_page(width=595, height=842)
+        if kind == "text":
+            page.insert_textbox(fitz.Rect(50, 40, 545, 90), f"Section {n + 1}: {_paragraph(rng, 4)}", fontsize=20, fontname="helv")
+            y = 100
+            while y < 780:
+                height = rng.choice([60, 90, 120])
+                page.insert_textbox(fitz.Rect(50, y, 545, y + height), _paragraph(rng, height // 2), fontsize=10, fontname="tiro")
+                y += height + 12
+        elif kind == "image":
+            page.insert_textbox(fitz.Rect(50, 40, 545, 80), f"Figure page {n + 1}", fontsize=18, fontname="helv")
+            insert(page, fitz.Rect(50, 90, 545, 430), n % len(images))
+            insert(page, fitz.Rect(50, 450, 290, 640), (n + 1) % len(images))
+            insert(page, fitz.Rect(305, 450, 545, 640), (n + 2) % len(images))
+            page.insert_textbox(fitz.Rect(50, 660, 545, 800), _paragraph(rng, 60), fontsize=10, fontname="tiro")
+        elif kind == "poster":
+            # Small print in a three-column grid
+            page.insert_textbox(fitz.Rect(100, 80, 2284, 260), f"Poster {n + 1}: {_paragraph(rng, 6)}", fontsize=72, fontname="helv")
+            for col in range(3):
+                x = 100 + col * 740
+                insert(page, fitz.Rect(x, 320, x + 660, 820), (n + col) % len(images))
+                y = 860
+                while y < 3200:
+                    height = rng.choice([120, 180, 240])
+                    page.insert_textbox(fitz.Rect(x, y, x + 660, y + height), _paragraph(rng, height // 2), fontsize=11, fontname="tiro")
+                    y += height + 20
+        else:
+            insert(page, page.rect, n % len(images))
+    doc.save(path, garbage=3, deflate=True)
+    doc.close()
+
+
+def run_case(pdf_path, mode, latency, concurrency, stream, output_path, tile_threshold=0):
+    """Converts one document in this process and returns the measurements."""
+    from pdf2pptx import ConversionPipeline, DocumentProcessor, PPTXBuilder
+    from profiling import peak_rss_mb
+    from replay import ReplayAnalyzer
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        proc = DocumentProcessor(pdf_path)
+        builder = PPTXBuilder(output_path, mode=mode, streaming=stream)
+        pipeline = ConversionPipeline(proc, ReplayAnalyzer(latency=latency), builder, concurrency=concurrency, engine="gemini",
+                                      tile_threshold=tile_threshold)
+        try:
+            pages = pipeline.run()
+        finally:
+            proc.close()
+        builder.save()
+    seconds = time.perf_counter() - start
+    return {
+        "pages": pages,
+        "seconds": round(seconds, 3),
+        "pages_per_s": round(pages / seconds, 2),
+        "peak_rss_mb": peak_rss_mb(),
+        "output_bytes": os.path.getsize(output_path),
+        "requests": pipeline.stats["requests"],
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the conversion pipeline offline.")
+    parser.add_argument("--kinds", nargs="+", default=list(KINDS[:3]), choices=KINDS)
+    parser.add_argument("--pages", nargs="+", type=int, default=[1, 10, 100])
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=MODES)
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated seconds per analysis request")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--stream", action="store_true", help="Use the streaming PPTX writer")
+    parser.add_argument("--tile_threshold", type=float, default=0, help="Analyze pages larger than this many A4 sheets in tiles (0 = never)")
+    parser.add_argument("--workdir", help="Where to keep generated PDFs and outputs (default: a temp dir)")
+    parser.add_argument("--output", help="Append results to this JSON Lines file")
+    # Internal: run a single case in this process
+    parser.add_argument("--case", nargs=3, metavar=("PDF", "MODE", "OUTPUT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        pdf_path, mode, output_path = args.case
+        print(json.dumps(run_case(pdf_path, mode, args.latency, args.concurrency, args.stream, output_path, args.tile_threshold)))
+        return
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="pdf2pptx-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    revision = _git_revision()
+    timestamp = time.strftime("%Y-%m-%dT%H:%M:%S")
+
+    print(f"{'kind':<9}{'pages':>6}  {'mode':<11}{'seconds':>9}{'pages/s':>9}{'peak MB':>9}{'output KB':>11}")
+    results = []
+    for kind in args.kinds:
+        for pages in args.pages:
+            pdf_path = os.path.join(workdir, f"{kind}_{pages}.pdf")
+            if not os.path.exists(pdf_path):
+                make_pdf(pdf_path, kind, pages)
+            for mode in args.modes:
+                output_path = os.path.join(workdir, f"{kind}_{pages}_{mode}.pptx")
+                cmd = [sys.executable, os.path.abspath(__file__), "--case", pdf_path, mode, output_path,
+                       "--latency", str(args.latency), "--concurrency", str(args.concurrency),
+                       "--tile_threshold", str(args.tile_threshold)]
+                if args.stream:
+                    cmd.append("--stream")
+                proc = subprocess.run(cmd, capture_output=True, text=True)
+                if proc.returncode != 0:
+                    print(f"{kind:<9}{pages:>6}  {mode:<11}FAILED\n{proc.stderr}")
+                    continue
+                result = json.loads(proc.stdout.strip().splitlines()[-1])
+                result.update({"kind": kind, "mode": mode, "latency": args.latency, "concurrency": args.concurrency,
+                               "stream": args.stream, "tile_threshold": args.tile_threshold, "revision": revision, "time": timestamp})
+                results.append(result)
+                peak = result["peak_rss_mb"]
+                print(f"{kind:<9}{pages:>6}  {mode:<11}{result['seconds']:>9.2f}{result['pages_per_s']:>9.1f}"
+                      f"{peak if peak is not None else '-':>9}{result['output_bytes'] / 1024:>11.0f}")
+
+    if args.output:
+        with open(args.output, "a", encoding="utf-8") as f:
+            for result in results:
+                f.write(json.dumps(result) + "\n")
+        print(f"Results appended to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
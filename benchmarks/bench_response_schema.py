@@ -0,0 +1,126 @@
+"""
+Output-token benchmark: verbose layout JSON vs. the compact response format.
+
+Usage:
+    python benchmarks/bench_response_schema.py [--blocks 10 40 120] [--layouts FILE.jsonl]
+        [--live doc.pdf --pages 1-3] [--model gemini-3-flash-preview]
+
+Offline (default): serializes synthetic layouts of increasing density, or the
+pages of a layout file (`analyze` output or a .pages.jsonl manifest), in
+both formats, checks that decode_compact_layout(encode_compact_layout(x))
+gives the builder the same input as x, and prints the size of each answer.
+Tokens are counted with the Gemini tokenizer when GOOGLE_API_KEY is set,
+otherwise estimated from the character count.
+
+With --live, the given pages are analyzed once per format (no cache) and the
+response tokens and request latency reported by the API are compared.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pdf2pptx import (DEFAULT_MODEL, DocumentProcessor, GeminiAnalyzer, RESPONSE_FORMATS,
+                      decode_compact_layout, encode_compact_layout, get_client,
+                      read_layout_file)
+from profiling import StageProfiler
+from replay import synthetic_layout
+
+# Fields PPTXBuilder reads from a text block, with the defaults it applies
+TEXT_DEFAULTS = {"text": "", "box_2d": None, "font_size_pt": 12, "font_color_hex": "#000000",
+                 "font_family": "sans", "is_bold": False}
+
+
+def builder_view(layout_data):
+    """What PPTXBuilder.add_slide actually uses from a layout dict."""
+    texts = [tuple(block.get(k, d) for k, d in TEXT_DEFAULTS.items()) for block in layout_data.get("text_blocks", [])]
+    titles = [bool(block.get("is_title")) for block in layout_data.get("text_blocks", [])]
+    images = [region.get("box_2d") for region in layout_data.get("image_regions", [])]
+    return texts, titles, images
+
+
+def wire(data):
+    """The answer as the model would emit it (compact JSON, non-ASCII kept)."""
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+def make_counter(model):
+    api_key = os.environ.get("GOOGLE_API_KEY")
+    if not api_key:
+        print("GOOGLE_API_KEY not set: tokens estimated as characters / 4")
+        return lambda text: round(len(text) / 4)
+    client = get_client(api_key)
+    return lambda text: client.models.count_tokens(model=model, contents=text).total_tokens
+
+
+def load_layouts(path):
+    _, pages = read_layout_file(path)
+    return [(f"page {record['page']}", record["layout"]) for record in pages]
+
+
+def bench_offline(cases, count_tokens):
+    print(f"{'case':<16}{'blocks':>7}{'verbose ch':>12}{'compact ch':>12}{'verbose tok':>13}{'compact tok':>13}{'saved':>8}")
+    totals = {"verbose": 0, "compact": 0}
+    for name, layout_data in cases:
+        compact = encode_compact_layout(layout_data)
+        if builder_view(decode_compact_layout(compact)) != builder_view(layout_data):
+            raise SystemExit(f"{name}: compact round trip changes the slide")
+        verbose_text, compact_text = wire(layout_data), wire(compact)
+        verbose_tokens, compact_tokens = count_tokens(verbose_text), count_tokens(compact_text)
+        totals["verbose"] += verbose_tokens
+        totals["compact"] += compact_tokens
+        saved = 1 - compact_tokens / verbose_tokens if verbose_tokens else 0.0
+        print(f"{name:<16}{len(layout_data.get('text_blocks', [])):>7}{len(verbose_text):>12}{len(compact_text):>12}"
+              f"{verbose_tokens:>13}{compact_tokens:>13}{saved:>8.0%}")
+    if totals["verbose"]:
+        print(f"Total tokens: verbose {totals['verbose']}, compact {totals['compact']} "
+              f"({1 - totals['compact'] / totals['verbose']:.0%} fewer); round trip OK")
+
+
+def bench_live(args):
+    api_key = os.environ.get("GOOGLE_API_KEY")
+    if not api_key:
+        raise SystemExit("--live needs GOOGLE_API_KEY")
+    processor = DocumentProcessor(args.live)
+    page_nums = processor.page_numbers(args.pages)
+    renders = [processor.render_page(n, zoom=args.zoom)[0] for n in page_nums]
+
+    print(f"{'format':<10}{'pages':>7}{'resp tok':>10}{'tok/page':>10}{'median s':>10}{'max s':>8}{'blocks':>8}")
+    for response_format in RESPONSE_FORMATS:
+        profiler = StageProfiler()
+        analyzer = GeminiAnalyzer(api_key, model=args.model, profiler=profiler, response_format=response_format)
+        blocks = sum(len(analyzer.analyze_page(render)["text_blocks"]) for render in renders)
+        requests = [r for r in profiler.records if r["stage"] == "gemini_request"]
+        tokens = sum(r.get("response_tokens", 0) for r in requests)
+        latencies = [r["wall_s"] for r in requests]
+        print(f"{response_format:<10}{len(renders):>7}{tokens:>10}{tokens / len(renders):>10.0f}"
+              f"{statistics.median(latencies):>10.2f}{max(latencies):>8.2f}{blocks:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare verbose and compact Gemini response formats")
+    parser.add_argument("--blocks", help="Text blocks per synthetic page", nargs="+", type=int, default=[10, 40, 120])
+    parser.add_argument("--layouts", help="Layout JSON Lines file to use instead of synthetic pages")
+    parser.add_argument("--live", help="PDF to analyze with both formats (needs GOOGLE_API_KEY)")
+    parser.add_argument("--pages", help="Pages of the --live PDF, e.g. 1-3")
+    parser.add_argument("--zoom", help="Render zoom for --live", default=2.0, type=float)
+    parser.add_argument("--model", help="Gemini model for token counting and --live", default=DEFAULT_MODEL)
+    args = parser.parse_args()
+
+    if args.live:
+        bench_live(args)
+        return
+
+    if args.layouts:
+        cases = load_layouts(args.layouts)
+    else:
+        cases = [(f"synthetic {n}", synthetic_layout(f"bench-{n}", text_blocks=n, image_regions=max(1, n // 20)))
+                 for n in args.blocks]
+    bench_offline(cases, make_counter(args.model))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Regression check and benchmark: bulk-XML text shapes vs. the python-pptx object API.
+
+Usage:
+    python benchmarks/bench_slide_xml.py [--blocks 150] [--slides 5] [--repeat 3]
+
+Builds the same synthetic layouts with PPTXBuilder(bulk_xml=False) and
+PPTXBuilder(bulk_xml=True) in both modes, checks that every slide's shape
+tree is identical (canonical XML), and prints the time spent creating the
+text shapes. Edge cases (escaping, line breaks, control characters,
+malformed colors, missing keys) are included in every layout.
+"""
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lxml import etree
+from PIL import Image
+
+from pdf2pptx import PPTXBuilder
+from profiling import StageProfiler
+
+EDGE_CASE_BLOCKS = [
+    {"text": "Tom & Jerry <b>\"quoted\"</b> 'single'", "box_2d": [10, 10, 40, 300]},
+    {"text": "line one\nline two\vsoft break\n\nafter empty", "box_2d": [50, 10, 90, 300], "is_bold": True},
+    {"text": "ctrl\x07char\ttab\x1b", "box_2d": [100, 10, 130, 300], "font_color_hex": "#12345"},
+    {"text": "", "box_2d": [140, 10, 150, 300], "font_size_pt": None},
+    {"text": "no color", "box_2d": [160, 10, 170, 300], "font_color_hex": None},
+    {"text": "bad color", "box_2d": [180, 10, 190, 300], "font_color_hex": "#GG0000"},
+    {"text": "short color", "box_2d": [200, 10, 210, 300], "font_color_hex": "#abc"},
+    {"text": "negative", "box_2d": [220, 10, 230, 300], "font_color_hex": "#-10000"},
+    {"box_2d": [240, 10, 250, 300]},
+    {"text": "日本語のテキスト", "box_2d": [260, 10, 290, 300], "font_family": "serif", "font_size_pt": 10.5},
+    {"text": "reversed box", "box_2d": [330, 600, 300, 400]},
+    {"text": "edge", "box_2d": [995, 995, 1000, 1000], "font_color_hex": "#ffffff"},
+]
+
+
+def make_layout(rng, num_blocks):
+    blocks = [dict(b) for b in EDGE_CASE_BLOCKS]
+    for _ in range(num_blocks):
+        ymin = rng.randint(0, 980)
+        xmin = rng.randint(0, 900)
+        blocks.append({
+            "text": "\n".join(" ".join(rng.choice(["alpha", "beta", "gamma", "&", "<x>"]) for _ in range(rng.randint(1, 12)))
+                              for _ in range(rng.randint(1, 3))),
+            "box_2d": [ymin, xmin, min(1000, ymin + rng.randint(5, 40)), min(1000, xmin + rng.randint(20, 300))],
+            "font_size_pt": rng.choice([9, 10, 11, 12, 14, 18, 24]),
+            "font_color_hex": rng.choice(["#000000", "#333333", "#1F3864", "#C00000"]),
+            "font_family": rng.choice(["sans", "serif"]),
+            "is_bold": rng.random() < 0.2,
+            "is_title": False,
+        })
+    return {"text_blocks": blocks, "image_regions": []}
+
+
+def build(mode, bulk_xml, image, layouts):
+    """Returns the builder and the seconds spent creating text shapes (excluding image encoding)."""
+    profiler = StageProfiler()
+    builder = PPTXBuilder(os.devnull, mode=mode, bulk_xml=bulk_xml, profiler=profiler)
+    builder.set_slide_size(595 / 72, 842 / 72)
+    for layout in layouts:
+        builder.add_slide(image, layout, 595, 842)
+    return builder, profiler.summary()["text_shapes"]["wall_s"]
+
+
+def sp_trees(builder):
+    return [etree.tostring(slide.shapes._spTree, method="c14n") for slide in builder.prs.slides]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare bulk-XML and object-API slide assembly.")
+    parser.add_argument("--blocks", type=int, default=150, help="Random text blocks per slide (plus edge cases)")
+    parser.add_argument("--slides", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    layouts = [make_layout(rng, args.blocks) for _ in range(args.slides)]
+    image = Image.new("RGB", (1190, 1684), (250, 250, 250))
+
+    failed = False
+    for mode in ("standard", "text_focus"):
+        reference, _ = build(mode, False, image, layouts)
+        bulk, _ = build(mode, True, image, layouts)
+        for n, (a, b) in enumerate(zip(sp_trees(reference), sp_trees(bulk)), 1):
+            if a != b:
+                failed = True
+                print(f"MISMATCH in {mode} mode, slide {n}")
+                for i, (x, y) in enumerate(zip(a, b)):
+                    if x != y:
+                        print(f"  object API: ...{a[max(0, i - 120):i + 120].decode(errors='replace')}...")
+                        print(f"  bulk XML:   ...{b[max(0, i - 120):i + 120].decode(errors='replace')}...")
+                        break
+    if failed:
+        sys.exit(1)
+
+    blocks = len(layouts[0]["text_blocks"])
+    print(f"{args.slides} slides x {blocks} text blocks (shape trees identical)")
+    for mode in ("standard", "text_focus"):
+        legacy = min(build(mode, False, image, layouts)[1] for _ in range(args.repeat))
+        bulk = min(build(mode, True, image, layouts)[1] for _ in range(args.repeat))
+        print(f"{mode:<11} object API: {legacy * 1000:8.1f} ms   bulk XML: {bulk * 1000:8.1f} ms   speedup: {legacy / bulk:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,12 +3,15 @@ from tkinter import filedialog, messagebox, scrolledtext, ttk
 from tkinterdnd2 import DND_FILES, TkinterDnD
 import threading
 import queue
+import multiprocessing
 import os
 import sys
+import time
 from dotenv import load_dotenv
 
 # Import Core Logic
-from pdf2pptx import DocumentProcessor, GeminiAnalyzer, PPTXBuilder
+from pdf2pptx import GeminiAnalyzer, LayoutCache, PageSelectionError, default_args, parse_page_spec
+from batch_convert import WorkerPool, plan_outputs
 
 load_dotenv()
 
@@ -49,6 +52,15 @@ class PDF2PPTXApp(TkinterDnD.Tk):
         self.font_scale_var = tk.BooleanVar(value=True)
         ttk.Checkbutton(settings_frame, text="Font Scale (1.1x)", variable=self.font_scale_var).pack(side="left", padx=10)
 
+        # Reuse the layout of pages with identical text (off: every page is analyzed)
+        self.dedupe_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(settings_frame, text="Reuse duplicate pages", variable=self.dedupe_var).pack(side="left", padx=(0, 10))
+
+        # Page selection (empty = all pages), e.g. 1-10,25,40-
+        ttk.Label(settings_frame, text="Pages:").pack(side="left")
+        self.pages_var = tk.StringVar()
+        ttk.Entry(settings_frame, textvariable=self.pages_var, width=12).pack(side="left", padx=5)
+
         # --- Middle Frame: Drag & Drop List ---
         list_frame = ttk.LabelFrame(self, text="Files (Drag & Drop here)", padding="10")
         list_frame.pack(fill="both", expand=True, padx=10, pady=5)
@@ -78,6 +90,14 @@ class PDF2PPTXApp(TkinterDnD.Tk):
         self.out_dir_var = tk.StringVar()
         ttk.Entry(action_frame, textvariable=self.out_dir_var, width=40).pack(side="left", padx=5)
         ttk.Button(action_frame, text="Browse...", command=self._browse_output).pack(side="left")
+
+        # Files converted side by side (worker processes) and pages analyzed in parallel per file
+        ttk.Label(action_frame, text="Files at once:").pack(side="left", padx=(10, 0))
+        self.files_at_once_var = tk.IntVar(value=2)
+        ttk.Spinbox(action_frame, from_=1, to=16, textvariable=self.files_at_once_var, width=3).pack(side="left", padx=5)
+        ttk.Label(action_frame, text="Pages at once:").pack(side="left")
+        self.pages_at_once_var = tk.IntVar(value=4)
+        ttk.Spinbox(action_frame, from_=1, to=16, textvariable=self.pages_at_once_var, width=3).pack(side="left", padx=5)
         
         # Prominent Start Button
         self.run_btn = tk.Button(action_frame, text="Start Conversion", command=self._start_processing, 
@@ -96,6 +116,10 @@ class PDF2PPTXApp(TkinterDnD.Tk):
         self.progress_var = tk.DoubleVar()
         self.progress_bar = ttk.Progressbar(progress_frame, variable=self.progress_var, maximum=100)
         self.progress_bar.pack(fill="x")
+
+        # Throughput, API latency and ETA of the running batch
+        self.stats_var = tk.StringVar()
+        ttk.Label(progress_frame, textvariable=self.stats_var).pack(anchor="w")
         
         log_frame = ttk.LabelFrame(self, text="Logs", padding="5")
         log_frame.pack(fill="both", expand=True, padx=10, pady=5)
@@ -152,6 +176,8 @@ class PDF2PPTXApp(TkinterDnD.Tk):
                 self.log_area.config(state="disabled")
             elif msg_type == "progress":
                 self.progress_var.set(content)
+            elif msg_type == "stats":
+                self.stats_var.set(content)
             elif msg_type == "done":
                 messagebox.showinfo("Complete", "All tasks completed successfully.")
                 self.processing = False
@@ -174,7 +200,7 @@ class PDF2PPTXApp(TkinterDnD.Tk):
         if self.processing:
             self.cancel_event.set()
             self.cancel_btn.config(state="disabled")
-            self._log("Cancelling... please wait for current step to finish.")
+            self._log("Cancelling...")
 
     def _start_processing(self):
         if self.processing:
@@ -188,89 +214,106 @@ class PDF2PPTXApp(TkinterDnD.Tk):
         if not api_key:
             messagebox.showerror("Error", "API Key is required.\nPlease enter a valid Gemini API Key in the Settings.")
             return
-            
+
+        pages_spec = self.pages_var.get().strip() or None
+        if pages_spec:
+            try:
+                parse_page_spec(pages_spec)
+            except PageSelectionError as e:
+                messagebox.showerror("Error", f"{e}\nUse page ranges like 1-10,25,40-")
+                return
+
+        try:
+            files_at_once = max(1, int(self.files_at_once_var.get()))
+            pages_at_once = max(1, int(self.pages_at_once_var.get()))
+        except (tk.TclError, ValueError):
+            messagebox.showerror("Error", "Files at once and Pages at once must be whole numbers.")
+            return
+
         self.processing = True
         self.cancel_event.clear()
         self.run_btn.config(state="disabled")
         self.cancel_btn.config(state="normal")
         self.progress_var.set(0)
+        self.stats_var.set("")
         
         output_dir = self.out_dir_var.get()
         mode = self.mode_var.get()
         font_scale = 1.1 if self.font_scale_var.get() else 1.0
+        dedupe = self.dedupe_var.get()
         
-        thread = threading.Thread(target=self._worker, args=(self.file_queue, output_dir, mode, api_key, font_scale))
+        thread = threading.Thread(target=self._worker, args=(list(self.file_queue), output_dir, mode, api_key, font_scale, pages_spec,
+                                                             files_at_once, pages_at_once, dedupe))
         thread.start()
 
-    def _worker(self, files, output_dir, mode, api_key, font_scale):
+    def _worker(self, files, output_dir, mode, api_key, font_scale, pages_spec=None, files_at_once=2, pages_at_once=4, dedupe=False):
+        pool = None
         try:
             total_files = len(files)
-            analyzer = GeminiAnalyzer(api_key)
-            
-            for i, file_path in enumerate(files):
+            # One analyzer (client, cache, rate limiter) shared by every worker process
+            analyzer = GeminiAnalyzer(api_key, cache=LayoutCache())
+            # Every page goes to Gemini (with dedupe: except duplicates of a page already sent from any file);
+            # journals left by an interrupted run are picked up again
+            args = default_args(api_key=None, engine="gemini", mode=mode, font_scale=font_scale, pages=pages_spec,
+                                concurrency=pages_at_once, resume=True, dedupe=dedupe)
+
+            if output_dir:
+                jobs = plan_outputs(files, output_dir)
+            else:
+                jobs = [(file_path, os.path.splitext(file_path)[0] + ".pptx") for file_path in files]
+
+            pool = WorkerPool(analyzer, min(files_at_once, total_files), analysis_concurrency=files_at_once * pages_at_once)
+            futures = {pool.submit(file_path, out_path, args, job_id=i): i for i, (file_path, out_path) in enumerate(jobs)}
+            self._log(f"Converting {total_files} files, {pool.workers} at a time...")
+
+            pages = {}     # file index -> (done, total)
+            finished = 0
+            start = time.perf_counter()
+            invalid_key = False
+
+            while futures:
                 if self.cancel_event.is_set():
-                    self._log("Conversion cancelled by user.")
-                    break
+                    pool.cancel()
+                    for future in futures:
+                        future.cancel()
 
+                # Page progress from the workers
                 try:
-                    self._log(f"Processing File {i+1}/{total_files}: {os.path.basename(file_path)}")
-                    
-                    # Determine output path
-                    if output_dir:
-                        base = os.path.basename(file_path)
-                        name, _ = os.path.splitext(base)
-                        out_path = os.path.join(output_dir, name + ".pptx")
+                    while True:
+                        job_id, done, total = pool.progress_queue.get(timeout=0.25)
+                        if job_id not in pages:
+                            self._log(f"Processing File {job_id + 1}/{total_files}: {os.path.basename(jobs[job_id][0])} ({total} pages)")
+                        pages[job_id] = (done, total)
+                except queue.Empty:
+                    pass
+
+                for future in [f for f in futures if f.done()]:
+                    i = futures.pop(future)
+                    file_name = os.path.basename(jobs[i][0])
+                    if future.cancelled():
+                        continue
+                    summary = future.result()
+                    finished += 1
+                    if summary["status"] == "ok":
+                        pages[i] = (summary["pages"], summary["pages"])
+                        self._log(f"  - Saved to {summary['output']} ({summary['pages']} pages, {summary['seconds']:.1f}s)")
+                    elif summary["status"] == "cancelled":
+                        self._log(f"Processing stopped for {file_name}.")
                     else:
-                        base = os.path.splitext(file_path)[0]
-                        out_path = base + ".pptx"
-                        
-                    # Core Logic
-                    proc = DocumentProcessor(file_path)
-                    builder = PPTXBuilder(out_path, mode=mode, font_scale=font_scale)
-                    
-                    try:
-                        num_pages = len(proc.doc)
-                        for page_num in range(num_pages):
-                            if self.cancel_event.is_set():
-                                break
-
-                            self._log(f"  - Page {page_num + 1}/{num_pages}...")
-                            image, w, h = proc.get_page_image(page_num)
-                            
-                            if page_num == 0:
-                                builder.set_slide_size(w/72, h/72)
-                                try:
-                                    builder.prs.slide_width = int(w * 12700)
-                                    builder.prs.slide_height = int(h * 12700)
-                                except:
-                                    pass
-
-                            layout_data = analyzer.analyze_page(image)
-                            builder.add_slide(image, layout_data, w, h)
-                            
-                            # Progress
-                            overall_progress = ((i) + (page_num+1)/num_pages) / total_files * 100
-                            self.msg_queue.put(("progress", overall_progress))
-
-                        if self.cancel_event.is_set():
-                            self._log("Processing stopped for this file.")
+                        error_msg = summary["error"]
+                        if "API key not valid" in error_msg or "API_KEY_INVALID" in error_msg:
+                            self._log("Error: User provided an invalid API Key.")
+                            invalid_key = True
+                            pool.cancel()
                         else:
-                            builder.save()
-                            self._log(f"  - Saved to {out_path}")
-                            
-                    finally:
-                        proc.close()
-                    
-                except Exception as e:
-                    error_msg = str(e)
-                    if "API key not valid" in error_msg or "API_KEY_INVALID" in error_msg:
-                        self._log("Error: User provided an invalid API Key.")
-                        self.msg_queue.put(("error", "Invalid API Key.\nPlease check your API Key in Settings and try again."))
-                        return # Stop processing immediately
-                    else:
-                        self._log(f"Error processing {os.path.basename(file_path)}: {e}")
-            
-            if self.cancel_event.is_set():
+                            self._log(f"Error processing {file_name}: {error_msg}")
+
+                self._post_stats(pages, total_files, finished, start, pool.latencies())
+
+            if invalid_key:
+                self.msg_queue.put(("error", "Invalid API Key.\nPlease check your API Key in Settings and try again."))
+            elif self.cancel_event.is_set():
+                self._log("Conversion cancelled by user.")
                 self.msg_queue.put(("progress", 0))
                 self.msg_queue.put(("cancelled", ""))
             else:
@@ -278,13 +321,38 @@ class PDF2PPTXApp(TkinterDnD.Tk):
                 self.msg_queue.put(("done", ""))
 
         except Exception as e:
-            # ... (error handling code remains same)
             error_msg = str(e)
             if "API key not valid" in error_msg or "API_KEY_INVALID" in error_msg:
                  self.msg_queue.put(("error", "Invalid API Key.\nPlease check your API Key in Settings and try again."))
             else:
                  self.msg_queue.put(("error", f"Critical Error: {e}"))
+        finally:
+            if pool is not None:
+                pool.close()
+
+    def _post_stats(self, pages, total_files, finished, start, latencies):
+        """Sends overall progress, pages/s, API latency and ETA to the UI thread."""
+        done_pages = sum(done for done, _ in pages.values())
+        known_pages = sum(total for _, total in pages.values())
+        # Files that have not started yet are assumed to be as long as the average so far
+        average = known_pages / len(pages) if pages else 0
+        expected_pages = known_pages + average * (total_files - len(pages))
+        elapsed = time.perf_counter() - start
+
+        if expected_pages:
+            self.msg_queue.put(("progress", done_pages / expected_pages * 100))
+        parts = [f"Files {finished}/{total_files}", f"Pages {done_pages}/{round(expected_pages) if pages else '?'}"]
+        if done_pages and elapsed > 0:
+            rate = done_pages / elapsed
+            parts.append(f"{rate:.2f} pages/s")
+            remaining = max(0, expected_pages - done_pages) / rate
+            parts.append(f"ETA {int(remaining // 60)}:{int(remaining % 60):02d}")
+        if latencies:
+            parts.append(f"API {sum(latencies) / len(latencies):.1f}s/request")
+        self.msg_queue.put(("stats", "  |  ".join(parts)))
 
 if __name__ == "__main__":
+    # Worker processes of frozen (PyInstaller) builds start through this script
+    multiprocessing.freeze_support()
     app = PDF2PPTXApp()
     app.mainloop()
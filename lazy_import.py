@@ -0,0 +1,39 @@
+"""
+Deferred imports for heavy dependencies.
+
+`fitz = lazy_module("fitz")` binds a stand-in that imports the module the
+first time one of its attributes is used, so `--help`, argument errors and
+the GUI window do not pay for PyMuPDF, NumPy or the Gemini SDK, and each run
+only loads what its code path touches. Attributes are cached on the
+stand-in after the first lookup, so hot loops cost no more than with a
+regular import.
+"""
+import importlib
+import sys
+
+
+class LazyModule:
+    def __init__(self, name):
+        self.__dict__["_name"] = name
+
+    def _load(self):
+        return importlib.import_module(self._name)
+
+    def __getattr__(self, attr):
+        value = getattr(self._load(), attr)
+        self.__dict__[attr] = value
+        return value
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+        self.__dict__[attr] = value
+
+    def __repr__(self):
+        state = "loaded" if self._name in sys.modules else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+def lazy_module(name):
+    """The module itself if something already imported it, otherwise a LazyModule."""
+    module = sys.modules.get(name)
+    return module if module is not None else LazyModule(name)
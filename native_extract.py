@@ -0,0 +1,155 @@
+"""
+Layout extraction from the PDF's own text layer, without calling the model.
+
+NativeAnalyzer produces the same {"text_blocks": [...], "image_regions": [...]}
+dict as GeminiAnalyzer.analyze_page, with boxes normalized to 1000x1000 of the
+page, so PPTXBuilder.add_slide can use either result interchangeably.
+"""
+import statistics
+
+from lazy_import import lazy_module
+
+fitz = lazy_module("fitz")  # pymupdf
+
+# PyMuPDF span flags
+_FLAG_SERIF = 4
+_FLAG_BOLD = 16
+
+
+class NativeAnalyzer:
+    # A page needs at least this many non-space characters to count as having text
+    MIN_TEXT_CHARS = 20
+    # More than this share of unmappable glyphs means the text layer is garbage
+    MAX_BAD_GLYPH_RATIO = 0.1
+    # An image covering this share of the page means it is (probably) a scan
+    SCAN_COVERAGE = 0.5
+
+    def __init__(self, doc):
+        self.doc = doc
+
+    def has_text_layer(self, page_num):
+        """True if the page has real, visible text worth extracting instead of OCR."""
+        page = self.doc.load_page(page_num)
+        text = page.get_text("text")
+        chars = [c for c in text if not c.isspace()]
+        if len(chars) < self.MIN_TEXT_CHARS:
+            return False
+
+        bad = sum(1 for c in chars if c == "�")
+        if bad / len(chars) > self.MAX_BAD_GLYPH_RATIO:
+            return False
+
+        # Scanned pages with an OCR layer: the visible content is the image
+        page_area = abs(page.rect)
+        for info in page.get_image_info():
+            if abs(fitz.Rect(info["bbox"]) * page.rotation_matrix & page.rect) >= self.SCAN_COVERAGE * page_area:
+                return False
+
+        return True
+
+    def analyze_page(self, page_num):
+        """
+        Extracts the layout dict for a page from its text layer, images and
+        drawings. PyMuPDF reports those in unrotated page coordinates, so every
+        box is mapped through the page's rotation to match the rendered image.
+        """
+        page = self.doc.load_page(page_num)
+        rect = page.rect
+
+        def norm(r):
+            x0, y0, x1, y1 = r
+            return [
+                int(round((y0 - rect.y0) / rect.height * 1000)),
+                int(round((x0 - rect.x0) / rect.width * 1000)),
+                int(round((y1 - rect.y0) / rect.height * 1000)),
+                int(round((x1 - rect.x0) / rect.width * 1000)),
+            ]
+
+        text_blocks = []
+        text_rects = []
+        for block in page.get_text("dict", flags=fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES)["blocks"]:
+            if block.get("type") != 0:
+                continue
+
+            lines = []
+            spans = []
+            for line in block["lines"]:
+                line_text = "".join(span["text"] for span in line["spans"])
+                if line_text.strip():
+                    lines.append(line_text)
+                    spans.extend(s for s in line["spans"] if s["text"].strip())
+            if not spans:
+                continue
+
+            # The span carrying most of the text decides the block style
+            main = max(spans, key=lambda s: len(s["text"].strip()))
+            block_rect = fitz.Rect(block["bbox"]) * page.rotation_matrix
+            text_blocks.append({
+                "text": "\n".join(lines),
+                "box_2d": norm(block_rect),
+                "font_size_pt": round(main["size"], 1),
+                "font_color_hex": "#%06X" % (main["color"] & 0xFFFFFF),
+                "font_family": "serif" if main["flags"] & _FLAG_SERIF else "sans",
+                "is_bold": bool(main["flags"] & _FLAG_BOLD) or "bold" in main["font"].lower(),
+                "is_title": False,
+            })
+            text_rects.append(block_rect)
+
+        # Titles: clearly larger than the page's typical body size
+        if text_blocks:
+            body_size = statistics.median(b["font_size_pt"] for b in text_blocks)
+            for b in text_blocks:
+                b["is_title"] = b["font_size_pt"] >= body_size * 1.3
+
+        image_regions = [
+            {"box_2d": norm(r), "description": "image"}
+            for r in self._graphic_rects(page, text_rects)
+        ]
+
+        return {"text_blocks": text_blocks, "image_regions": image_regions}
+
+    def _graphic_rects(self, page, text_rects):
+        """Bounding boxes of embedded images and clustered vector drawings, in rotated page coordinates."""
+        rect = page.rect
+        page_area = abs(rect)
+        to_page = page.rotation_matrix
+
+        candidates = [fitz.Rect(info["bbox"]) * to_page & rect for info in page.get_image_info()]
+        if hasattr(page, "cluster_drawings"):
+            for r in page.cluster_drawings():
+                r = r * to_page & rect
+                # A plain panel behind a text block is a background, not a figure
+                if any(abs(t & r) >= 0.5 * abs(r) for t in text_rects):
+                    continue
+                candidates.append(r)
+
+        rects = []
+        for r in candidates:
+            if r.is_empty or r.width < 4 or r.height < 4:
+                continue  # separators and hairlines
+            if abs(r) < 0.001 * page_area or abs(r) > 0.9 * page_area:
+                continue  # specks and full-page backgrounds
+            rects.append(r)
+
+        return _merge_overlapping(rects)
+
+
+def _merge_overlapping(rects):
+    """Unions rectangles that intersect until none overlap."""
+    rects = [fitz.Rect(r) for r in rects]
+    merged = True
+    while merged:
+        merged = False
+        out = []
+        while rects:
+            r = rects.pop()
+            for i, other in enumerate(out):
+                if r.intersects(other):
+                    out[i] = other | r
+                    merged = True
+                    break
+            else:
+                out.append(r)
+        rects = out
+    rects.sort(key=lambda r: (r.y0, r.x0))
+    return rects
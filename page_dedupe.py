@@ -0,0 +1,76 @@
+"""
+Near-duplicate page detection, so repeated pages reuse one layout analysis.
+
+Each rendered page gets a 256-bit difference hash (dHash) for fast candidate
+lookup, a small grayscale thumbnail for verification and a content key. A
+page only reuses an earlier result when the hashes are within `threshold`
+bits, no thumbnail pixel differs by more than `pixel_tolerance` AND the
+content keys are equal. The thumbnail is far too coarse to see a changed
+digit in body text ("Qty 18" vs "Qty 19"), so the content key is the exact
+text layer when the page has one and otherwise a hash of the full-resolution
+render: pages whose text differs in a single character are always analyzed
+separately.
+"""
+import hashlib
+import threading
+
+from lazy_import import lazy_module
+
+np = lazy_module("numpy")
+Image = lazy_module("PIL.Image")
+
+
+class PageHashIndex:
+    HASH_SIZE = 16      # 16x16 gradient bits = 256-bit hash
+    THUMB_EDGE = 256    # Long edge of the verification thumbnail; small text must still register
+
+    def __init__(self, threshold=6, pixel_tolerance=24, max_entries=None):
+        self.threshold = threshold
+        self.pixel_tolerance = pixel_tolerance
+        self.max_entries = max_entries  # oldest pages are forgotten beyond this (None = keep all)
+        self._entries = []  # (hash, thumb, aspect, content, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+
+    def signature(self, pixels, text=None):
+        """
+        (hash, thumbnail, aspect, content key) for an RGB uint8 array of shape
+        (h, w, 3) and the page's text layer (None or empty: no text layer).
+        """
+        h, w = pixels.shape[:2]
+        gray = Image.fromarray(pixels).convert("L")
+
+        small = np.asarray(gray.resize((self.HASH_SIZE + 1, self.HASH_SIZE), Image.BOX), dtype=np.int16)
+        bits = (small[:, 1:] > small[:, :-1]).ravel()
+        page_hash = int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+        scale = self.THUMB_EDGE / max(w, h)
+        thumb_size = (max(1, round(w * scale)), max(1, round(h * scale)))
+        thumb = np.asarray(gray.resize(thumb_size, Image.BOX), dtype=np.uint8)
+
+        if text and text.strip():
+            content = hashlib.sha256(b"text:" + " ".join(text.split()).encode("utf-8")).digest()
+        else:
+            content = hashlib.sha256(f"render:{w}x{h}:".encode("ascii") + np.ascontiguousarray(pixels).tobytes()).digest()
+        return page_hash, thumb, w / h, content
+
+    def find(self, signature):
+        """Returns the value stored for a near-duplicate page, or None."""
+        page_hash, thumb, aspect, content = signature
+        with self._lock:
+            for other_hash, other_thumb, other_aspect, other_content, value in self._entries:
+                if content != other_content or (page_hash ^ other_hash).bit_count() > self.threshold:
+                    continue
+                if thumb.shape != other_thumb.shape or abs(aspect - other_aspect) > 0.01 * aspect:
+                    continue
+                if np.abs(thumb.astype(np.int16) - other_thumb).max() > self.pixel_tolerance:
+                    continue
+                self.hits += 1
+                return value
+        return None
+
+    def add(self, signature, value):
+        with self._lock:
+            self._entries.append((*signature, value))
+            if self.max_entries is not None and len(self._entries) > self.max_entries:
+                del self._entries[0]
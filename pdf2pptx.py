@@ -1,136 +1,1123 @@
 
 import argparse
 import os
+import sys
 import io
-import fitz  # pymupdf
-from PIL import Image
-from pptx import Presentation
-from pptx.util import Inches, Pt
-from google import genai
-from google.genai import types
 import json
 import base64
-from dotenv import load_dotenv
+import hashlib
+import posixpath
+import re
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 
-load_dotenv()
+from lazy_import import lazy_module
+from native_extract import NativeAnalyzer
+from page_dedupe import PageHashIndex
+from profiling import NULL_PROFILER, StageProfiler, hotspot_profiler, peak_rss_mb
+from rate_limit import RequestScheduler, RetryableError
+from replay import RecordingAnalyzer, ReplayAnalyzer
 
+# Heavy dependencies load on first use; python-pptx is imported inside PPTXBuilder
+fitz = lazy_module("fitz")  # pymupdf
+np = lazy_module("numpy")
+Image = lazy_module("PIL.Image")
+etree = lazy_module("lxml.etree")
+httpx = lazy_module("httpx")
+genai = lazy_module("google.genai")
+types = lazy_module("google.genai.types")
+genai_errors = lazy_module("google.genai.errors")
+
+_OPC_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+_OPC_CT_NS = "http://schemas.openxmlformats.org/package/2006/content-types"
+
+class PageRender:
+    """
+    A rendered page that is encoded once and shared by every consumer.
+
+    `data` is the encoded buffer (PNG unless rendered for analysis as JPEG)
+    uploaded to the model and embedded as the text_focus background. `pixels`
+    is a NumPy view of the raw pixmap samples and `image` a PIL image over the
+    same memory; neither decodes the encoded buffer, and the PIL image is only
+    created when something needs to crop.
+
+    A render created with a fitz page and no pixmap is lazy: crop() renders
+    just the requested region at `zoom`, and the full page is only rendered if
+    data, pixels or image are accessed. Lazy renders must only be used on the
+    thread that owns the document.
+
+    Upload-only renders call release_pixels() once `data` is encoded, so a
+    queued request holds just the encoded buffer; pixels and image then
+    decode it again if anything still asks for them.
+    """
+    def __init__(self, pix=None, image=None, data=None, mime_type="image/png", page=None, zoom=1.0, size=None):
+        self._pix = pix
+        self._image = image
+        self._data = data
+        self.mime_type = mime_type
+        self._page = page
+        self.zoom = zoom
+        self._sample_bytes = None
+        if pix is not None:
+            self.size = (pix.width, pix.height)
+        elif image is not None:
+            self.size = image.size
+        elif size is not None:
+            # Encoded buffer only, e.g. received from another process
+            self.size = tuple(size)
+        else:
+            irect = (page.rect * fitz.Matrix(zoom, zoom)).irect
+            self.size = (irect.width, irect.height)
+
+    @classmethod
+    def from_pixmap(cls, pix, fmt="png", quality=85):
+        # Encode on the rendering thread; fitz objects must not be touched from workers
+        if fmt == "jpeg":
+            # Pillow's encoder is several times faster than pix.tobytes("jpg")
+            render = cls(pix=pix, mime_type="image/jpeg")
+            image = render.image if pix.n != 4 else render.image.convert("RGB")
+            stream = io.BytesIO()
+            image.save(stream, format="JPEG", quality=quality)
+            render._data = stream.getvalue()
+            return render
+        return cls(pix=pix, data=pix.tobytes("png"))
+
+    @classmethod
+    def wrap(cls, image):
+        """Accepts a PageRender or a PIL Image."""
+        return image if isinstance(image, cls) else cls(image=image)
+
+    @property
+    def width(self):
+        return self.size[0]
+
+    @property
+    def height(self):
+        return self.size[1]
+
+    def _ensure_pixmap(self):
+        if self._pix is None and self._image is None:
+            if self._page is not None:
+                self._pix = self._page.get_pixmap(matrix=fitz.Matrix(self.zoom, self.zoom))
+            else:
+                self._image = Image.open(io.BytesIO(self._data))
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._ensure_pixmap()
+            if self._pix is not None:
+                self._data = self._pix.tobytes("png")
+            else:
+                stream = io.BytesIO()
+                self._image.save(stream, format="PNG")
+                self._data = stream.getvalue()
+            self.mime_type = "image/png"
+        return self._data
+
+    @property
+    def png(self):
+        """The encoded buffer if it is a PNG, otherwise a freshly encoded PNG."""
+        if self.mime_type == "image/png":
+            return self.data
+        stream = io.BytesIO()
+        self.image.save(stream, format="PNG")
+        return stream.getvalue()
+
+    def _samples(self):
+        # One copy of the raw samples that the array and image views keep alive.
+        # (pix.samples_mv would avoid the copy but dangles once the pixmap is freed.)
+        if self._sample_bytes is None:
+            self._sample_bytes = self._pix.samples
+        return self._sample_bytes
+
+    @property
+    def pixels(self):
+        """RGB uint8 array of shape (height, width, 3)."""
+        self._ensure_pixmap()
+        if self._pix is not None and self._pix.n == 3:
+            w, h = self.size
+            raw = np.frombuffer(self._samples(), dtype=np.uint8).reshape(h, self._pix.stride)
+            return raw[:, :w * 3].reshape(h, w, 3)
+        return np.asarray(self.image.convert("RGB"))
+
+    @property
+    def image(self):
+        if self._image is None:
+            self._ensure_pixmap()
+        if self._image is None:
+            pix = self._pix
+            mode = {1: "L", 3: "RGB", 4: "RGBA"}[pix.n]
+            self._image = Image.frombuffer(mode, self.size, self._samples(), "raw", mode, pix.stride, 1)
+        return self._image
+
+    def release_pixels(self):
+        """Drops the pixmap and its views, keeping only the encoded buffer."""
+        self.data
+        self._pix = None
+        self._image = None
+        self._sample_bytes = None
+
+    def release(self):
+        """Drops the pixmap and every buffer derived from it once the page is done."""
+        self._pix = None
+        self._image = None
+        self._data = None
+        self._sample_bytes = None
+        self._page = None
+
+    def crop(self, box):
+        """Returns a PIL Image of the pixel box (left, top, right, bottom)."""
+        if self._pix is None and self._image is None:
+            left, top, right, bottom = box
+            origin = self._page.rect
+            clip = fitz.Rect(
+                origin.x0 + left / self.zoom, origin.y0 + top / self.zoom,
+                origin.x0 + right / self.zoom, origin.y0 + bottom / self.zoom,
+            )
+            pix = self._page.get_pixmap(matrix=fitz.Matrix(self.zoom, self.zoom), clip=clip)
+            return PageRender(pix=pix).image
+        return self.image.crop(box)
+
+
+class ConversionCancelled(Exception):
+    """A conversion stopped through its cancel_event; the journal is kept for resuming."""
+
+
+class PageSelectionError(ValueError):
+    pass
+
+
+class AnalyzerRequiredError(RuntimeError):
+    """Some selected pages can only be analyzed by the model, and no analyzer is configured."""
+
+
+def parse_page_spec(spec):
+    """
+    Parses a page selection like "1-10,25,40-" or "-5" (1-based, inclusive)
+    into a list of (first, last) pairs; last is None for an open range.
+    Raises PageSelectionError on malformed input.
+    """
+    ranges = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        first, sep, last = item.partition("-")
+        try:
+            first = int(first) if first.strip() else 1
+            last = (int(last) if last.strip() else None) if sep else first
+        except ValueError:
+            raise PageSelectionError(f"Invalid page range: {item!r}")
+        if first < 1 or (last is not None and last < first):
+            raise PageSelectionError(f"Invalid page range: {item!r}")
+        ranges.append((first, last))
+    if not ranges:
+        raise PageSelectionError("Empty page selection")
+    return ranges
+
+
+def parse_page_ranges(spec, page_count):
+    """
+    0-based page numbers selected by `spec` (see parse_page_spec), sorted and
+    without duplicates. Pages past the end of the document are ignored; a
+    selection with no page inside the document raises PageSelectionError.
+    """
+    if not spec:
+        return list(range(page_count))
+    selected = set()
+    for first, last in parse_page_spec(spec):
+        last = page_count if last is None else min(last, page_count)
+        selected.update(range(first - 1, last))
+    if not selected:
+        raise PageSelectionError(f"Page selection {spec!r} is outside the document ({page_count} pages)")
+    return sorted(selected)
 
-from pptx.dml.color import RGBColor
 
 class DocumentProcessor:
-    def __init__(self, file_path):
+    def __init__(self, file_path, profiler=None):
         self.doc = fitz.open(file_path)
+        self.profiler = profiler or NULL_PROFILER
 
-    def get_page_image(self, page_num, zoom=2.0):
-        """Renders a PDF page to a PIL Image."""
+    def page_numbers(self, spec=None):
+        """0-based page numbers for a selection like "1-10,25,40-" (all pages if spec is empty)."""
+        return parse_page_ranges(spec, len(self.doc))
+
+    def render_page(self, page_num, zoom=2.0, lazy=False):
+        """
+        Renders a PDF page. Returns (PageRender, width_pt, height_pt).
+        With lazy=True nothing is rendered until a region is cropped.
+        """
         page = self.doc.load_page(page_num)
+        if lazy:
+            return PageRender(page=page, zoom=zoom), page.rect.width, page.rect.height
         mat = fitz.Matrix(zoom, zoom)
-        pix = page.get_pixmap(matrix=mat)
-        img_data = pix.tobytes("png")
-        return Image.open(io.BytesIO(img_data)), page.rect.width, page.rect.height
+        with self.profiler.stage("render", page=page_num):
+            pix = page.get_pixmap(matrix=mat)
+        with self.profiler.stage("encode", page=page_num) as counters:
+            render = PageRender.from_pixmap(pix)
+            counters["bytes"] = len(render.data)
+        return render, page.rect.width, page.rect.height
+
+    def render_for_analysis(self, page_num, max_edge=1024, fmt="jpeg", quality=85):
+        """
+        Renders a page for upload with its long edge capped at max_edge pixels.
+        The model reports boxes in the page-relative 1000x1000 space, so results
+        apply unchanged to renders at any other resolution.
+        """
+        page = self.doc.load_page(page_num)
+        zoom = max_edge / max(page.rect.width, page.rect.height)
+        with self.profiler.stage("analysis_render", page=page_num):
+            pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+        with self.profiler.stage("analysis_encode", page=page_num) as counters:
+            render = PageRender.from_pixmap(pix, fmt=fmt, quality=quality)
+            counters["bytes"] = len(render.data)
+        return render
+
+    def fingerprint(self, page_num):
+        """
+        SHA-256 of the page rendered at 72 DPI. Pages that look the same get
+        the same layout, however the PDF was regenerated (new font subsets,
+        rewritten content streams, moved pages).
+        """
+        page = self.doc.load_page(page_num)
+        with self.profiler.stage("fingerprint", page=page_num):
+            pix = page.get_pixmap(alpha=False)
+            h = hashlib.sha256(f"{pix.width}x{pix.height}:".encode("ascii"))
+            h.update(pix.samples)
+        return h.hexdigest()
+
+    def page_text(self, page_num):
+        """The page's text layer as plain text ("" for scans and images)."""
+        return self.doc.load_page(page_num).get_text()
+
+    def page_size(self, page_num):
+        """(width_pt, height_pt) without rendering."""
+        rect = self.doc.load_page(page_num).rect
+        return rect.width, rect.height
+
+    def render_tile(self, page_num, tile, zoom=2.0, max_edge=None, fmt="png", quality=85):
+        """
+        Renders the (x0, y0, x1, y1) point rectangle of a page for upload,
+        at `zoom` or with its long edge capped at max_edge pixels.
+        """
+        page = self.doc.load_page(page_num)
+        x0, y0, x1, y1 = tile
+        if max_edge:
+            zoom = max_edge / max(x1 - x0, y1 - y0)
+        origin = page.rect
+        clip = fitz.Rect(origin.x0 + x0, origin.y0 + y0, origin.x0 + x1, origin.y0 + y1)
+        with self.profiler.stage("analysis_render", page=page_num):
+            pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=clip)
+        with self.profiler.stage("analysis_encode", page=page_num) as counters:
+            render = PageRender.from_pixmap(pix, fmt=fmt, quality=quality)
+            counters["bytes"] = len(render.data)
+        render.release_pixels()
+        return render
+
+    def get_page_image(self, page_num, zoom=2.0):
+        """Renders a PDF page to a PIL Image."""
+        render, w, h = self.render_page(page_num, zoom)
+        return render.image, w, h
 
     def close(self):
         self.doc.close()
 
+LAYOUT_PROMPT = """
+Analyze this document page image. I want to convert this into an editable PowerPoint slide.
+Identify two types of elements:
+1. "text_blocks": Select all visible text. Group related text (like paragraphs) together. 
+   CRITICAL: The bounding box must be TIGHT around the text content. Do not include excessive empty space.
+   For each block, provide:
+   - "text": The actual text content.
+   - "box_2d": The bounding box [ymin, xmin, ymax, xmax] normalized to 1000x1000.
+   - "font_size_pt": Estimate the font size in points (approximate).
+   - "font_color_hex": Estimate the font color in hex format (e.g. #000000).
+   - "font_family": Enum "sans" (like Arial, Gothic) or "serif" (like Times, Mincho).
+   - "is_bold": Boolean, true if the text is bold.
+   - "is_title": Boolean, true if it looks like a title/heading.
+
+2. "image_regions": Identify non-text graphical elements (figures, diagrams, photos, icons, complex background shapes that generally shouldn't be executed as editable text). Do NOT include simple background colors or simple separators if possible, but do include main visual content.
+   - "box_2d": The bounding box [ymin, xmin, ymax, xmax] normalized to 1000x1000.
+   - "description": Short description of the image.
+   
+Output strictly JSON format.
+"""
+
+BATCH_PROMPT_HEADER = """
+You are given {count} document page images, in order. Each image is preceded by a label "Page N".
+Analyze every page independently as described below. Return a "pages" array with exactly one entry
+per page, where "page_index" is the page's N and "text_blocks" / "image_regions" describe that page only.
+"""
+
+# Same task in a compact wire format: short keys, one style table per page
+# and flag codes, so dense pages need far fewer output tokens.
+# decode_compact_layout expands it into the usual layout dict.
+COMPACT_LAYOUT_PROMPT = """
+Analyze this document page image. I want to convert this into an editable PowerPoint slide.
+Identify two types of elements:
+1. Text blocks: Select all visible text. Group related text (like paragraphs) together.
+   CRITICAL: The bounding box must be TIGHT around the text content. Do not include excessive empty space.
+2. Image regions: Identify non-text graphical elements (figures, diagrams, photos, icons, complex background shapes that generally shouldn't be executed as editable text). Do NOT include simple background colors or simple separators if possible, but do include main visual content.
+
+All boxes are [ymin, xmin, ymax, xmax] normalized to 1000x1000.
+Answer in this compact JSON format:
+- "s": style table, one entry per distinct text style on the page:
+  - "z": estimated font size in points (approximate).
+  - "c": font color as 6 hex digits without "#" (e.g. 000000).
+  - "f": flags, the sum of 1 if bold, 2 if serif (like Times, Mincho; otherwise sans like Arial, Gothic), 4 if it looks like a title/heading.
+- "t": text blocks, each with "b": bounding box, "s": index into the style table, "x": the actual text content.
+- "i": image regions, each just its bounding box.
+
+Output strictly JSON format.
+"""
+
+COMPACT_BATCH_PROMPT_HEADER = """
+You are given {count} document page images, in order. Each image is preceded by a label "Page N".
+Analyze every page independently as described below. Return a "pages" array with exactly one entry
+per page, where "page_index" is the page's N and "s" / "t" / "i" describe that page only.
+"""
+
+RESPONSE_FORMATS = ("verbose", "compact")
+
+# Compact style flags
+STYLE_BOLD = 1
+STYLE_SERIF = 2
+STYLE_TITLE = 4
+
+DEFAULT_MODEL = 'gemini-3-flash-preview'
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "pdf2pptx")
+
+
+# Response schemas are plain dicts in the JSON form of types.Schema, so the
+# cache key (schema_json) needs no SDK import. Keys follow the SDK's field
+# order ("items" and "properties" before "type") to keep existing keys valid.
+BOX_SCHEMA = {"items": {"type": "INTEGER"}, "type": "ARRAY"}
+
+
+def schema_json(schema):
+    """Serialization of a schema dict, identical to types.Schema.model_dump_json(exclude_none=True)."""
+    return json.dumps(schema, separators=(",", ":"))
+
+
+def build_layout_schema():
+    """Response schema for the text_blocks / image_regions layout dict."""
+    return {
+        "properties": {
+            "text_blocks": {
+                "items": {
+                    "properties": {
+                        "text": {"type": "STRING"},
+                        "box_2d": BOX_SCHEMA,
+                        "font_size_pt": {"type": "NUMBER"},
+                        "font_color_hex": {"type": "STRING"},
+                        "font_family": {"type": "STRING"},
+                        "is_bold": {"type": "BOOLEAN"},
+                        "is_title": {"type": "BOOLEAN"},
+                    },
+                    "type": "OBJECT",
+                },
+                "type": "ARRAY",
+            },
+            "image_regions": {
+                "items": {
+                    "properties": {
+                        "box_2d": BOX_SCHEMA,
+                        "description": {"type": "STRING"},
+                    },
+                    "type": "OBJECT",
+                },
+                "type": "ARRAY",
+            },
+        },
+        "type": "OBJECT",
+    }
+
+
+def build_batch_schema():
+    """Response schema wrapping one layout dict per page in a "pages" array."""
+    page = build_layout_schema()
+    page["properties"]["page_index"] = {"type": "INTEGER"}
+    return {"properties": {"pages": {"items": page, "type": "ARRAY"}}, "type": "OBJECT"}
+
+
+def build_compact_layout_schema():
+    """Response schema for the compact format described in COMPACT_LAYOUT_PROMPT."""
+    return {
+        "properties": {
+            "s": {
+                "items": {
+                    "properties": {
+                        "z": {"type": "NUMBER"},
+                        "c": {"type": "STRING"},
+                        "f": {"type": "INTEGER"},
+                    },
+                    "type": "OBJECT",
+                },
+                "type": "ARRAY",
+            },
+            "t": {
+                "items": {
+                    "properties": {
+                        "b": BOX_SCHEMA,
+                        "s": {"type": "INTEGER"},
+                        "x": {"type": "STRING"},
+                    },
+                    "type": "OBJECT",
+                },
+                "type": "ARRAY",
+            },
+            "i": {"items": BOX_SCHEMA, "type": "ARRAY"},
+        },
+        "type": "OBJECT",
+    }
+
+
+def build_compact_batch_schema():
+    page = build_compact_layout_schema()
+    page["properties"]["page_index"] = {"type": "INTEGER"}
+    return {"properties": {"pages": {"items": page, "type": "ARRAY"}}, "type": "OBJECT"}
+
+
+def decode_compact_layout(data):
+    """
+    Expands a compact response into the text_blocks / image_regions layout
+    dict. Blocks whose style index is missing or out of range keep the
+    builder's default style. Returns None if the structure is malformed.
+    """
+    if not isinstance(data, dict):
+        return None
+    styles, blocks, regions = data.get("s", []), data.get("t", []), data.get("i", [])
+    if not isinstance(styles, list) or not isinstance(blocks, list) or not isinstance(regions, list):
+        return None
+
+    expanded = []
+    for style in styles:
+        if not isinstance(style, dict):
+            return None
+        flags = style.get("f") if isinstance(style.get("f"), int) else 0
+        fields = {
+            "font_family": "serif" if flags & STYLE_SERIF else "sans",
+            "is_bold": bool(flags & STYLE_BOLD),
+            "is_title": bool(flags & STYLE_TITLE),
+        }
+        # Leave out missing size/color so the builder's defaults apply
+        if isinstance(style.get("z"), (int, float)):
+            fields["font_size_pt"] = style["z"]
+        if isinstance(style.get("c"), str):
+            fields["font_color_hex"] = "#" + style["c"].lstrip("#")
+        expanded.append(fields)
+
+    text_blocks = []
+    for block in blocks:
+        if not isinstance(block, dict):
+            return None
+        text_block = {"text": block.get("x", ""), "box_2d": block.get("b")}
+        index = block.get("s")
+        if isinstance(index, int) and 0 <= index < len(expanded):
+            text_block.update(expanded[index])
+        text_blocks.append(text_block)
+
+    return {"text_blocks": text_blocks, "image_regions": [{"box_2d": box} for box in regions]}
+
+
+def encode_compact_layout(layout_data):
+    """The compact form of a layout dict (inverse of decode_compact_layout, minus image descriptions)."""
+    styles = {}
+    blocks = []
+    for block in layout_data.get("text_blocks", []):
+        flags = ((STYLE_BOLD if block.get("is_bold") else 0)
+                 | (STYLE_SERIF if block.get("font_family") == "serif" else 0)
+                 | (STYLE_TITLE if block.get("is_title") else 0))
+        color = block.get("font_color_hex")
+        key = (block.get("font_size_pt"), color.lstrip("#") if isinstance(color, str) else None, flags)
+        blocks.append({"b": block["box_2d"], "s": styles.setdefault(key, len(styles)), "x": block.get("text", "")})
+    return {
+        "s": [{k: v for k, v in (("z", size), ("c", color), ("f", flags)) if v is not None}
+              for size, color, flags in styles],
+        "t": blocks,
+        "i": [region["box_2d"] for region in layout_data.get("image_regions", [])],
+    }
+
+
+def is_valid_layout(layout_data):
+    """Checks that a layout dict has the structure PPTXBuilder.add_slide relies on."""
+    if not isinstance(layout_data, dict):
+        return False
+    for key in ("text_blocks", "image_regions"):
+        items = layout_data.get(key, [])
+        if not isinstance(items, list):
+            return False
+        for item in items:
+            if not isinstance(item, dict):
+                return False
+            box = item.get("box_2d")
+            if not isinstance(box, list) or len(box) != 4 or not all(isinstance(v, (int, float)) for v in box):
+                return False
+    return True
+
+
+class LayoutCache:
+    """
+    Content-addressed on-disk cache for layout results.
+
+    Entries are keyed by a hash of the uploaded image bytes, prompt, schema
+    and model name, so a cached result is only reused when the model would
+    have seen exactly the same request. The directory is kept under
+    `max_bytes` by evicting the least recently used entries.
+
+    The total size is tracked in memory, seeded by one scan on the first
+    put, so writes do not walk the directory. Only when the limit is
+    exceeded is the tree scanned again, which also corrects the total for
+    entries written by other processes, and trimmed to EVICT_TO of the
+    limit so the next scan is some way off.
+    """
+    EVICT_TO = 0.9
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=512 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total = None
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(image_bytes, prompt, schema_json, model):
+        h = hashlib.sha256()
+        for part in (prompt.encode("utf-8"), schema_json.encode("utf-8"), model.encode("utf-8")):
+            h.update(len(part).to_bytes(8, "little"))
+            h.update(part)
+        h.update(image_bytes)
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        try:
+            # Mark as recently used
+            os.utime(path, None)
+        except OSError:
+            pass
+        return data
+
+    def put(self, key, data):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        size = os.path.getsize(tmp_path)
+        with self._lock:
+            if self._total is None:
+                self._total = sum(entry_size for _, entry_size, _ in self._scan())
+            try:
+                replaced = os.path.getsize(path)
+            except OSError:
+                replaced = 0
+            os.replace(tmp_path, path)
+            self._total += size - replaced
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def _scan(self):
+        """(mtime, size, path) of every entry on disk."""
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def _evict(self):
+        # Called with the lock held
+        entries = self._scan()
+        total = sum(size for _, size, _ in entries)
+        if total > self.max_bytes:
+            target = self.max_bytes * self.EVICT_TO
+            entries.sort()
+            for _, size, path in entries:
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                if total <= target:
+                    break
+        self._total = total
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(api_key):
+    """One genai.Client per API key, shared by every analyzer and worker thread."""
+    with _clients_lock:
+        client = _clients.get(api_key)
+        if client is None:
+            client = _clients[api_key] = genai.Client(api_key=api_key)
+        return client
+
+
+def _is_throttle(e):
+    return isinstance(e, genai_errors.APIError) and e.code == 429
+
+
+def _is_transient(e):
+    if isinstance(e, genai_errors.APIError):
+        return e.code in (408, 409) or (e.code or 0) >= 500
+    return isinstance(e, (httpx.TransportError, ConnectionError, TimeoutError))
+
+
+def estimate_tokens(prompt, pages):
+    """Rough input token count: ~4 characters per text token, 258 tokens per 768px image tile."""
+    tokens = len(prompt) // 4
+    for page in pages:
+        w, h = page.size
+        if w <= 384 and h <= 384:
+            tokens += 258
+        else:
+            tokens += 258 * (-(-w // 768)) * (-(-h // 768))
+    return tokens
+
+
 class GeminiAnalyzer:
-    def __init__(self, api_key):
-        self.client = genai.Client(api_key=api_key)
+    """
+    Layout analysis with Gemini. response_format "compact" asks for the
+    short wire format of COMPACT_LAYOUT_PROMPT instead of the verbose
+    layout dict; results are decoded to the same dict either way.
+    """
+    def __init__(self, api_key, model=DEFAULT_MODEL, cache=None, scheduler=None, profiler=None, response_format="verbose"):
+        if response_format not in RESPONSE_FORMATS:
+            raise ValueError(f"Unknown response format: {response_format}")
+        self.api_key = api_key
+        self.model = model
+        self.cache = cache
+        self.scheduler = scheduler or RequestScheduler()
+        self.profiler = profiler or NULL_PROFILER
+        self.response_format = response_format
+        if response_format == "compact":
+            self.prompt, self.batch_header = COMPACT_LAYOUT_PROMPT, COMPACT_BATCH_PROMPT_HEADER
+            self.schema, self.batch_schema = build_compact_layout_schema(), build_compact_batch_schema()
+        else:
+            self.prompt, self.batch_header = LAYOUT_PROMPT, BATCH_PROMPT_HEADER
+            self.schema, self.batch_schema = build_layout_schema(), build_batch_schema()
+        self.schema_json = schema_json(self.schema)
+        self.batch_schema_json = schema_json(self.batch_schema)
+        self._sdk_schemas = {}
 
-    def analyze_page(self, image):
-        """Analyzes the image using Gemini to identify text and figures."""
-        
-        # Convert PIL Image to bytes
-        img_byte_arr = io.BytesIO()
-        image.save(img_byte_arr, format='PNG')
-        img_byte_arr = img_byte_arr.getvalue()
-
-        prompt = """
-        Analyze this document page image. I want to convert this into an editable PowerPoint slide.
-        Identify two types of elements:
-        1. "text_blocks": Select all visible text. Group related text (like paragraphs) together. 
-           CRITICAL: The bounding box must be TIGHT around the text content. Do not include excessive empty space.
-           For each block, provide:
-           - "text": The actual text content.
-           - "box_2d": The bounding box [ymin, xmin, ymax, xmax] normalized to 1000x1000.
-           - "font_size_pt": Estimate the font size in points (approximate).
-           - "font_color_hex": Estimate the font color in hex format (e.g. #000000).
-           - "font_family": Enum "sans" (like Arial, Gothic) or "serif" (like Times, Mincho).
-           - "is_bold": Boolean, true if the text is bold.
-           - "is_title": Boolean, true if it looks like a title/heading.
-        
-        2. "image_regions": Identify non-text graphical elements (figures, diagrams, photos, icons, complex background shapes that generally shouldn't be executed as editable text). Do NOT include simple background colors or simple separators if possible, but do include main visual content.
-           - "box_2d": The bounding box [ymin, xmin, ymax, xmax] normalized to 1000x1000.
-           - "description": Short description of the image.
-           
-        Output strictly JSON format.
+    @property
+    def client(self):
+        # Created on the first request, so cache hits never load the SDK
+        return get_client(self.api_key)
+
+    def _sdk_schema(self, schema):
+        """types.Schema for one of this analyzer's schema dicts, converted once."""
+        sdk_schema = self._sdk_schemas.get(id(schema))
+        if sdk_schema is None:
+            sdk_schema = self._sdk_schemas[id(schema)] = types.Schema.model_validate(schema)
+        return sdk_schema
+
+    def _decode(self, data):
+        """Layout dict from one page of a response, or None if it is not usable."""
+        if self.response_format == "compact":
+            layout_data = decode_compact_layout(data)
+        elif isinstance(data, dict):
+            layout_data = {"text_blocks": data.get("text_blocks", []), "image_regions": data.get("image_regions", [])}
+        else:
+            layout_data = None
+        return layout_data if is_valid_layout(layout_data) else None
+
+    def _generate(self, parts, schema, estimated_tokens, validate=None):
+        """
+        Sends one request through the scheduler and returns the parsed JSON.
+        Unparseable or invalid responses are retried like transient errors.
         """
+        upload_bytes = sum(len(part.inline_data.data) for part in parts if part.inline_data is not None)
 
-        response = self.client.models.generate_content(
-            model='gemini-3-flash-preview',
-            contents=[
-                types.Content(
-                    role="user",
-                    parts=[
-                        types.Part.from_text(text=prompt),
-                        types.Part.from_bytes(data=img_byte_arr, mime_type="image/png")
-                    ]
+        def attempt():
+            with self.profiler.stage("gemini_request", upload_bytes=upload_bytes) as counters:
+                response = self.client.models.generate_content(
+                    model=self.model,
+                    contents=[types.Content(role="user", parts=parts)],
+                    config=types.GenerateContentConfig(
+                        response_mime_type="application/json",
+                        response_schema=self._sdk_schema(schema),
+                    )
                 )
-            ],
-            config=types.GenerateContentConfig(
-                response_mime_type="application/json",
-                response_schema=types.Schema(
-                    type=types.Type.OBJECT,
-                    properties={
-                        "text_blocks": types.Schema(
-                            type=types.Type.ARRAY,
-                            items=types.Schema(
-                                type=types.Type.OBJECT,
-                                properties={
-                                    "text": types.Schema(type=types.Type.STRING),
-                                    "box_2d": types.Schema(
-                                        type=types.Type.ARRAY,
-                                        items=types.Schema(type=types.Type.INTEGER)
-                                    ),
-                                    "font_size_pt": types.Schema(type=types.Type.NUMBER),
-                                    "font_color_hex": types.Schema(type=types.Type.STRING),
-                                    "font_family": types.Schema(type=types.Type.STRING),
-                                    "is_bold": types.Schema(type=types.Type.BOOLEAN),
-                                    "is_title": types.Schema(type=types.Type.BOOLEAN),
-                                },
-                            ),
-                        ),
-                        "image_regions": types.Schema(
-                            type=types.Type.ARRAY,
-                            items=types.Schema(
-                                type=types.Type.OBJECT,
-                                properties={
-                                    "box_2d": types.Schema(
-                                        type=types.Type.ARRAY,
-                                        items=types.Schema(type=types.Type.INTEGER)
-                                    ),
-                                    "description": types.Schema(type=types.Type.STRING),
-                                },
-                            ),
-                        ),
-                    },
-                ),
-            )
-        )
+                usage = getattr(response, "usage_metadata", None)
+                counters["prompt_tokens"] = getattr(usage, "prompt_token_count", None) or 0
+                counters["response_tokens"] = getattr(usage, "candidates_token_count", None) or 0
+            self.scheduler.record_tokens(estimated_tokens, getattr(usage, "prompt_token_count", None))
+
+            try:
+                 # Depending on SDK version, response.text might be the JSON string
+                data = json.loads(response.text)
+            except Exception as e:
+                raise RetryableError(f"Error parsing Gemini response: {e}")
+            if validate is not None and not validate(data):
+                raise RetryableError("Gemini response does not match the layout schema")
+            return data
+
+        return self.scheduler.call(attempt, estimated_tokens, is_throttle=_is_throttle, is_retryable=_is_transient)
+
+    def analyze_page(self, image):
+        """Analyzes the image (PageRender or PIL Image) using Gemini to identify text and figures."""
         
+        # Reuse the page's encoded buffer as-is
+        page = PageRender.wrap(image)
+        img_byte_arr = page.data
+
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.make_key(img_byte_arr, self.prompt, self.schema_json, self.model)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        parts = [
+            types.Part.from_text(text=self.prompt),
+            types.Part.from_bytes(data=img_byte_arr, mime_type=page.mime_type)
+        ]
         try:
-             # Depending on SDK version, response.text might be the JSON string
-            return json.loads(response.text)
-        except Exception as e:
-            print(f"Error parsing Gemini response: {e}")
-            print(f"Raw response: {response.text}")
+            data = self._generate(parts, self.schema, estimate_tokens(self.prompt, [page]),
+                                  validate=lambda data: self._decode(data) is not None)
+            layout_data = self._decode(data)
+        except RetryableError as e:
+            # API errors propagate; only a persistently malformed answer gets here
+            print(f"Warning: {e}. Giving up after {self.scheduler.max_retries} retries; the slide will have no editable content.")
             return {"text_blocks": [], "image_regions": []}
 
+        if cache_key is not None:
+            try:
+                self.cache.put(cache_key, layout_data)
+            except OSError as e:
+                print(f"Failed to write layout cache: {e}")
+        return layout_data
+
+    def analyze_pages(self, images):
+        """
+        Analyzes several pages in a single request and returns one layout dict
+        per image, in order. Pages missing from the response or failing
+        validation are retried on their own with analyze_page.
+        """
+        if len(images) == 1:
+            return [self.analyze_page(images[0])]
+
+        pages = [PageRender.wrap(image) for image in images]
+        results = [None] * len(pages)
+        cache_keys = [None] * len(pages)
+
+        if self.cache is not None:
+            for i, page in enumerate(pages):
+                cache_keys[i] = self.cache.make_key(page.data, self.batch_header + self.prompt, self.batch_schema_json, self.model)
+                results[i] = self.cache.get(cache_keys[i])
+
+        todo = [i for i, layout in enumerate(results) if layout is None]
+        if not todo:
+            return results
+
+        prompt = self.batch_header.format(count=len(todo)) + self.prompt
+        parts = [types.Part.from_text(text=prompt)]
+        for n, i in enumerate(todo, 1):
+            parts.append(types.Part.from_text(text=f"Page {n}"))
+            parts.append(types.Part.from_bytes(data=pages[i].data, mime_type=pages[i].mime_type))
+
+        by_index = {}
+        try:
+            response_data = self._generate(
+                parts, self.batch_schema, estimate_tokens(prompt, [pages[i] for i in todo]),
+                validate=lambda data: isinstance(data, dict) and isinstance(data.get("pages"), list),
+            )
+            for entry in response_data["pages"]:
+                if not isinstance(entry, dict):
+                    continue
+                layout_data = self._decode(entry)
+                n = entry.get("page_index")
+                if isinstance(n, int) and 1 <= n <= len(todo) and n not in by_index and layout_data is not None:
+                    by_index[n] = layout_data
+        except RetryableError as e:
+            print(f"Error in batched Gemini response: {e}")
+
+        for n, i in enumerate(todo, 1):
+            layout_data = by_index.get(n)
+            if layout_data is None:
+                print(f"Batched response had no valid result for page {n} of {len(todo)}, retrying on its own")
+                results[i] = self.analyze_page(pages[i])
+                continue
+
+            results[i] = layout_data
+            if cache_keys[i] is not None:
+                try:
+                    self.cache.put(cache_keys[i], layout_data)
+                except OSError as e:
+                    print(f"Failed to write layout cache: {e}")
+
+        return results
+
+class ImageEncoder:
+    """
+    Encodes page backgrounds and cropped figures for embedding in slides.
+
+    fmt:
+      "png"     - lossless PNG (default, same as before)
+      "jpeg"    - JPEG at `quality`
+      "palette" - 8-bit palette PNG, good for flat graphics and line art
+      "auto"    - palette PNG for images with few colors, JPEG for photos
+    target_dpi: if set, images are downscaled so they do not exceed this
+                resolution at their size on the slide.
+
+    WebP is not offered: python-pptx cannot embed it as a picture.
+    """
+    FORMATS = ("png", "jpeg", "palette", "auto")
+
+    # A thumbnail with at most this many colors is treated as line art
+    FLAT_COLOR_LIMIT = 64
+
+    def __init__(self, fmt="png", quality=85, target_dpi=None):
+        if fmt not in self.FORMATS:
+            raise ValueError(f"Unknown image format: {fmt}")
+        self.fmt = fmt
+        self.quality = quality
+        self.target_dpi = target_dpi
+
+    def is_flat(self, image):
+        """True if the image looks like line art / flat graphics rather than a photo."""
+        thumb = image.convert("RGB")
+        thumb.thumbnail((128, 128))
+        return thumb.getcolors(maxcolors=self.FLAT_COLOR_LIMIT) is not None
+
+    def encode(self, image, width_emu=None, height_emu=None):
+        """
+        Returns a BytesIO with the encoded image, ready for add_picture.
+        image may be a PIL Image or a PageRender; a PageRender that needs no
+        re-encoding is passed through without copying its PNG buffer.
+        """
+        max_size = None
+        if self.target_dpi and width_emu and height_emu:
+            max_w = max(1, int(width_emu / 914400 * self.target_dpi))
+            max_h = max(1, int(height_emu / 914400 * self.target_dpi))
+            if image.width > max_w or image.height > max_h:
+                max_size = (max_w, max_h)
+
+        if isinstance(image, PageRender):
+            if self.fmt == "png" and max_size is None and image.mime_type == "image/png":
+                return io.BytesIO(image.data)
+            image = image.image
+
+        if max_size is not None:
+            image = image.copy()
+            image.thumbnail(max_size, Image.LANCZOS)
+
+        fmt = self.fmt
+        if fmt == "auto":
+            fmt = "palette" if self.is_flat(image) else "jpeg"
+
+        stream = io.BytesIO()
+        if fmt == "jpeg":
+            if image.mode in ("RGBA", "LA", "P"):
+                rgba = image.convert("RGBA")
+                image = Image.new("RGB", rgba.size, (255, 255, 255))
+                image.paste(rgba, mask=rgba.split()[3])
+            elif image.mode != "RGB":
+                image = image.convert("RGB")
+            image.save(stream, format="JPEG", quality=self.quality, optimize=True)
+        elif fmt == "palette":
+            if image.mode != "P":
+                image = image.convert("RGB").quantize(colors=256)
+            image.save(stream, format="PNG", optimize=True)
+        else:
+            image.save(stream, format="PNG")
+
+        stream.seek(0)
+        return stream
+
+
+# Shape XML for the bulk text path, identical to what python-pptx produces for
+# add_shape(RECTANGLE) + solid fill + no line + no shadow, and for add_textbox
+_MASK_SP_XML = (
+    '<p:sp><p:nvSpPr><p:cNvPr id="{id}" name="Rectangle {n}"/><p:cNvSpPr/><p:nvPr/></p:nvSpPr>'
+    '<p:spPr><a:xfrm><a:off x="{x}" y="{y}"/><a:ext cx="{cx}" cy="{cy}"/></a:xfrm>'
+    '<a:prstGeom prst="rect"><a:avLst/></a:prstGeom>'
+    '<a:solidFill><a:srgbClr val="{color}"/></a:solidFill><a:ln><a:noFill/></a:ln><a:effectLst/></p:spPr>'
+    '<p:style><a:lnRef idx="1"><a:schemeClr val="accent1"/></a:lnRef>'
+    '<a:fillRef idx="3"><a:schemeClr val="accent1"/></a:fillRef>'
+    '<a:effectRef idx="2"><a:schemeClr val="accent1"/></a:effectRef>'
+    '<a:fontRef idx="minor"><a:schemeClr val="lt1"/></a:fontRef></p:style>'
+    '<p:txBody><a:bodyPr rtlCol="0" anchor="ctr"/><a:lstStyle/><a:p><a:pPr algn="ctr"/></a:p></p:txBody></p:sp>'
+)
+_TEXTBOX_SP_XML = (
+    '<p:sp><p:nvSpPr><p:cNvPr id="{id}" name="TextBox {n}"/><p:cNvSpPr txBox="1"/><p:nvPr/></p:nvSpPr>'
+    '<p:spPr><a:xfrm><a:off x="{x}" y="{y}"/><a:ext cx="{cx}" cy="{cy}"/></a:xfrm>'
+    '<a:prstGeom prst="rect"><a:avLst/></a:prstGeom><a:noFill/></p:spPr>'
+    '<p:txBody>{body_pr}<a:lstStyle/>{paragraphs}</p:txBody></p:sp>'
+)
+_BODY_PR_XML = {
+    "text_focus": '<a:bodyPr wrap="square" lIns="0" rIns="0" tIns="0" bIns="0"><a:spAutoFit/></a:bodyPr>',
+    "standard": '<a:bodyPr wrap="square"><a:spAutoFit/></a:bodyPr>',
+}
+_CTRL_CHARS = re.compile(r"([\x00-\x08\x0B-\x1F])")
+_LINE_BREAKS = re.compile("\n|\v")
+
+
+def _xml_text(text):
+    """Escapes run text the way python-pptx does (control characters as _xHHHH_)."""
+    text = _CTRL_CHARS.sub(lambda m: "_x%04X_" % ord(m.group(1)), text)
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def _hex_to_rgb(font_color_hex):
+    """(r, g, b) for "#RRGGBB", or None where the object-API path would skip the color."""
+    try:
+        if font_color_hex and font_color_hex.startswith("#"):
+            rgb = (int(font_color_hex[1:3], 16), int(font_color_hex[3:5], 16), int(font_color_hex[5:7], 16))
+            if all(0 <= v <= 255 for v in rgb):
+                return rgb
+    except:
+        pass
+    return None
+
+
+def normalized_boxes(items):
+    """(n, 4) float array of the [ymin, xmin, ymax, xmax] box_2d values of layout items."""
+    return np.array([item["box_2d"] for item in items], dtype=np.float64).reshape(-1, 4)
+
+
+def pixel_boxes(boxes, width, height):
+    """[left, top, right, bottom] pixel boxes for normalized boxes, clamped to the image."""
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    size = np.array([width, height, width, height], dtype=np.float64)
+    # Truncation toward zero, like int()
+    pixels = ((boxes[:, [1, 0, 3, 2]] / 1000.0) * size).astype(np.int64)
+    return np.clip(pixels, 0, size.astype(np.int64))
+
+
+def emu_boxes(boxes, scale_x, scale_y):
+    """[left, top, width, height] EMU for normalized boxes (scale = slide size / 1000)."""
+    return np.stack([
+        (boxes[:, 1] * scale_x).astype(np.int64),
+        (boxes[:, 0] * scale_y).astype(np.int64),
+        ((boxes[:, 3] - boxes[:, 1]) * scale_x).astype(np.int64),
+        ((boxes[:, 2] - boxes[:, 0]) * scale_y).astype(np.int64),
+    ], axis=1)
+
+
+def merge_overlapping_boxes(boxes):
+    """
+    Unions [ymin, xmin, ymax, xmax] boxes whose areas overlap until none do.
+    Each merged box takes the place of its first member.
+    """
+    boxes = np.array(boxes, dtype=np.float64).reshape(-1, 4)
+    alive = np.ones(len(boxes), dtype=bool)
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(boxes)):
+            if not alive[i]:
+                continue
+            box = boxes[i].copy()
+            overlap = (
+                alive
+                & (np.minimum(box[2], boxes[:, 2]) > np.maximum(box[0], boxes[:, 0]))
+                & (np.minimum(box[3], boxes[:, 3]) > np.maximum(box[1], boxes[:, 1]))
+            )
+            if overlap.sum() > 1:
+                members = np.flatnonzero(overlap)
+                first = members[0]
+                boxes[first, :2] = boxes[members, :2].min(axis=0)
+                boxes[first, 2:] = boxes[members, 2:].max(axis=0)
+                alive[members[1:]] = False
+                merged = True
+    return boxes[alive]
+
+
+class LayoutGeometry:
+    """
+    Array-backed geometry of one layout on one slide. Every conversion out of
+    the 1000x1000 box space is done here in batch:
+
+      text_boxes     normalized text block boxes, in layout order
+      text_emu       [left, top, width, height] EMU of the text boxes
+      mask_emu       the same for the text_focus masks (inflated, clamped to the page)
+      image_pixels   [left, top, right, bottom] crop boxes of the figure regions
+      image_emu      [left, top, width, height] EMU of the figure regions
+
+    Figure regions are clamped to the page, empty ones are dropped and
+    overlapping ones merged, so every picture is cropped and encoded once.
+    """
+    __slots__ = ("text_boxes", "text_emu", "mask_emu", "image_pixels", "image_emu")
+
+    # 5 units out of 1000, approx 0.5%
+    MASK_INFLATION = 5
+
+    def __init__(self, layout_data, slide_width, slide_height, image_size):
+        scale_x = slide_width / 1000.0
+        scale_y = slide_height / 1000.0
+        w, h = image_size
+
+        self.text_boxes = normalized_boxes(layout_data.get("text_blocks", []))
+        self.text_emu = emu_boxes(self.text_boxes, scale_x, scale_y)
+        masks = self.text_boxes.copy()
+        masks[:, :2] = np.maximum(0, masks[:, :2] - self.MASK_INFLATION)
+        masks[:, 2:] = np.minimum(1000, masks[:, 2:] + self.MASK_INFLATION)
+        self.mask_emu = emu_boxes(masks, scale_x, scale_y)
+
+        regions = np.clip(normalized_boxes(layout_data.get("image_regions", [])), 0, 1000)
+        pixels = pixel_boxes(regions, w, h)
+        regions = merge_overlapping_boxes(regions[(pixels[:, 2] > pixels[:, 0]) & (pixels[:, 3] > pixels[:, 1])])
+        self.image_pixels = pixel_boxes(regions, w, h)
+        self.image_emu = emu_boxes(regions, scale_x, scale_y)
+
+
 class PPTXBuilder:
-    def __init__(self, output_path, mode="standard", font_scale=1.1):
+    """
+    Assembles slides from layout results.
+
+    With streaming=True each slide and its media are written into the output
+    zip as soon as the slide is finished and then dropped from the in-memory
+    presentation, so peak memory depends on a single page rather than on the
+    page count. The package skeleton (presentation.xml, layouts, theme, content
+    types) is written by save().
+
+    With bulk_xml=True (the default) text blocks are written as one batch of
+    shape XML per slide instead of one python-pptx call per property; the
+    result is the same XML (see benchmarks/bench_slide_xml.py).
+    """
+    def __init__(self, output_path, mode="standard", font_scale=1.1, streaming=False,
+                 background_encoder=None, crop_encoder=None, profiler=None, bulk_xml=True):
+        from pptx import Presentation
         self.prs = Presentation()
+        self.profiler = profiler or NULL_PROFILER
+        self.bulk_xml = bulk_xml
+        self._run_props = {}        # (size, bold, color, font) -> <a:defRPr> XML
         self.output_path = output_path
         self.mode = mode
         self.font_scale = font_scale
+        self.streaming = streaming
+        self.background_encoder = background_encoder or ImageEncoder()
+        self.crop_encoder = crop_encoder or ImageEncoder()
+        self.slide_count = 0
+
+        # Streaming state
+        self._zip = None
+        self._tmp_path = None
+        self._media = {}            # image sha1 -> zip member name
+        self._media_types = {}      # file extension -> content type
         
     def set_slide_size(self, width, height):
         self.prs.slide_width = int(width * 72 * 12700) 
@@ -141,65 +1128,70 @@ class PPTXBuilder:
         Calculates background color by sampling the edges of the region.
         box_2d: [ymin, xmin, ymax, xmax] normalized 1000
         """
-        ymin, xmin, ymax, xmax = box_2d
-        w, h = image.size
-        
-        # Expand slightly to capture background context if possible (ensure we are outside the letter forms)
-        # But be careful not to go out of bounds or into other text.
-        # Actually, using the box itself and checking edges is usually safe as text doesn't touch the box edge typically.
-        
-        left = int((xmin / 1000.0) * w)
-        top = int((ymin / 1000.0) * h)
-        right = int((xmax / 1000.0) * w)
-        bottom = int((ymax / 1000.0) * h)
-        
-        # Clamp
-        left = max(0, left)
-        top = max(0, top)
-        right = min(w, right)
-        bottom = min(h, bottom)
-        
-        if right <= left or bottom <= top:
-            return (255, 255, 255) 
+        return self.get_edge_colors(image, [box_2d])[0]
 
-        cropped = image.crop((left, top, right, bottom))
-        
-        # Sample edges
-        pixels = []
-        cw, ch = cropped.size
-        
-        # Sample logic: Top and Bottom rows, Left and Right columns
-        # Take 2px depth if possible
+    def get_edge_colors(self, image, boxes):
+        """
+        Batch version of get_edge_color.
+
+        image: PIL Image or an RGB uint8 array of shape (h, w, 3). Pass the array
+               when calling repeatedly for the same page to avoid re-converting.
+        boxes: list or (n, 4) array of [ymin, xmin, ymax, xmax] normalized 1000
+
+        For each box, the 2px strips along all four edges are sampled and the most
+        common color wins (ties go to the color seen first, in the same order as
+        the original per-pixel sampler walked the edges).
+        """
+        if len(boxes) == 0:
+            return []
+
+        pixels = image if isinstance(image, np.ndarray) else np.asarray(image.convert("RGB"))
+        h, w = pixels.shape[:2]
+
+        colors = [(255, 255, 255)] * len(boxes)
+        keys = []
         depth = 2
-        
-        try:
-             # Convert to RGB to ensure tuples
-            cropped_rgb = cropped.convert("RGB")
-            
-            # Top & Bottom
-            for y in range(min(depth, ch)):
-                for x in range(cw):
-                    pixels.append(cropped_rgb.getpixel((x, y)))
-                    pixels.append(cropped_rgb.getpixel((x, ch - 1 - y)))
-            
-            # Left & Right
-            for x in range(min(depth, cw)):
-                for y in range(ch):
-                    pixels.append(cropped_rgb.getpixel((x, y)))
-                    pixels.append(cropped_rgb.getpixel((cw - 1 - x, y)))
-            
-            if not pixels:
-                return (255, 255, 255)
-                
-            # Find most common color
-            from collections import Counter
-            most_common = Counter(pixels).most_common(1)[0][0]
-            return most_common
-            
-        except Exception:
-            return (255, 255, 255)
+
+        for i, (left, top, right, bottom) in enumerate(pixel_boxes(boxes, w, h).tolist()):
+            if right <= left or bottom <= top:
+                continue
+
+            region = pixels[top:bottom, left:right]
+            ch, cw = region.shape[:2]
+
+            # Top & Bottom rows, interleaved per pixel
+            rows = np.arange(min(depth, ch))
+            tb = np.stack([region[rows], region[ch - 1 - rows]], axis=2)
+            # Left & Right columns, interleaved per pixel
+            cols = np.arange(min(depth, cw))
+            lr = np.stack([region[:, cols].swapaxes(0, 1), region[:, cw - 1 - cols].swapaxes(0, 1)], axis=2)
+
+            samples = np.concatenate([tb.reshape(-1, 3), lr.reshape(-1, 3)]).astype(np.int64)
+            # Pack RGB (and the box index) into one integer so colors can be counted with np.unique
+            keys.append((np.int64(i) << 24) | (samples[:, 0] << 16) | (samples[:, 1] << 8) | samples[:, 2])
+
+        if not keys:
+            return colors
+
+        keys = np.concatenate(keys)
+        uniq, first_idx, counts = np.unique(keys, return_index=True, return_counts=True)
+        box_ids = uniq >> 24
+        # Per box: highest count first, then earliest first occurrence
+        order = np.lexsort((first_idx, -counts, box_ids))
+        ranked_boxes = box_ids[order]
+        is_first = np.ones(len(order), dtype=bool)
+        is_first[1:] = ranked_boxes[1:] != ranked_boxes[:-1]
+
+        for box_id, key in zip(ranked_boxes[is_first], uniq[order][is_first]):
+            c = int(key) & 0xFFFFFF
+            colors[int(box_id)] = (c >> 16, (c >> 8) & 0xFF, c & 0xFF)
+
+        return colors
 
     def add_slide(self, original_image, layout_data, pdf_width, pdf_height):
+        """original_image may be a PageRender or a PIL Image."""
+        page = PageRender.wrap(original_image)
+
         # Create a blank slide
         blank_slide_layout = self.prs.slide_layouts[6] 
         slide = self.prs.slides.add_slide(blank_slide_layout)
@@ -210,180 +1202,1321 @@ class PPTXBuilder:
         
         if self.mode == "text_focus":
             # 1. Set background image (Full Page)
-            img_stream = io.BytesIO()
-            original_image.save(img_stream, format="PNG")
-            img_stream.seek(0)
+            with self.profiler.stage("image_encode") as counters:
+                img_stream = self.background_encoder.encode(page, self.prs.slide_width, self.prs.slide_height)
+                counters["bytes"] = img_stream.getbuffer().nbytes
             
             slide.shapes.add_picture(img_stream, 0, 0, self.prs.slide_width, self.prs.slide_height)
 
+        geometry = LayoutGeometry(layout_data, self.prs.slide_width, self.prs.slide_height, page.size)
+
         # 2. Add Images (Standard Mode only)
-        if self.mode == "standard" and "image_regions" in layout_data:
-            for img_region in layout_data["image_regions"]:
-                ymin, xmin, ymax, xmax = img_region["box_2d"]
-                
-                w, h = original_image.size
-                
-                left = int((xmin / 1000.0) * w)
-                top = int((ymin / 1000.0) * h)
-                right = int((xmax / 1000.0) * w)
-                bottom = int((ymax / 1000.0) * h)
-                
-                if right > left and bottom > top:
-                    cropped_img = original_image.crop((left, top, right, bottom))
-                    img_stream = io.BytesIO()
-                    cropped_img.save(img_stream, format="PNG")
-                    img_stream.seek(0)
-                    
-                    slide_left = int(xmin * scale_x)
-                    slide_top = int(ymin * scale_y)
-                    slide_width = int((xmax - xmin) * scale_x)
-                    slide_height = int((ymax - ymin) * scale_y)
-                    
-                    try:
-                        slide.shapes.add_picture(img_stream, slide_left, slide_top, slide_width, slide_height)
-                    except Exception as e:
-                        print(f"Failed to add image: {e}")
+        if self.mode == "standard":
+            for crop_box, (slide_left, slide_top, slide_width, slide_height) in zip(
+                    geometry.image_pixels.tolist(), geometry.image_emu.tolist()):
+                with self.profiler.stage("crop"):
+                    cropped_img = page.crop(tuple(crop_box))
+                with self.profiler.stage("image_encode") as counters:
+                    img_stream = self.crop_encoder.encode(cropped_img, slide_width, slide_height)
+                    counters["bytes"] = img_stream.getbuffer().nbytes
+
+                try:
+                    slide.shapes.add_picture(img_stream, slide_left, slide_top, slide_width, slide_height)
+                except Exception as e:
+                    print(f"Failed to add image: {e}")
 
         # 3. Add Text
         if "text_blocks" in layout_data:
-            for text_block in layout_data["text_blocks"]:
-                ymin_norm, xmin_norm, ymax_norm, xmax_norm = text_block["box_2d"]
-                text_content = text_block.get("text", "")
-                font_size = text_block.get("font_size_pt", 12)
-                font_color_hex = text_block.get("font_color_hex", "#000000")
-                font_family_style = text_block.get("font_family", "sans")
-                is_bold = text_block.get("is_bold", False)
+            bg_colors = None
+            if self.mode == "text_focus":
+                # Sample the mask colors for every block in one pass over the page
+                with self.profiler.stage("edge_color", blocks=len(layout_data["text_blocks"])):
+                    bg_colors = self.get_edge_colors(page.pixels, geometry.text_boxes)
+
+            with self.profiler.stage("text_shapes", blocks=len(layout_data["text_blocks"])):
+                if self.bulk_xml:
+                    self._add_text_blocks_xml(slide, layout_data["text_blocks"], bg_colors, geometry)
+                else:
+                    self._add_text_blocks(slide, layout_data["text_blocks"], bg_colors, scale_x, scale_y)
+
+        self.slide_count += 1
+        if self.streaming:
+            with self.profiler.stage("flush_slide"):
+                self._flush_slide(slide)
+
+    def _add_text_blocks(self, slide, text_blocks, bg_colors, scale_x, scale_y):
+        """Adds the text (and, in text_focus mode, mask) shapes through the python-pptx object API."""
+        from pptx.dml.color import RGBColor
+        from pptx.util import Pt
+        for block_idx, text_block in enumerate(text_blocks):
+            ymin_norm, xmin_norm, ymax_norm, xmax_norm = text_block["box_2d"]
+            text_content = text_block.get("text", "")
+            font_size = text_block.get("font_size_pt", 12)
+            font_color_hex = text_block.get("font_color_hex", "#000000")
+            font_family_style = text_block.get("font_family", "sans")
+            is_bold = text_block.get("is_bold", False)
                 
-                # Coordinates
-                left = int(xmin_norm * scale_x)
-                top = int(ymin_norm * scale_y)
-                width = int((xmax_norm - xmin_norm) * scale_x)
-                height = int((ymax_norm - ymin_norm) * scale_y)
+            # Coordinates
+            left = int(xmin_norm * scale_x)
+            top = int(ymin_norm * scale_y)
+            width = int((xmax_norm - xmin_norm) * scale_x)
+            height = int((ymax_norm - ymin_norm) * scale_y)
 
-                if self.mode == "text_focus":
-                    # --- Strategy: Two Shapes ---
-                    # Shape 1: Mask Rectangle (Inflated, Filled with Bg Color, No Text)
-                    # Shape 2: Text Box (Standard Coordinates, No Fill, Text)
+            if self.mode == "text_focus":
+                # --- Strategy: Two Shapes ---
+                # Shape 1: Mask Rectangle (Inflated, Filled with Bg Color, No Text)
+                # Shape 2: Text Box (Standard Coordinates, No Fill, Text)
                     
-                    # 1. MASK SHAPE
-                    # Sample color from the original box (tight) edges to get accurate background
-                    bg_color = self.get_edge_color(original_image, [ymin_norm, xmin_norm, ymax_norm, xmax_norm])
+                # 1. MASK SHAPE
+                # Sample color from the original box (tight) edges to get accurate background
+                bg_color = bg_colors[block_idx]
                     
-                    # Inflate box for masking
-                    # 5 units out of 1000 approx 0.5%
-                    inflation = 5 
-                    mask_ymin = max(0, ymin_norm - inflation)
-                    mask_xmin = max(0, xmin_norm - inflation)
-                    mask_ymax = min(1000, ymax_norm + inflation)
-                    mask_xmax = min(1000, xmax_norm + inflation)
-
-                    mask_left = int(mask_xmin * scale_x)
-                    mask_top = int(mask_ymin * scale_y)
-                    mask_width = int((mask_xmax - mask_xmin) * scale_x)
-                    mask_height = int((mask_ymax - mask_ymin) * scale_y)
+                # Inflate box for masking
+                # 5 units out of 1000 approx 0.5%
+                inflation = 5 
+                mask_ymin = max(0, ymin_norm - inflation)
+                mask_xmin = max(0, xmin_norm - inflation)
+                mask_ymax = min(1000, ymax_norm + inflation)
+                mask_xmax = min(1000, xmax_norm + inflation)
+
+                mask_left = int(mask_xmin * scale_x)
+                mask_top = int(mask_ymin * scale_y)
+                mask_width = int((mask_xmax - mask_xmin) * scale_x)
+                mask_height = int((mask_ymax - mask_ymin) * scale_y)
                     
-                    mask_shape = slide.shapes.add_shape(
-                        1, # MSO_SHAPE.RECTANGLE (1 is value)
-                        mask_left, mask_top, mask_width, mask_height
-                    )
-                    mask_shape.fill.solid()
-                    mask_shape.fill.fore_color.rgb = RGBColor(bg_color[0], bg_color[1], bg_color[2])
-                    mask_shape.line.fill.background() # No line
+                mask_shape = slide.shapes.add_shape(
+                    1, # MSO_SHAPE.RECTANGLE (1 is value)
+                    mask_left, mask_top, mask_width, mask_height
+                )
+                mask_shape.fill.solid()
+                mask_shape.fill.fore_color.rgb = RGBColor(bg_color[0], bg_color[1], bg_color[2])
+                mask_shape.line.fill.background() # No line
                     
-                    # Remove shadow
-                    mask_shape.shadow.inherit = False 
+                # Remove shadow
+                mask_shape.shadow.inherit = False 
                     
-                    # 2. TEXT SHAPE (Precise)
-                    # Use original coordinates
-                    txBox = slide.shapes.add_textbox(left, top, width, height)
+                # 2. TEXT SHAPE (Precise)
+                # Use original coordinates
+                txBox = slide.shapes.add_textbox(left, top, width, height)
                     
-                    # Set margins to 0 for tight alignment
-                    tf = txBox.text_frame
-                    tf.margin_left = 0
-                    tf.margin_right = 0
-                    tf.margin_top = 0
-                    tf.margin_bottom = 0
-                    tf.word_wrap = True 
+                # Set margins to 0 for tight alignment
+                tf = txBox.text_frame
+                tf.margin_left = 0
+                tf.margin_right = 0
+                tf.margin_top = 0
+                tf.margin_bottom = 0
+                tf.word_wrap = True 
 
-                else:
-                    # Standard Mode
-                    txBox = slide.shapes.add_textbox(left, top, width, height)
-                    tf = txBox.text_frame
-                    tf.word_wrap = True 
+            else:
+                # Standard Mode
+                txBox = slide.shapes.add_textbox(left, top, width, height)
+                tf = txBox.text_frame
+                tf.word_wrap = True 
 
-                tf.text = text_content
+            tf.text = text_content
                 
-                # Apply styles to ALL paragraphs to handle multi-line text correctly
-                for p in tf.paragraphs:
-                    # Font Size (Scaled)
-                    scaled_font_size = (font_size * self.font_scale) if font_size else 12
-                    p.font.size = Pt(scaled_font_size)
+            # Apply styles to ALL paragraphs to handle multi-line text correctly
+            for p in tf.paragraphs:
+                # Font Size (Scaled)
+                scaled_font_size = (font_size * self.font_scale) if font_size else 12
+                p.font.size = Pt(scaled_font_size)
                     
-                    # Bold
-                    if is_bold:
-                        p.font.bold = True
+                # Bold
+                if is_bold:
+                    p.font.bold = True
                     
-                    # Font Family logic
-                    if self.mode == "text_focus":
-                        if font_family_style == "serif":
-                             p.font.name = "MS Mincho"
-                        else:
-                             p.font.name = "Meiryo" 
-
-                    # Color logic
-                    try:
-                        if font_color_hex and font_color_hex.startswith("#"):
-                            r = int(font_color_hex[1:3], 16)
-                            g = int(font_color_hex[3:5], 16)
-                            b = int(font_color_hex[5:7], 16)
-                            p.font.color.rgb = RGBColor(r, g, b)
-                    except:
-                        pass
+                # Font Family logic
+                if self.mode == "text_focus":
+                    if font_family_style == "serif":
+                         p.font.name = "MS Mincho"
+                    else:
+                         p.font.name = "Meiryo" 
+
+                # Color logic
+                try:
+                    if font_color_hex and font_color_hex.startswith("#"):
+                        r = int(font_color_hex[1:3], 16)
+                        g = int(font_color_hex[3:5], 16)
+                        b = int(font_color_hex[5:7], 16)
+                        p.font.color.rgb = RGBColor(r, g, b)
+                except:
+                    pass
+
+    def _def_rpr_xml(self, font_size, is_bold, font_color_hex, font_family_style):
+        """Paragraph run-property XML for one text style, cached across blocks and slides."""
+        from pptx.util import Pt
+        scaled_font_size = (font_size * self.font_scale) if font_size else 12
+        sz = Pt(scaled_font_size).centipoints
+        rgb = _hex_to_rgb(font_color_hex)
+        typeface = None
+        if self.mode == "text_focus":
+            typeface = "MS Mincho" if font_family_style == "serif" else "Meiryo"
+
+        key = (sz, bool(is_bold), rgb, typeface)
+        xml = self._run_props.get(key)
+        if xml is None:
+            attrs = f' sz="{sz}"' + (' b="1"' if is_bold else "")
+            children = ""
+            if rgb is not None:
+                children += '<a:solidFill><a:srgbClr val="%02X%02X%02X"/></a:solidFill>' % rgb
+            if typeface is not None:
+                children += f'<a:latin typeface="{typeface}"/>'
+            xml = f"<a:defRPr{attrs}>{children}</a:defRPr>" if children else f"<a:defRPr{attrs}/>"
+            self._run_props[key] = xml
+        return xml
+
+    def _add_text_blocks_xml(self, slide, text_blocks, bg_colors, geometry):
+        """Same shapes as _add_text_blocks, built as one XML fragment and appended in a single step."""
+        from pptx.oxml import parse_xml
+        from pptx.oxml.ns import nsdecls
+        shape_id = slide.shapes._next_shape_id
+        body_pr = _BODY_PR_XML[self.mode]
+        text_emu = geometry.text_emu.tolist()
+        mask_emu = geometry.mask_emu.tolist()
+        parts = []
+
+        for block_idx, text_block in enumerate(text_blocks):
+            if self.mode == "text_focus":
+                x, y, cx, cy = mask_emu[block_idx]
+                bg_color = bg_colors[block_idx]
+                parts.append(_MASK_SP_XML.format(
+                    id=shape_id, n=shape_id - 1, x=x, y=y, cx=cx, cy=cy,
+                    color="%02X%02X%02X" % (bg_color[0], bg_color[1], bg_color[2]),
+                ))
+                shape_id += 1
+
+            def_rpr = "<a:pPr>" + self._def_rpr_xml(
+                text_block.get("font_size_pt", 12),
+                text_block.get("is_bold", False),
+                text_block.get("font_color_hex", "#000000"),
+                text_block.get("font_family", "sans"),
+            ) + "</a:pPr>"
+
+            paragraphs = []
+            for p_text in text_block.get("text", "").split("\n"):
+                runs = []
+                for idx, r_str in enumerate(_LINE_BREAKS.split(p_text)):
+                    if idx > 0:
+                        runs.append("<a:br/>")
+                    if r_str:
+                        runs.append(f"<a:r><a:t>{_xml_text(r_str)}</a:t></a:r>")
+                paragraphs.append(f"<a:p>{def_rpr}{''.join(runs)}</a:p>")
+
+            x, y, cx, cy = text_emu[block_idx]
+            parts.append(_TEXTBOX_SP_XML.format(
+                id=shape_id, n=shape_id - 1, x=x, y=y, cx=cx, cy=cy,
+                body_pr=body_pr, paragraphs="".join(paragraphs),
+            ))
+            shape_id += 1
+
+        if parts:
+            fragment = parse_xml(f"<p:spTree {nsdecls('p', 'a', 'r')}>{''.join(parts)}</p:spTree>")
+            slide.shapes._spTree.extend(list(fragment))
+
+    def _flush_slide(self, slide):
+        """Writes a finished slide and its media to the output zip and drops it from self.prs."""
+        from pptx.opc.constants import RELATIONSHIP_TYPE as RT
+        if self._zip is None:
+            self._tmp_path = self.output_path + ".part"
+            self._zip = zipfile.ZipFile(self._tmp_path, "w", zipfile.ZIP_DEFLATED)
+
+        slide_name = f"ppt/slides/slide{self.slide_count}.xml"
+        rels = etree.Element(f"{{{_OPC_REL_NS}}}Relationships", nsmap={None: _OPC_REL_NS})
+
+        for r_id, rel in slide.part.rels.items():
+            attrs = {"Id": r_id, "Type": rel.reltype}
+            if rel.is_external:
+                attrs["Target"] = rel.target_ref
+                attrs["TargetMode"] = "External"
+            elif rel.reltype == RT.IMAGE:
+                image_part = rel.target_part
+                media_name = self._media.get(image_part.sha1)
+                if media_name is None:
+                    media_name = f"ppt/media/image{len(self._media) + 1}.{image_part.ext}"
+                    self._zip.writestr(media_name, image_part.blob)
+                    self._media[image_part.sha1] = media_name
+                    self._media_types[image_part.ext] = image_part.content_type
+                attrs["Target"] = "../media/" + posixpath.basename(media_name)
+            else:
+                # Slide layout and other parts that stay in the skeleton
+                attrs["Target"] = posixpath.relpath(str(rel.target_part.partname), "/ppt/slides")
+            etree.SubElement(rels, f"{{{_OPC_REL_NS}}}Relationship", attrs)
+
+        self._zip.writestr(slide_name, slide.part.blob)
+        self._zip.writestr(
+            f"ppt/slides/_rels/slide{self.slide_count}.xml.rels",
+            etree.tostring(rels, xml_declaration=True, encoding="UTF-8", standalone=True),
+        )
+
+        # Detach the slide so it (and its images) can be garbage collected
+        sld_id_lst = self.prs.slides._sldIdLst
+        for sld_id in list(sld_id_lst):
+            sld_id_lst.remove(sld_id)
+            self.prs.part.drop_rel(sld_id.rId)
+
+    def _save_streaming(self):
+        from pptx.opc.constants import CONTENT_TYPE as CT, RELATIONSHIP_TYPE as RT
+        from pptx.oxml.ns import qn
+        if self._zip is None:
+            self._tmp_path = self.output_path + ".part"
+            self._zip = zipfile.ZipFile(self._tmp_path, "w", zipfile.ZIP_DEFLATED)
+
+        # Save the slide-less presentation and splice the streamed slides into it
+        skeleton = io.BytesIO()
+        self.prs.save(skeleton)
+        slide_count = self.slide_count
+
+        with zipfile.ZipFile(skeleton) as skel:
+            for name in skel.namelist():
+                data = skel.read(name)
+                if name == "[Content_Types].xml":
+                    root = etree.fromstring(data)
+                    known = {el.get("Extension").lower() for el in root.iter(f"{{{_OPC_CT_NS}}}Default")}
+                    for ext, content_type in self._media_types.items():
+                        if ext.lower() not in known:
+                            # Defaults must precede Overrides
+                            root.insert(0, etree.Element(f"{{{_OPC_CT_NS}}}Default", Extension=ext, ContentType=content_type))
+                    for n in range(1, slide_count + 1):
+                        etree.SubElement(root, f"{{{_OPC_CT_NS}}}Override", PartName=f"/ppt/slides/slide{n}.xml", ContentType=CT.PML_SLIDE)
+                    data = etree.tostring(root, xml_declaration=True, encoding="UTF-8", standalone=True)
+                elif name == "ppt/_rels/presentation.xml.rels":
+                    root = etree.fromstring(data)
+                    used = [int(el.get("Id")[3:]) for el in root if el.get("Id", "").startswith("rId") and el.get("Id")[3:].isdigit()]
+                    first_id = max(used, default=0) + 1
+                    for n in range(1, slide_count + 1):
+                        etree.SubElement(root, f"{{{_OPC_REL_NS}}}Relationship", Id=f"rId{first_id + n - 1}", Type=RT.SLIDE, Target=f"slides/slide{n}.xml")
+                    data = etree.tostring(root, xml_declaration=True, encoding="UTF-8", standalone=True)
+                    slide_rid_base = first_id
+                elif name == "ppt/presentation.xml":
+                    presentation_xml = data
+                    continue
+                self._zip.writestr(name, data)
+
+        root = etree.fromstring(presentation_xml)
+        sld_id_lst = root.find(qn("p:sldIdLst"))
+        if sld_id_lst is None:
+            sld_id_lst = etree.Element(qn("p:sldIdLst"))
+            anchor = None
+            for tag in ("p:sldMasterIdLst", "p:notesMasterIdLst", "p:handoutMasterIdLst"):
+                el = root.find(qn(tag))
+                if el is not None:
+                    anchor = el
+            if anchor is not None:
+                anchor.addnext(sld_id_lst)
+            else:
+                root.insert(0, sld_id_lst)
+        for n in range(1, slide_count + 1):
+            etree.SubElement(sld_id_lst, qn("p:sldId"), {"id": str(255 + n), qn("r:id"): f"rId{slide_rid_base + n - 1}"})
+        self._zip.writestr("ppt/presentation.xml", etree.tostring(root, xml_declaration=True, encoding="UTF-8", standalone=True))
+
+        self._zip.close()
+        self._zip = None
+        os.replace(self._tmp_path, self.output_path)
 
     def save(self):
-        self.prs.save(self.output_path)
+        with self.profiler.stage("save"):
+            if self.streaming:
+                self._save_streaming()
+            else:
+                self.prs.save(self.output_path)
         print(f"Presentation saved to {self.output_path}")
 
-def main():
-    parser = argparse.ArgumentParser(description="Convert PDF or Images to editable PPTX using Gemini.")
-    parser.add_argument("input_file", help="Path to input file (PDF, PNG, JPG, etc.)")
-    parser.add_argument("output_pptx", help="Path to output PPTX file")
+# --- Tiled analysis ---
+#
+# Pages larger than a threshold (posters, drawings, spreads) are analyzed as
+# a grid of overlapping tiles, each uploaded like a page of its own, so small
+# text stays legible in the model's 1000x1000 box grid and no single render
+# grows with the page. Each tile owns the core of its area (the overlap is
+# split down the middle); a text block is kept from the tile whose core holds
+# its center, and figure fragments are merged across tiles.
+
+A4_AREA_PT = 595 * 842
+
+
+def plan_tiles(width, height, tile_size=842, overlap=96):
+    """
+    Splits a page into a grid of equal tiles of at most tile_size points that
+    overlap by `overlap` points. Returns a list of (tile, core) rectangles as
+    (x0, y0, x1, y1) in points; the cores partition the page.
+    """
+    overlap = max(0, min(overlap, tile_size / 2))
+
+    def spans(length):
+        count = max(1, -(-(length - overlap) // (tile_size - overlap)))
+        count = int(count)
+        size = (length + (count - 1) * overlap) / count
+        result = []
+        for i in range(count):
+            start = i * (size - overlap)
+            end = length if i == count - 1 else start + size
+            core_start = 0 if i == 0 else start + overlap / 2
+            core_end = length if i == count - 1 else end - overlap / 2
+            result.append((start, end, core_start, core_end))
+        return result
+
+    tiles = []
+    for y0, y1, core_y0, core_y1 in spans(height):
+        for x0, x1, core_x0, core_x1 in spans(width):
+            tiles.append(((x0, y0, x1, y1), (core_x0, core_y0, core_x1, core_y1)))
+    return tiles
+
+
+def stitch_tile_layouts(tiles, layouts, width, height):
+    """Maps per-tile layouts back to one page layout in the page's 1000x1000 space."""
+    text_blocks = []
+    regions = []
+
+    for ((x0, y0, x1, y1), (cx0, cy0, cx1, cy1)), layout_data in zip(tiles, layouts):
+        # Tile box_2d -> page points
+        scale = np.array([y1 - y0, x1 - x0, y1 - y0, x1 - x0]) / 1000.0
+        offset = np.array([y0, x0, y0, x0])
+        to_page = np.array([1000.0 / height, 1000.0 / width, 1000.0 / height, 1000.0 / width])
+
+        blocks = layout_data.get("text_blocks", [])
+        if blocks:
+            points = normalized_boxes(blocks) * scale + offset
+            center_y = (points[:, 0] + points[:, 2]) / 2
+            center_x = (points[:, 1] + points[:, 3]) / 2
+            owned = (center_y >= cy0) & (center_y < cy1) & (center_x >= cx0) & (center_x < cx1)
+            for block, box, keep in zip(blocks, (points * to_page).tolist(), owned.tolist()):
+                if keep:
+                    text_blocks.append(dict(block, box_2d=[round(v, 1) for v in box]))
+
+        figures = layout_data.get("image_regions", [])
+        if figures:
+            regions.append((normalized_boxes(figures) * scale + offset) * to_page)
+
+    image_regions = []
+    if regions:
+        merged = merge_overlapping_boxes(np.concatenate(regions))
+        image_regions = [{"box_2d": [round(v, 1) for v in box]} for box in merged.tolist()]
+
+    # Reading order across tiles: top to bottom, then left to right
+    text_blocks.sort(key=lambda block: (block["box_2d"][0], block["box_2d"][1]))
+    return {"text_blocks": text_blocks, "image_regions": image_regions}
+
+
+class ConversionPipeline:
+    """
+    Renders pages, analyzes them concurrently and feeds the results to the
+    builder strictly in page order.
+
+    At most `concurrency` pages are in flight (rendered and waiting on the
+    model) at any time, which bounds both memory and API quota usage.
+    Rendering and slide assembly stay on the calling thread because neither
+    fitz documents nor python-pptx presentations are thread-safe.
+
+    `analyzer` is anything with analyze_page(image) and analyze_pages(images)
+    returning layout dicts: GeminiAnalyzer, or ReplayAnalyzer (replay.py) for
+    offline runs and benchmarks.
+
+    By default the slide render (at `zoom`) is also what the model sees. With
+    `analysis_max_edge` set, the model gets a separate, smaller render instead,
+    and in standard mode the slide render becomes lazy so only the regions
+    that are actually cropped get rendered at full resolution.
+
+    engine selects where layouts come from:
+      "gemini" - every page goes to the model
+      "native" - every page is read from the PDF's text layer (no API calls)
+      "auto"   - text layer where it is usable, the model otherwise
+
+    With batch_size > 1, up to that many pages go to the model in a single
+    request (GeminiAnalyzer.analyze_pages).
+
+    With a `dedupe_index` (PageHashIndex), pages that look the same as a page
+    already sent to the model reuse its result instead of making a new call.
+    Share one index across documents to dedupe a whole batch.
+
+    `known_layouts` ({page_num: layout_data}, e.g. from a LayoutJournal) are
+    used as-is, and every other finished page is recorded to `journal`.
+    `unchanged_layouts` are used the same way but counted as unchanged pages
+    of a previous conversion (see PageManifest). With keep_layouts=True,
+    `layouts` collects {page_num: (width, height, layout_data)}.
+
+    A `profiler` (StageProfiler) gets per-page timings of every stage; pass
+    the same one to the DocumentProcessor, analyzer and builder.
+
+    Pages larger than `tile_threshold` A4 sheets (0 = never) are sent to the
+    model as overlapping tiles of `tile_size` points (see plan_tiles); their
+    slide render is scaled down to the pixel count of a page at the threshold.
+    """
+    ENGINES = ("auto", "native", "gemini")
+
+    def __init__(self, proc, analyzer, builder=None, concurrency=4,
+                 zoom=2.0, analysis_max_edge=None, analysis_format="jpeg", engine="gemini",
+                 dedupe_index=None, batch_size=1, known_layouts=None, journal=None, profiler=None,
+                 tile_threshold=0, tile_size=842, tile_overlap=96, unchanged_layouts=None, keep_layouts=False):
+        if engine not in self.ENGINES:
+            raise ValueError(f"Unknown engine: {engine}")
+        self.proc = proc
+        self.analyzer = analyzer
+        self.builder = builder
+        self.concurrency = max(1, int(concurrency))
+        self.zoom = zoom
+        self.analysis_max_edge = analysis_max_edge
+        self.analysis_format = analysis_format
+        self.engine = engine
+        self.native = NativeAnalyzer(proc.doc) if engine != "gemini" else None
+        self.dedupe_index = dedupe_index
+        self.batch_size = max(1, int(batch_size))
+        self.known_layouts = known_layouts or {}
+        self.journal = journal
+        self.profiler = profiler or NULL_PROFILER
+        self.tile_threshold = tile_threshold
+        self.tile_size = tile_size
+        self.tile_overlap = tile_overlap
+        self.unchanged_layouts = unchanged_layouts or {}
+        self.keep_layouts = keep_layouts
+        self.layouts = {}
+        self.stats = {"native": 0, "gemini": 0, "reused": 0, "requests": 0, "resumed": 0, "tiled": 0, "unchanged": 0}
+
+    def _native_layout(self, page_num):
+        """Layout from the text layer, or None if the page has to go to the model."""
+        if self.engine == "gemini":
+            return None
+        with self.profiler.stage("native", page=page_num):
+            if self.engine == "auto" and not self.native.has_text_layer(page_num):
+                return None
+            return self.native.analyze_page(page_num)
+
+    def _render(self, page_num):
+        """Returns (slide render, upload render, width_pt, height_pt)."""
+        if not self.analysis_max_edge:
+            render, w, h = self.proc.render_page(page_num, zoom=self.zoom)
+            return render, render, w, h
+
+        lazy = self.builder is None or self.builder.mode == "standard"
+        render, w, h = self.proc.render_page(page_num, zoom=self.zoom, lazy=lazy)
+        upload = self.proc.render_for_analysis(page_num, max_edge=self.analysis_max_edge, fmt=self.analysis_format)
+        return render, upload, w, h
+
+    def _tile_zoom(self, page_num):
+        """Slide render zoom for a page to be tiled, or None if the page is analyzed whole."""
+        if not self.tile_threshold:
+            return None
+        w, h = self.proc.page_size(page_num)
+        limit = self.tile_threshold * A4_AREA_PT
+        if w * h <= limit:
+            return None
+        return self.zoom * (limit / (w * h)) ** 0.5
+
+    def _stitched(self, tiles, tile_futures, w, h):
+        """A future for the page layout that resolves once every tile is analyzed."""
+        future = Future()
+        remaining = [len(tile_futures)]
+        lock = threading.Lock()
+
+        def on_done(_):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            if future.done():
+                return
+            try:
+                layouts = [tile_future.result() for tile_future in tile_futures]
+                future.set_result(stitch_tile_layouts(tiles, layouts, w, h))
+            except BaseException as e:
+                future.set_exception(e)
+
+        for tile_future in tile_futures:
+            tile_future.add_done_callback(on_done)
+        return future
+
+    def _submit_batch(self, executor, batch):
+        """Sends (upload, future) pairs to the model as one request and resolves each future."""
+        uploads = [upload for upload, _ in batch]
+        futures = [future for _, future in batch]
+        self.stats["requests"] += 1
+
+        def task():
+            try:
+                # Includes cache lookups, rate-limit waits and retries
+                with self.profiler.stage("analyze", pages=len(uploads)):
+                    if len(uploads) == 1:
+                        results = [self.analyzer.analyze_page(uploads[0])]
+                    else:
+                        results = self.analyzer.analyze_pages(uploads)
+            except BaseException as e:
+                for future in futures:
+                    future.set_exception(e)
+                return
+            for future, layout_data in zip(futures, results):
+                future.set_result(layout_data)
+
+        executor.submit(task)
+
+    def _window_cost(self, page_num):
+        """
+        Slots a page takes in the look-ahead window: its tile count if it is
+        analyzed in tiles, otherwise 1. (Oversized pages that turn out to have
+        a text layer are counted the same way; they are never waited on.)
+        """
+        if page_num in self.known_layouts or page_num in self.unchanged_layouts or self._tile_zoom(page_num) is None:
+            return 1
+        return len(plan_tiles(*self.proc.page_size(page_num), self.tile_size, self.tile_overlap))
+
+    def iter_pages(self, page_nums=None, cancel_event=None):
+        """
+        Yields (page_num, render, width, height, layout_data) in page order
+        while keeping up to `concurrency` requests (of `batch_size` pages
+        each) running ahead. Pages are only rendered once they enter that
+        window, so the cost of a selection does not depend on the document
+        length. Each tile of a tiled page takes a window slot of its own.
+        """
+        if page_nums is None:
+            page_nums = range(len(self.proc.doc))
+        page_nums = list(page_nums)
+        total = len(page_nums)
+        window = self.concurrency * self.batch_size
+        pending = deque()
+        queued = 0  # window slots taken by pending pages
+        batch = []
+        next_idx = 0
+        done = 0
+
+        executor = ThreadPoolExecutor(max_workers=self.concurrency)
+
+        def enqueue(upload):
+            nonlocal batch
+            future = Future()
+            batch.append((upload, future))
+            if len(batch) == self.batch_size:
+                self._submit_batch(executor, batch)
+                batch = []
+            return future
+
+        try:
+            while done < total:
+                if cancel_event is not None and cancel_event.is_set():
+                    break
+
+                # Refill the window once there is room for a whole batch, so
+                # requests do not degrade into single pages
+                free = window - queued
+                if free >= self.batch_size or next_idx + free >= total or not pending:
+                    while next_idx < total and queued < window:
+                        page_num = page_nums[next_idx]
+                        cost = self._window_cost(page_num)
+                        if pending and queued + cost > window:
+                            # Wait for the window to drain before rendering the tiles
+                            break
+                        if page_num in self.known_layouts:
+                            layout_data, source = self.known_layouts[page_num], "resumed"
+                        elif page_num in self.unchanged_layouts:
+                            layout_data, source = self.unchanged_layouts[page_num], "unchanged"
+                        else:
+                            layout_data, source = self._native_layout(page_num), "native"
+                        if layout_data is not None:
+                            lazy = self.builder is None or self.builder.mode == "standard"
+                            zoom = self._tile_zoom(page_num) or self.zoom
+                            image, w, h = self.proc.render_page(page_num, zoom=zoom, lazy=lazy)
+                            future = Future()
+                            future.set_result(layout_data)
+                            self.stats[source] += 1
+                        else:
+                            if self.analyzer is None:
+                                raise AnalyzerRequiredError(f"Page {page_num + 1} has no usable text layer and no Gemini analyzer is configured.")
+                            tile_zoom = self._tile_zoom(page_num)
+                            if tile_zoom is not None:
+                                # Tiles are upload-only renders (never reused for the slide), so they
+                                # use the analysis encoding. They are not deduplicated and each one
+                                # counts as a page in batches.
+                                lazy = self.builder is None or self.builder.mode == "standard"
+                                image, w, h = self.proc.render_page(page_num, zoom=tile_zoom, lazy=lazy)
+                                tiles = plan_tiles(w, h, self.tile_size, self.tile_overlap)
+                                tile_futures = [
+                                    enqueue(self.proc.render_tile(
+                                        page_num, tile, zoom=self.zoom, max_edge=self.analysis_max_edge,
+                                        fmt=self.analysis_format,
+                                    ))
+                                    for tile, _ in tiles
+                                ]
+                                future = self._stitched(tiles, tile_futures, w, h)
+                                self.stats["gemini"] += 1
+                                self.stats["tiled"] += 1
+                            else:
+                                image, upload, w, h = self._render(page_num)
+                                future = None
+                                if self.dedupe_index is not None:
+                                    with self.profiler.stage("dedupe", page=page_num):
+                                        signature = self.dedupe_index.signature(upload.pixels, self.proc.page_text(page_num))
+                                        future = self.dedupe_index.find(signature)
+                                if upload is not image:
+                                    upload.release_pixels()
+                                if future is not None:
+                                    self.stats["reused"] += 1
+                                else:
+                                    future = enqueue(upload)
+                                    self.stats["gemini"] += 1
+                                    if self.dedupe_index is not None:
+                                        self.dedupe_index.add(signature, future)
+                        pending.append((page_num, image, w, h, future, cost))
+                        queued += cost
+                        next_idx += 1
+
+                # Never wait on a page whose request has not been sent
+                if batch:
+                    self._submit_batch(executor, batch)
+                    batch = []
+
+                page_num, image, w, h, future, cost = pending.popleft()
+                queued -= cost
+                # Time the calling thread spends blocked on the model
+                with self.profiler.stage("analysis_wait", page=page_num):
+                    layout_data = future.result()
+                if self.journal is not None and page_num not in self.known_layouts:
+                    with self.profiler.stage("journal", page=page_num):
+                        self.journal.record(page_num, w, h, layout_data)
+                if self.keep_layouts:
+                    self.layouts[page_num] = (w, h, layout_data)
+                done += 1
+                yield page_num, image, w, h, layout_data
+        finally:
+            for item in pending:
+                item[4].cancel()
+            # Requests not yet started are dropped instead of being sent (and paid for)
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def run(self, page_nums=None, cancel_event=None, on_page=None):
+        """
+        Converts the given pages (all pages by default).
+        on_page(index, total, page_num) is called after each slide is added.
+        Returns the number of slides added.
+        """
+        if page_nums is None:
+            page_nums = range(len(self.proc.doc))
+        page_nums = list(page_nums)
+        total = len(page_nums)
+        done = 0
+
+        for page_num, image, w, h, layout_data in self.iter_pages(page_nums, cancel_event):
+            if done == 0:
+                self.builder.set_slide_size(w / 72, h / 72)
+            with self.profiler.stage("build_slide", page=page_num) as counters:
+                self.builder.add_slide(image, layout_data, w, h)
+                counters["peak_rss_mb"] = peak_rss_mb()
+            image.release()
+            done += 1
+
+            if on_page:
+                on_page(done, total, page_num)
+
+        return done
+
+
+# --- Layout interchange format ---
+#
+# A layout file is JSON Lines. The first line is a "document" header and each
+# following line is one analyzed page:
+#
+#   {"type": "document", "version": 1, "source": "...", "sha256": "...",
+#    "page_count": 12, "model": "..."}
+#   {"type": "page", "page": 0, "width": 595.0, "height": 842.0,
+#    "layout": {"text_blocks": [...], "image_regions": [...]}}
+#
+# Widths and heights are in PDF points. Pages are written as soon as they are
+# analyzed, so a partially written file is still readable.
+
+LAYOUT_FORMAT_VERSION = 1
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def read_layout_file(path):
+    """Returns (header, pages) where pages is a list of page records sorted by page number."""
+    header = None
+    pages = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if record.get("type") == "document":
+                header = record
+            elif record.get("type") == "page":
+                pages.append(record)
+            else:
+                raise ValueError(f"{path}:{line_no}: unknown record type {record.get('type')!r}")
+
+    if header is None:
+        raise ValueError(f"{path}: missing document header")
+    if header.get("version") != LAYOUT_FORMAT_VERSION:
+        raise ValueError(f"{path}: unsupported layout format version {header.get('version')}")
+
+    pages.sort(key=lambda r: r["page"])
+    return header, pages
+
+
+class LayoutJournal:
+    """
+    Per-page checkpoint of a running conversion, in the layout file format.
+
+    Each page's layout is appended and flushed to disk as soon as it is
+    available, so an interrupted job can be resumed without paying for the
+    finished pages again. Rendered images are not stored: rendering is local
+    and deterministic, so resumed pages are simply rendered again.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.records = {}
+        self._file = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def path_for(output_path):
+        return output_path + ".journal.jsonl"
+
+    def load(self, source_path, model=None):
+        """Returns {page_num: layout_data} from an existing journal for the same source file and model."""
+        if not os.path.exists(self.path):
+            return {}
+
+        header = None
+        records = {}
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Torn last line from a crash mid-write
+                    continue
+                if record.get("type") == "document":
+                    header = record
+                elif record.get("type") == "page" and is_valid_layout(record.get("layout")):
+                    records[record["page"]] = record
+
+        if header is None or header.get("version") != LAYOUT_FORMAT_VERSION:
+            return {}
+        if header.get("sha256") != file_sha256(source_path):
+            print(f"Warning: {self.path} belongs to a different version of {source_path}; starting over.")
+            return {}
+        if header.get("model") != model:
+            print(f"Warning: {self.path} was made with model {header.get('model')}, not {model}; starting over.")
+            return {}
+        self.records = records
+        return {page_num: record["layout"] for page_num, record in records.items()}
+
+    def start(self, source_path, page_count, model=None):
+        """Starts a fresh journal, carrying over the pages returned by load()."""
+        header = {
+            "type": "document",
+            "version": LAYOUT_FORMAT_VERSION,
+            "source": os.path.abspath(source_path),
+            "sha256": file_sha256(source_path),
+            "page_count": page_count,
+            "model": model,
+        }
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(header, ensure_ascii=False) + "\n")
+            for _, record in sorted(self.records.items()):
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self.path)
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def record(self, page_num, width, height, layout_data):
+        record = {"type": "page", "page": page_num, "width": width, "height": height, "layout": layout_data}
+        with self._lock:
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def remove(self):
+        """Deletes the journal once the output has been saved."""
+        self.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class PageManifest:
+    """
+    Page fingerprints and layouts of a finished conversion, kept next to the
+    output so a revised version of the document only sends its changed,
+    inserted or moved pages to the model.
+
+    The manifest is a layout file (see read_layout_file) whose page records
+    also carry the page's `hash` (DocumentProcessor.fingerprint), so it can
+    be passed to `build` as well.
+    """
+    @staticmethod
+    def path_for(output_path):
+        return output_path + ".pages.jsonl"
+
+    @staticmethod
+    def load(path, model=None):
+        """Returns {hash: layout_data}, or {} if there is no usable manifest at path."""
+        if not os.path.exists(path):
+            return {}
+        try:
+            header, pages = read_layout_file(path)
+        except (OSError, ValueError) as e:
+            print(f"Warning: Ignoring page manifest {path}: {e}")
+            return {}
+        if header.get("model") != model:
+            print(f"Warning: {path} was made with model {header.get('model')}, not {model}; analyzing every page again.")
+            return {}
+        return {record["hash"]: record["layout"] for record in pages
+                if record.get("hash") and is_valid_layout(record.get("layout"))}
+
+    @staticmethod
+    def write(path, source_path, page_count, model, pages):
+        """pages: iterable of (page_num, width, height, hash, layout_data)."""
+        header = {
+            "type": "document",
+            "version": LAYOUT_FORMAT_VERSION,
+            "source": os.path.abspath(source_path),
+            "sha256": file_sha256(source_path),
+            "page_count": page_count,
+            "model": model,
+        }
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(header, ensure_ascii=False) + "\n")
+            for page_num, width, height, page_hash, layout_data in sorted(pages):
+                record = {"type": "page", "page": page_num, "width": width, "height": height,
+                          "hash": page_hash, "layout": layout_data}
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, path)
+
+
+def _add_analyze_args(parser):
     parser.add_argument("--api_key", help="Google Gemini API Key", default=os.environ.get("GOOGLE_API_KEY"))
+    parser.add_argument("--engine", help="Layout source: 'auto' (text layer if usable, else Gemini), 'native' or 'gemini'", default="auto", choices=ConversionPipeline.ENGINES)
+    parser.add_argument("--concurrency", help="Number of pages analyzed in parallel", default=4, type=int)
+    parser.add_argument("--cache_dir", "--cache-dir", help="Directory for cached layout results", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--cache_size_mb", help="Maximum size of the layout cache in MB", default=512, type=int)
+    parser.add_argument("--no_cache", "--no-cache", help="Always call the API, ignoring the layout cache", action="store_true")
+    parser.add_argument("--rpm", help="Client-side limit on Gemini requests per minute (0 = no limit)", default=0, type=int)
+    parser.add_argument("--tpm", help="Client-side limit on Gemini input tokens per minute (0 = no limit)", default=0, type=int)
+    parser.add_argument("--max_retries", help="Retries for throttled, failed or malformed Gemini responses", default=5, type=int)
+    parser.add_argument("--batch_size", help="Number of pages sent to Gemini in a single request", default=1, type=int)
+    parser.add_argument("--dedupe", help="Reuse the layout of near-duplicate pages instead of analyzing them again", action="store_true")
+    parser.add_argument("--dedupe_threshold", help="Maximum hash distance (bits of 256) for pages to count as duplicates", default=6, type=int)
+    parser.add_argument("--analysis_max_edge", help="Upload a separate render capped at this many pixels on the long edge (0 = upload the slide render)", default=0, type=int)
+    parser.add_argument("--analysis_format", help="Encoding of the separate analysis render", default="jpeg", choices=["jpeg", "png"])
+    parser.add_argument("--response_format", help="Gemini answer format: 'verbose' layout objects or 'compact' (style table and short keys, fewer output tokens)", default="verbose", choices=RESPONSE_FORMATS)
+    parser.add_argument("--tile_threshold", help="Analyze pages larger than this many A4 sheets as overlapping tiles (0 = never)", default=0, type=float)
+    parser.add_argument("--tile_size", help="Maximum width and height of an analysis tile in points", default=842, type=float)
+    parser.add_argument("--tile_overlap", help="Overlap between neighbouring tiles in points", default=96, type=float)
+    parser.add_argument("--record", help="Append every Gemini response to this JSON Lines file for later --replay")
+    parser.add_argument("--replay", help="Serve layouts from a --record file (or 'synthetic') instead of calling Gemini")
+    parser.add_argument("--replay_latency", help="Simulated seconds per request when replaying", default=0.0, type=float)
+
+
+def _add_build_args(parser):
     parser.add_argument("--mode", help="Conversion mode: 'standard' or 'text_focus'", default="standard", choices=["standard", "text_focus"])
     parser.add_argument("--font_scale", help="Font size scaling factor", default=1.1, type=float)
-    
-    args = parser.parse_args()
-    
+    parser.add_argument("--zoom", help="Render zoom for slide images (2.0 = 144 DPI)", default=2.0, type=float)
+    parser.add_argument("--background_format", help="Encoding of the full-page background in text_focus mode", default="png", choices=ImageEncoder.FORMATS)
+    parser.add_argument("--crop_format", help="Encoding of cropped figures in standard mode", default="png", choices=ImageEncoder.FORMATS)
+    parser.add_argument("--jpeg_quality", help="JPEG quality (1-95) for 'jpeg' and 'auto' formats", default=85, type=int)
+    parser.add_argument("--image_dpi", help="Downscale embedded images to at most this DPI on the slide (0 = keep render resolution)", default=0, type=int)
+    parser.add_argument("--stream", help="Write slides to the output file as they finish to keep memory flat on long documents", action="store_true")
+
+
+def _add_pages_arg(parser):
+    parser.add_argument("--pages", help="Pages to convert, e.g. '1-10,25,40-' (1-based, default: all)")
+
+
+def _add_profile_args(parser):
+    parser.add_argument("--profile", help="Write per-page, per-stage timings to this JSON Lines file and print a summary table")
+    parser.add_argument("--profile_hotspots", help="Also profile function hotspots on the main thread (report next to the --profile file or the output)", choices=["cprofile", "pyinstrument"])
+
+
+def default_args(**overrides):
+    """Conversion options as the CLI would parse them with no flags, updated with `overrides`."""
+    parser = argparse.ArgumentParser(add_help=False)
+    _add_analyze_args(parser)
+    _add_build_args(parser)
+    _add_pages_arg(parser)
+    args = parser.parse_args([])
+    for name, value in overrides.items():
+        setattr(args, name, value)
+    return args
+
+
+def _make_profiler(args):
+    return StageProfiler() if getattr(args, "profile", None) else None
+
+
+def _hotspots(args, output_path):
+    kind = getattr(args, "profile_hotspots", None)
+    base = os.path.splitext(getattr(args, "profile", None) or output_path)[0]
+    return hotspot_profiler(kind, base + (".prof" if kind == "cprofile" else ".html"))
+
+
+def _report_profile(args, profiler, pages):
+    if profiler is None:
+        return
+    profiler.write_jsonl(args.profile, pages=pages)
+    profiler.print_summary(pages=pages)
+    print(f"Profile saved to {args.profile}")
+
+
+def _check_api_key(args):
+    """The model is only needed when some page may go to Gemini."""
+    if args.api_key or args.engine == "native" or getattr(args, "replay", None):
+        return True
+    if args.engine == "auto":
+        print("Warning: No API Key. Pages without a usable text layer cannot be converted.")
+        return True
+    print("Error: API Key is required. Set GOOGLE_API_KEY env var or pass --api_key.")
+    return False
+
+
+def _make_analyzer(args, profiler=None):
+    if args.engine == "native":
+        return None
+    if args.replay:
+        recording = None if args.replay == "synthetic" else args.replay
+        return ReplayAnalyzer(recording, latency=args.replay_latency)
     if not args.api_key:
-        print("Error: API Key is required. Set GOOGLE_API_KEY env var or pass --api_key.")
+        return None
+    cache = None if args.no_cache else LayoutCache(args.cache_dir, max_bytes=args.cache_size_mb * 1024 * 1024)
+    scheduler = RequestScheduler(
+        requests_per_minute=args.rpm or None, tokens_per_minute=args.tpm or None, max_retries=args.max_retries,
+    )
+    analyzer = GeminiAnalyzer(args.api_key, cache=cache, scheduler=scheduler, profiler=profiler, response_format=args.response_format)
+    if args.record:
+        analyzer = RecordingAnalyzer(analyzer, args.record)
+    return analyzer
+
+
+def _make_builder(args, output_path=None, profiler=None):
+    dpi = args.image_dpi or None
+    return PPTXBuilder(
+        output_path or args.output_pptx, mode=args.mode, font_scale=args.font_scale, streaming=args.stream,
+        background_encoder=ImageEncoder(args.background_format, quality=args.jpeg_quality, target_dpi=dpi),
+        crop_encoder=ImageEncoder(args.crop_format, quality=args.jpeg_quality, target_dpi=dpi),
+        profiler=profiler,
+    )
+
+
+def _print_stats(pipeline):
+    stats = pipeline.stats
+    print(f"Layouts: {stats['native']} pages from the text layer, {stats['gemini']} from Gemini in {stats['requests']} requests")
+    if stats["tiled"]:
+        print(f"Tiled: {stats['tiled']} oversized pages analyzed in tiles")
+    if stats["resumed"]:
+        print(f"Resumed: {stats['resumed']} pages taken from the checkpoint journal")
+    if stats["unchanged"]:
+        print(f"Unchanged: {stats['unchanged']} pages reused from the previous conversion")
+    if pipeline.dedupe_index is not None:
+        print(f"Near-duplicate pages: {stats['reused']} API calls saved")
+    if getattr(pipeline.analyzer, "scheduler", None) is not None:
+        sched = pipeline.analyzer.scheduler.stats
+        if sched["retries"] or sched["failed"]:
+            print(f"Gemini: {sched['retries']} retries ({sched['throttled']} throttled), {sched['failed']} failed requests")
+
+
+def check_analyzer(proc, page_nums, analyzer, engine, known=()):
+    """
+    Raises AnalyzerRequiredError before any work starts if some selected page
+    needs the model (no text layer, or engine 'gemini') and there is no
+    analyzer. Pages in `known` already have a layout.
+    """
+    if analyzer is not None or engine == "native":
+        return
+    native = NativeAnalyzer(proc.doc) if engine == "auto" else None
+    missing = [n + 1 for n in page_nums if n not in known and (native is None or not native.has_text_layer(n))]
+    if missing:
+        pages = ", ".join(map(str, missing[:10])) + (", ..." if len(missing) > 10 else "")
+        raise AnalyzerRequiredError(
+            f"API Key is required for {len(missing)} page(s) without a usable text layer ({pages}). "
+            "Set GOOGLE_API_KEY env var or pass --api_key.")
+
+
+def convert_document(input_path, output_path, analyzer, args, dedupe_index=None, log=print, profiler=None, progress=None,
+                     cancel_event=None):
+    """
+    Converts one document with the conversion options in `args` (see
+    _add_analyze_args / _add_build_args). Returns the finished pipeline,
+    whose stats describe where the layouts came from. `progress(done, total)`
+    is called once the pages are selected and after every slide. Raises
+    ConversionCancelled, without saving, once `cancel_event` is set, and
+    AnalyzerRequiredError, before writing anything, if some page needs the
+    model and `analyzer` is None.
+    """
+    proc = DocumentProcessor(input_path, profiler=profiler)
+    try:
+        page_nums = proc.page_numbers(getattr(args, "pages", None))
+    except PageSelectionError:
+        proc.close()
+        raise
+
+    journal = LayoutJournal(LayoutJournal.path_for(output_path))
+    known_layouts = journal.load(input_path, model=getattr(analyzer, "model", None)) if getattr(args, "resume", False) else {}
+    
+    log(f"Processing {input_path} in {args.mode} mode...")
+    if len(page_nums) < len(proc.doc):
+        log(f"Converting {len(page_nums)} of {len(proc.doc)} pages")
+    if known_layouts:
+        log(f"Resuming: {len(known_layouts)} pages already analyzed")
+
+    incremental = getattr(args, "incremental", False)
+    hashes = {}
+    unchanged_layouts = {}
+    if incremental:
+        baseline = getattr(args, "baseline", None) or output_path
+        if not baseline.endswith(".jsonl"):
+            baseline = PageManifest.path_for(baseline)
+        previous = PageManifest.load(baseline, model=getattr(analyzer, "model", None))
+        for page_num in page_nums:
+            hashes[page_num] = proc.fingerprint(page_num)
+            if page_num not in known_layouts and hashes[page_num] in previous:
+                unchanged_layouts[page_num] = previous[hashes[page_num]]
+        if previous:
+            log(f"{len(unchanged_layouts)} of {len(page_nums)} pages unchanged since {baseline}")
+
+    try:
+        check_analyzer(proc, page_nums, analyzer, args.engine, known=known_layouts.keys() | unchanged_layouts.keys())
+    except AnalyzerRequiredError:
+        proc.close()
+        raise
+    builder = _make_builder(args, output_path, profiler=profiler)
+    journal.start(input_path, len(proc.doc), model=getattr(analyzer, "model", None))
+
+    if progress is not None:
+        progress(0, len(page_nums))
+
+    def on_page(done, total, page_num):
+        log(f"Processed page {page_num + 1} ({done}/{total})")
+        if progress is not None:
+            progress(done, total)
+
+    if dedupe_index is None and args.dedupe:
+        dedupe_index = PageHashIndex(threshold=args.dedupe_threshold)
+
+    pipeline = ConversionPipeline(
+        proc, analyzer, builder, concurrency=args.concurrency, zoom=args.zoom,
+        analysis_max_edge=args.analysis_max_edge, analysis_format=args.analysis_format,
+        engine=args.engine,
+        dedupe_index=dedupe_index,
+        batch_size=args.batch_size,
+        known_layouts=known_layouts,
+        journal=journal,
+        profiler=profiler,
+        tile_threshold=args.tile_threshold, tile_size=args.tile_size, tile_overlap=args.tile_overlap,
+        unchanged_layouts=unchanged_layouts, keep_layouts=incremental,
+    )
+    try:
+        pipeline.run(page_nums, cancel_event=cancel_event, on_page=on_page)
+    finally:
+        page_count = len(proc.doc)
+        proc.close()
+        journal.close()
+
+    if cancel_event is not None and cancel_event.is_set():
+        raise ConversionCancelled(f"Cancelled after {pipeline.builder.slide_count} of {len(page_nums)} pages")
+    builder.save()
+    if incremental:
+        PageManifest.write(
+            PageManifest.path_for(output_path), input_path, page_count, getattr(analyzer, "model", None),
+            [(page_num, w, h, hashes[page_num], layout_data) for page_num, (w, h, layout_data) in pipeline.layouts.items()],
+        )
+    journal.remove()
+    return pipeline
+
+
+def cmd_convert(args):
+    if not _check_api_key(args):
         return
 
     if not os.path.exists(args.input_file):
         print(f"Error: Input file {args.input_file} not found.")
         return
 
-    proc = DocumentProcessor(args.input_file)
-    analyzer = GeminiAnalyzer(args.api_key)
-    builder = PPTXBuilder(args.output_pptx, mode=args.mode, font_scale=args.font_scale)
-    
-    print(f"Processing {args.input_file} in {args.mode} mode...")
+    profiler = _make_profiler(args)
+    analyzer = _make_analyzer(args, profiler)
+    try:
+        with _hotspots(args, args.output_pptx):
+            pipeline = convert_document(args.input_file, args.output_pptx, analyzer, args, profiler=profiler)
+    except (PageSelectionError, AnalyzerRequiredError) as e:
+        print(f"Error: {e}")
+        return
+    _print_stats(pipeline)
+    _report_profile(args, profiler, pipeline.builder.slide_count)
+
+
+def cmd_analyze(args):
+    if not _check_api_key(args):
+        return
 
+    if not os.path.exists(args.input_file):
+        print(f"Error: Input file {args.input_file} not found.")
+        return
+
+    profiler = _make_profiler(args)
+    proc = DocumentProcessor(args.input_file, profiler=profiler)
     try:
-        for page_num in range(len(proc.doc)):
-            print(f"Processing page {page_num + 1}/{len(proc.doc)}...")
-            image, w, h = proc.get_page_image(page_num)
-            
-            if page_num == 0:
-                 builder.prs.slide_width = int(w * 12700)
-                 builder.prs.slide_height = int(h * 12700)
+        page_nums = proc.page_numbers(args.pages)
+    except PageSelectionError as e:
+        proc.close()
+        print(f"Error: {e}")
+        return
+    analyzer = _make_analyzer(args, profiler)
+    try:
+        check_analyzer(proc, page_nums, analyzer, args.engine)
+    except AnalyzerRequiredError as e:
+        proc.close()
+        print(f"Error: {e}")
+        return
+    pipeline = ConversionPipeline(
+        proc, analyzer, concurrency=args.concurrency,
+        analysis_max_edge=args.analysis_max_edge, analysis_format=args.analysis_format,
+        engine=args.engine,
+        dedupe_index=PageHashIndex(threshold=args.dedupe_threshold) if args.dedupe else None,
+        batch_size=args.batch_size,
+        profiler=profiler,
+        tile_threshold=args.tile_threshold, tile_size=args.tile_size, tile_overlap=args.tile_overlap,
+    )
+    total = len(page_nums)
+    done = 0
 
-            layout_data = analyzer.analyze_page(image)
-            builder.add_slide(image, layout_data, w, h)
-            
+    print(f"Analyzing {args.input_file}...")
+
+    try:
+        with _hotspots(args, args.output_jsonl), open(args.output_jsonl, "w", encoding="utf-8") as out:
+            header = {
+                "type": "document",
+                "version": LAYOUT_FORMAT_VERSION,
+                "source": os.path.abspath(args.input_file),
+                "sha256": file_sha256(args.input_file),
+                "page_count": len(proc.doc),
+                "model": analyzer.model if analyzer else None,
+            }
+            out.write(json.dumps(header, ensure_ascii=False) + "\n")
+
+            for done, (page_num, _, w, h, layout_data) in enumerate(pipeline.iter_pages(page_nums), 1):
+                record = {"type": "page", "page": page_num, "width": w, "height": h, "layout": layout_data}
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                print(f"Analyzed page {page_num + 1} ({done}/{total})")
     finally:
         proc.close()
-        
-    builder.save()
+
+    print(f"Layout saved to {args.output_jsonl}")
+    _print_stats(pipeline)
+    _report_profile(args, profiler, done)
+
+
+def cmd_build(args):
+    if not os.path.exists(args.layout_jsonl):
+        print(f"Error: Layout file {args.layout_jsonl} not found.")
+        return
+
+    header, pages = read_layout_file(args.layout_jsonl)
+    source = args.input or header.get("source")
+    if not source or not os.path.exists(source):
+        print(f"Error: Source document {source} not found. Pass it with --input.")
+        return
+
+    if file_sha256(source) != header.get("sha256"):
+        if not args.force:
+            print(f"Error: {source} does not match the document the layout was made from. Use --force to build anyway.")
+            return
+        print(f"Warning: {source} does not match the document the layout was made from.")
+
+    profiler = _make_profiler(args)
+    proc = DocumentProcessor(source, profiler=profiler)
+    try:
+        selected = set(proc.page_numbers(args.pages))
+    except PageSelectionError as e:
+        proc.close()
+        print(f"Error: {e}")
+        return
+    pages = [record for record in pages if record["page"] in selected]
+    builder = _make_builder(args, profiler=profiler)
+
+    print(f"Building {args.output_pptx} from {args.layout_jsonl} in {args.mode} mode...")
+
+    with _hotspots(args, args.output_pptx):
+        try:
+            for i, record in enumerate(pages):
+                image, w, h = proc.render_page(record["page"], zoom=args.zoom, lazy=args.mode == "standard")
+                if i == 0:
+                    builder.set_slide_size(w / 72, h / 72)
+                with builder.profiler.stage("build_slide", page=record["page"]) as counters:
+                    builder.add_slide(image, record["layout"], w, h)
+                    counters["peak_rss_mb"] = peak_rss_mb()
+                image.release()
+        finally:
+            proc.close()
+
+        builder.save()
+    _report_profile(args, profiler, builder.slide_count)
+
+
+def main(argv=None):
+    from dotenv import load_dotenv
+    load_dotenv()  # before the parsers read GOOGLE_API_KEY as the --api_key default
+    argv = sys.argv[1:] if argv is None else argv
+
+    if argv and argv[0] == "analyze":
+        parser = argparse.ArgumentParser(prog="pdf2pptx analyze", description="Analyze page layouts with Gemini and write them to a JSONL layout file.")
+        parser.add_argument("input_file", help="Path to input file (PDF, PNG, JPG, etc.)")
+        parser.add_argument("output_jsonl", help="Path to output layout JSONL file")
+        _add_analyze_args(parser)
+        _add_pages_arg(parser)
+        _add_profile_args(parser)
+        cmd_analyze(parser.parse_args(argv[1:]))
+    elif argv and argv[0] == "build":
+        parser = argparse.ArgumentParser(prog="pdf2pptx build", description="Build a PPTX from a JSONL layout file without calling the API.")
+        parser.add_argument("layout_jsonl", help="Path to layout JSONL file written by 'analyze'")
+        parser.add_argument("output_pptx", help="Path to output PPTX file")
+        parser.add_argument("--input", help="Source document (defaults to the path recorded in the layout file)")
+        parser.add_argument("--force", help="Build even if the source document hash does not match", action="store_true")
+        _add_build_args(parser)
+        _add_pages_arg(parser)
+        _add_profile_args(parser)
+        cmd_build(parser.parse_args(argv[1:]))
+    elif argv and argv[0] == "batch":
+        from batch_convert import add_batch_args, cmd_batch
+        parser = argparse.ArgumentParser(prog="pdf2pptx batch", description="Convert many documents with a pool of worker processes sharing one Gemini rate limit.")
+        add_batch_args(parser)
+        _add_analyze_args(parser)
+        _add_build_args(parser)
+        _add_pages_arg(parser)
+        parser.add_argument("--resume", help="Continue interrupted conversions from their journals", action="store_true")
+        parser.add_argument("--incremental", help="Keep a page manifest next to each output and only analyze pages that changed since the last run", action="store_true")
+        cmd_batch(parser.parse_args(argv[1:]))
+    elif argv and argv[0] == "serve":
+        from service import add_service_args, cmd_serve
+        parser = argparse.ArgumentParser(prog="pdf2pptx serve", description="Run a local HTTP conversion service with a warm worker pool.")
+        add_service_args(parser)
+        _add_analyze_args(parser)
+        _add_build_args(parser)
+        cmd_serve(parser.parse_args(argv[1:]))
+    else:
+        parser = argparse.ArgumentParser(
+            description="Convert PDF or Images to editable PPTX using Gemini.",
+            epilog="Subcommands: 'analyze INPUT LAYOUT.jsonl' and 'build LAYOUT.jsonl OUTPUT.pptx' split the conversion into two phases; 'batch INPUTS... -o DIR' converts many files; 'serve' runs a local conversion service.",
+        )
+        parser.add_argument("input_file", help="Path to input file (PDF, PNG, JPG, etc.)")
+        parser.add_argument("output_pptx", help="Path to output PPTX file")
+        _add_analyze_args(parser)
+        _add_build_args(parser)
+        parser.add_argument("--resume", help="Continue an interrupted conversion, reusing pages recorded in OUTPUT.journal.jsonl", action="store_true")
+        parser.add_argument("--incremental", help="Keep a page manifest (OUTPUT.pages.jsonl) and only analyze pages that changed since the last conversion", action="store_true")
+        parser.add_argument("--baseline", help="With --incremental: previous output (or its .pages.jsonl manifest) to reuse unchanged pages from; defaults to OUTPUT")
+        _add_pages_arg(parser)
+        _add_profile_args(parser)
+        cmd_convert(parser.parse_args(argv))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,182 @@
+"""
+Per-stage timing for conversions.
+
+StageProfiler records the wall and CPU time of named stages (render, encode,
+analyze, build_slide, save, ...) together with per-stage counters such as
+bytes uploaded or response tokens. Stages nest: a stage opened without a page
+number inherits the page of the enclosing stage on the same thread. Records
+can be written as JSON Lines or printed as a summary table.
+
+NULL_PROFILER does nothing, so instrumented code never has to check whether
+profiling is on.
+"""
+import contextlib
+import json
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None where unsupported."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+class StageProfiler:
+    def __init__(self):
+        self.records = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._start = time.perf_counter()
+
+    @contextlib.contextmanager
+    def stage(self, name, page=None, **counters):
+        """
+        Times the enclosed block. Yields the counters dict so the block can
+        add values that are only known once it has run:
+
+            with profiler.stage("encode", page=3) as c:
+                c["bytes"] = len(data)
+        """
+        stack = getattr(self._local, "pages", None)
+        if stack is None:
+            stack = self._local.pages = []
+        if page is None and stack:
+            page = stack[-1]
+        stack.append(page)
+
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        try:
+            yield counters
+        finally:
+            self.record(name, page, time.perf_counter() - wall, time.thread_time() - cpu, **counters)
+            stack.pop()
+
+    def record(self, name, page=None, wall=0.0, cpu=0.0, **counters):
+        entry = {"stage": name, "page": page, "wall_s": round(wall, 6), "cpu_s": round(cpu, 6)}
+        entry.update(counters)
+        with self._lock:
+            self.records.append(entry)
+
+    def summary(self):
+        """{stage: {"calls", "wall_s", "cpu_s", "max_wall_s", <summed counters>}} in first-seen order."""
+        stages = {}
+        with self._lock:
+            records = list(self.records)
+        for entry in records:
+            agg = stages.setdefault(entry["stage"], {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0, "max_wall_s": 0.0})
+            agg["calls"] += 1
+            agg["wall_s"] += entry["wall_s"]
+            agg["cpu_s"] += entry["cpu_s"]
+            agg["max_wall_s"] = max(agg["max_wall_s"], entry["wall_s"])
+            for key, value in entry.items():
+                if key in ("stage", "page", "wall_s", "cpu_s") or isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                if key.startswith("peak_"):
+                    agg[key] = max(agg.get(key, 0), value)
+                else:
+                    agg[key] = agg.get(key, 0) + value
+        return stages
+
+    def totals(self, pages=None):
+        """Run-level figures: elapsed wall time, pages/second and peak RSS."""
+        elapsed = time.perf_counter() - self._start
+        totals = {"stage": "total", "wall_s": round(elapsed, 6), "peak_rss_mb": peak_rss_mb()}
+        if pages is not None:
+            totals["pages"] = pages
+            totals["pages_per_s"] = round(pages / elapsed, 3) if elapsed > 0 else None
+        return totals
+
+    def write_jsonl(self, path, pages=None):
+        """Writes one line per stage record, one per stage summary and a final totals line."""
+        with open(path, "w", encoding="utf-8") as f:
+            with self._lock:
+                records = list(self.records)
+            for entry in records:
+                f.write(json.dumps(entry) + "\n")
+            for name, agg in self.summary().items():
+                f.write(json.dumps({"stage": name, "type": "summary", **agg}) + "\n")
+            f.write(json.dumps(self.totals(pages)) + "\n")
+
+    def print_summary(self, pages=None, log=print):
+        stages = self.summary()
+        totals = self.totals(pages)
+        log(f"{'stage':<16}{'calls':>7}{'wall s':>10}{'cpu s':>10}{'max ms':>10}  counters")
+        for name, agg in stages.items():
+            extra = ", ".join(
+                f"{k}={v:g}" if isinstance(v, float) else f"{k}={v}"
+                for k, v in agg.items() if k not in ("calls", "wall_s", "cpu_s", "max_wall_s")
+            )
+            log(f"{name:<16}{agg['calls']:>7}{agg['wall_s']:>10.3f}{agg['cpu_s']:>10.3f}{agg['max_wall_s'] * 1000:>10.1f}  {extra}")
+        line = f"Total {totals['wall_s']:.2f}s"
+        if pages:
+            line += f", {pages} pages ({totals['pages_per_s']} pages/s)"
+        if totals["peak_rss_mb"] is not None:
+            line += f", peak RSS {totals['peak_rss_mb']} MB"
+        log(line)
+
+
+class _NullProfiler:
+    records = ()
+
+    def stage(self, name, page=None, **counters):
+        return contextlib.nullcontext(counters)
+
+    def record(self, name, page=None, wall=0.0, cpu=0.0, **counters):
+        pass
+
+
+NULL_PROFILER = _NullProfiler()
+
+
+@contextlib.contextmanager
+def hotspot_profiler(kind, path):
+    """
+    Runs the enclosed block under cProfile (stats written to `path`, top
+    functions printed) or pyinstrument (HTML report written to `path`).
+    Both only sample the calling thread, which is where rendering and slide
+    assembly happen; model requests run on worker threads. With kind None
+    the block just runs.
+    """
+    if not kind:
+        yield
+    elif kind == "cprofile":
+        import cProfile
+        import pstats
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(path)
+            pstats.Stats(profiler).sort_stats("cumulative").print_stats(25)
+            print(f"cProfile stats saved to {path}")
+    elif kind == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            print("Warning: pyinstrument is not installed (pip install pyinstrument); running without it.")
+            yield
+            return
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(profiler.output_html())
+            print(f"pyinstrument report saved to {path}")
+    else:
+        raise ValueError(f"Unknown hotspot profiler: {kind}")
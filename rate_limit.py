@@ -0,0 +1,166 @@
+"""
+Client-side request scheduling for the Gemini API.
+
+RequestScheduler is shared by every worker that talks to the model. It keeps
+requests under the configured requests/min and tokens/min budgets with token
+buckets, backs off with jittered exponential delays on throttling and server
+errors, and adapts its own request rate to the error rate it observes: each
+throttle halves the rate, each success slowly restores it. Without a
+configured budget there is no rate to scale, so the same factor caps the
+number of requests in flight instead (a share of the most seen so far).
+"""
+import random
+import threading
+import time
+
+
+class TokenBucket:
+    """Continuous-refill token bucket holding at most `per_minute` tokens."""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now, rate_factor=1.0):
+        """Seconds until `amount` tokens are available (0 if they are now)."""
+        self._refill(now)
+        # Requests bigger than the whole bucket go through once it is full
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / (self.rate * rate_factor)
+
+    def take(self, amount):
+        self.tokens -= amount
+
+    def adjust(self, amount):
+        """Corrects an earlier estimate once the real cost is known (may go negative)."""
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class RetryableError(Exception):
+    """Raised by a request function to ask the scheduler for another attempt."""
+
+
+class RequestScheduler:
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None, max_retries=5,
+                 base_delay=1.0, max_delay=60.0, min_rate_factor=0.1):
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.min_rate_factor = min_rate_factor
+
+        # Adaptive share of the configured rate, lowered on throttling
+        self.rate_factor = 1.0
+        # Shared pause after a throttle so all workers back off together
+        self._pause_until = 0.0
+        # Requests in flight, and the most seen at once (scaled by rate_factor when no bucket is set)
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._lock = threading.Lock()
+        self._released = threading.Condition(self._lock)
+
+        self.stats = {"requests": 0, "retries": 0, "throttled": 0, "failed": 0}
+
+    def concurrency_limit(self):
+        """Requests allowed in flight at once (None = unlimited). Call with the lock held."""
+        if self.request_bucket is not None or self.token_bucket is not None or self.rate_factor >= 1.0:
+            return None
+        return max(1, int(self.peak_in_flight * self.rate_factor))
+
+    def acquire(self, estimated_tokens=0):
+        """Blocks until the request fits in the current rate budget; pair with release()."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = max(0.0, self._pause_until - now)
+                if self.request_bucket is not None:
+                    wait = max(wait, self.request_bucket.wait_time(1, now, self.rate_factor))
+                if self.token_bucket is not None:
+                    wait = max(wait, self.token_bucket.wait_time(estimated_tokens, now, self.rate_factor))
+                limit = self.concurrency_limit()
+                if wait <= 0 and limit is not None and self.in_flight >= limit:
+                    # Woken by release(); the timeout rechecks a limit raised by on_success
+                    self._released.wait(self.base_delay)
+                    continue
+                if wait <= 0:
+                    if self.request_bucket is not None:
+                        self.request_bucket.take(1)
+                    if self.token_bucket is not None:
+                        self.token_bucket.take(estimated_tokens)
+                    self.in_flight += 1
+                    self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+                    self.stats["requests"] += 1
+                    return
+            time.sleep(min(wait, self.max_delay))
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+            self._released.notify()
+
+    def record_tokens(self, estimated_tokens, actual_tokens):
+        if self.token_bucket is not None and actual_tokens is not None:
+            with self._lock:
+                self.token_bucket.adjust(actual_tokens - estimated_tokens)
+
+    def on_success(self):
+        with self._lock:
+            self.rate_factor = min(1.0, self.rate_factor + 0.05)
+
+    def on_throttle(self, delay):
+        with self._lock:
+            self.stats["throttled"] += 1
+            self.rate_factor = max(self.min_rate_factor, self.rate_factor * 0.5)
+            self._pause_until = max(self._pause_until, time.monotonic() + delay)
+
+    def backoff_delay(self, attempt):
+        """Full-jitter exponential backoff."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def call(self, fn, estimated_tokens=0, is_throttle=None, is_retryable=None):
+        """
+        Runs fn() under the rate limits, retrying failures.
+
+        fn may raise RetryableError (e.g. for an unparseable response).
+        is_throttle(exc) marks quota errors (429), which also slow everyone down;
+        is_retryable(exc) marks other transient errors (5xx, network).
+        Anything else is raised immediately. After max_retries the last error
+        is raised.
+        """
+        attempt = 0
+        while True:
+            self.acquire(estimated_tokens)
+            try:
+                result = fn()
+            except Exception as e:
+                self.release()
+                throttled = is_throttle is not None and is_throttle(e)
+                retryable = throttled or isinstance(e, RetryableError) or (is_retryable is not None and is_retryable(e))
+                if not retryable or attempt >= self.max_retries:
+                    with self._lock:
+                        self.stats["failed"] += 1
+                    raise
+
+                delay = self.backoff_delay(attempt)
+                if throttled:
+                    self.on_throttle(delay)
+                with self._lock:
+                    self.stats["retries"] += 1
+                print(f"Request failed ({e}), retrying in {delay:.1f}s (attempt {attempt + 1}/{self.max_retries})")
+                time.sleep(delay)
+                attempt += 1
+                continue
+
+            # Raise the limit before waking a waiting request
+            self.on_success()
+            self.release()
+            return result
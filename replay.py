@@ -0,0 +1,168 @@
+"""
+Offline stand-ins for GeminiAnalyzer.
+
+Any object with analyze_page(image) -> layout dict, analyze_pages(images) ->
+[layout dict] and a `model` attribute can serve as ConversionPipeline's
+analyzer; images are PageRenders or PIL Images. ReplayAnalyzer answers
+without network access, from recorded responses or with synthetic layouts,
+after an optional simulated latency. RecordingAnalyzer wraps a real analyzer
+and saves its responses for later replay.
+
+Recordings are keyed by the exact image bytes sent to the model, so replay a
+document with the same --zoom / --analysis_max_edge / --analysis_format it
+was recorded with. Pages missing from a recording get a synthetic layout
+(or a KeyError with strict=True).
+"""
+import copy
+import hashlib
+import io
+import json
+import random
+import threading
+import time
+
+_WORDS = (
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor "
+    "incididunt ut labore et dolore magna aliqua enim ad minim veniam quis nostrud"
+).split()
+
+
+def _image_bytes(image):
+    data = getattr(image, "data", None)
+    if data is None:
+        stream = io.BytesIO()
+        image.save(stream, format="PNG")
+        data = stream.getvalue()
+    return data
+
+
+def response_key(image):
+    """Recording key for a PageRender or PIL Image: SHA-256 of its encoded bytes."""
+    return hashlib.sha256(_image_bytes(image)).hexdigest()
+
+
+def synthetic_layout(key, text_blocks=12, image_regions=2):
+    """
+    A deterministic, plausible layout for `key`: a title and body paragraphs
+    down the left of the page and figures stacked in the right column.
+    """
+    rng = random.Random(key)
+    blocks = []
+    slot = 920 // max(1, text_blocks)
+    for i in range(text_blocks):
+        ymin = 40 + i * slot
+        is_title = i == 0
+        blocks.append({
+            "text": " ".join(rng.choice(_WORDS) for _ in range(rng.randint(4, 30))),
+            "box_2d": [ymin, 60, ymin + max(1, int(slot * 0.7)), 60 + rng.randint(300, 560)],
+            "font_size_pt": 24 if is_title else rng.choice([10, 11, 12, 14]),
+            "font_color_hex": "#000000" if is_title else rng.choice(["#000000", "#333333", "#1F3864"]),
+            "font_family": rng.choice(["sans", "serif"]),
+            "is_bold": is_title,
+            "is_title": is_title,
+        })
+
+    regions = []
+    slot = 920 // max(1, image_regions)
+    for i in range(image_regions):
+        ymin = 40 + i * slot
+        regions.append({"box_2d": [ymin, 660, ymin + int(slot * 0.8), 950], "description": "figure"})
+
+    return {"text_blocks": blocks, "image_regions": regions}
+
+
+def load_recording(path):
+    """{key: layout} from a JSON Lines file written by RecordingAnalyzer."""
+    responses = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if record.get("type") == "response":
+                responses[record["key"]] = record["layout"]
+    return responses
+
+
+class ReplayAnalyzer:
+    """
+    Serves recorded or synthetic layouts. Each call (single page or batch)
+    sleeps latency + uniform(0, jitter) seconds first, like one API request.
+    """
+    model = "replay"
+
+    def __init__(self, recording=None, latency=0.0, jitter=0.0, strict=False,
+                 text_blocks=12, image_regions=2, seed=0):
+        self.responses = load_recording(recording) if recording else {}
+        self.latency = latency
+        self.jitter = jitter
+        self.strict = strict
+        self.text_blocks = text_blocks
+        self.image_regions = image_regions
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "replayed": 0, "synthetic": 0}
+
+    def _wait(self):
+        with self._lock:
+            self.stats["requests"] += 1
+            delay = self.latency + (self._rng.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _layout(self, image):
+        key = response_key(image)
+        layout = self.responses.get(key)
+        if layout is not None:
+            source = "replayed"
+        elif self.strict:
+            raise KeyError(f"No recorded response for page image {key[:12]}")
+        else:
+            layout = synthetic_layout(key, self.text_blocks, self.image_regions)
+            source = "synthetic"
+        with self._lock:
+            self.stats[source] += 1
+        return copy.deepcopy(layout)
+
+    def analyze_page(self, image):
+        self._wait()
+        return self._layout(image)
+
+    def analyze_pages(self, images):
+        self._wait()
+        return [self._layout(image) for image in images]
+
+
+class RecordingAnalyzer:
+    """Wraps another analyzer and appends every response to a recording file."""
+
+    def __init__(self, analyzer, path):
+        self.analyzer = analyzer
+        self.model = analyzer.model
+        self.scheduler = getattr(analyzer, "scheduler", None)
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def _record(self, images, layouts):
+        lines = [
+            json.dumps({"type": "response", "key": response_key(image), "layout": layout}, ensure_ascii=False) + "\n"
+            for image, layout in zip(images, layouts)
+        ]
+        with self._lock:
+            self._file.writelines(lines)
+            self._file.flush()
+
+    def analyze_page(self, image):
+        layout = self.analyzer.analyze_page(image)
+        self._record([image], [layout])
+        return layout
+
+    def analyze_pages(self, images):
+        layouts = self.analyzer.analyze_pages(images)
+        self._record(images, layouts)
+        return layouts
+
+    def close(self):
+        self._file.close()
@@ -0,0 +1,375 @@
+"""
+Long-running local conversion service.
+
+Imports, the worker processes and the analyzer (one Gemini client, rate
+limiter and layout cache) are set up once at startup; every submitted
+document then goes straight to a warm worker.
+
+    python pdf2pptx.py serve --port 8765
+    python pdf2pptx.py serve --socket /tmp/pdf2pptx.sock
+
+HTTP API (JSON unless noted):
+
+    POST   /jobs?name=doc.pdf&mode=text_focus&pages=1-5
+                                 body: the document bytes -> 202 job
+    GET    /jobs                 all jobs
+    GET    /jobs/<id>            status and progress (pages_done / pages_total)
+    GET    /jobs/<id>/result     the PPTX file once status is "done"
+    DELETE /jobs/<id>            cancels a queued job or deletes a finished one
+    GET    /health               worker count and jobs per status
+
+Query parameters other than `name` are conversion options (--mode,
+--font_scale, --zoom, --pages, ...) overriding the service defaults for
+that job. Boolean options take 1/true/yes.
+"""
+import argparse
+import copy
+import json
+import os
+import shutil
+import signal
+import socketserver
+import tempfile
+import threading
+import time
+import uuid
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, quote, urlsplit
+
+import pdf2pptx
+from batch_convert import SUPPORTED_EXTENSIONS, WorkerPool
+
+PPTX_MIME = "application/vnd.openxmlformats-officedocument.presentationml.presentation"
+
+
+class JobError(Exception):
+    """A request the service cannot accept; carries the HTTP status to answer with."""
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class _OptionParser(argparse.ArgumentParser):
+    def error(self, message):
+        raise JobError(HTTPStatus.BAD_REQUEST, message)
+
+
+def _job_option_parser():
+    """Per-job options: the build options and --pages."""
+    parser = _OptionParser(add_help=False)
+    pdf2pptx._add_build_args(parser)
+    pdf2pptx._add_pages_arg(parser)
+    return parser
+
+
+class Job:
+    def __init__(self, job_id, name, input_path, output_path, args):
+        self.id = job_id
+        self.name = name
+        self.input_path = input_path
+        self.output_path = output_path
+        self.args = args
+        self.status = "queued"
+        self.pages_done = 0
+        self.pages_total = None
+        self.error = None
+        self.summary = None
+        self.future = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "status": self.status,
+            "mode": self.args.mode,
+            "pages_done": self.pages_done,
+            "pages_total": self.pages_total,
+            "error": self.error,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "api_calls": self.summary.get("api_calls") if self.summary else None,
+            "result": f"/jobs/{self.id}/result" if self.status == "done" else None,
+        }
+
+
+class ConversionService:
+    """
+    Job table plus a warm WorkerPool (see batch_convert). A parent thread
+    folds the workers' page progress into the job table.
+    """
+    def __init__(self, args):
+        self.args = args
+        self.work_dir = args.work_dir or tempfile.mkdtemp(prefix="pdf2pptx-service-")
+        os.makedirs(self.work_dir, exist_ok=True)
+        self.option_parser = _job_option_parser()
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+        self.analyzer = pdf2pptx._make_analyzer(args)
+        # Workers never talk to the API themselves
+        self.job_args = copy.copy(args)
+        self.job_args.api_key = None
+
+        self.pool = WorkerPool(self.analyzer, args.workers, analysis_concurrency=args.analysis_concurrency,
+                               dedupe_threshold=args.dedupe_threshold)
+        self.workers = self.pool.workers
+        self.progress_thread = threading.Thread(target=self._progress_loop, daemon=True)
+        self.progress_thread.start()
+
+    def warm_up(self):
+        self.pool.warm_up()
+
+    def close(self):
+        self.pool.cancel()
+        self.pool.close()
+        self.pool.progress_queue.put(None)
+        self.progress_thread.join()
+
+    def _progress_loop(self):
+        while True:
+            message = self.pool.progress_queue.get()
+            if message is None:
+                break
+            job_id, done, total = message
+            with self.lock:
+                job = self.jobs.get(job_id)
+                if job is None or job.status not in ("queued", "running"):
+                    continue
+                if job.status == "queued":
+                    job.status = "running"
+                    job.started = time.time()
+                job.pages_done = done
+                job.pages_total = total
+
+    def submit(self, name, stream, length, query):
+        name = os.path.basename(name or "document.pdf")
+        ext = os.path.splitext(name)[1].lower()
+        if ext not in SUPPORTED_EXTENSIONS:
+            raise JobError(HTTPStatus.UNSUPPORTED_MEDIA_TYPE, f"Unsupported file type '{ext}' (expected one of {', '.join(SUPPORTED_EXTENSIONS)})")
+        if length <= 0:
+            raise JobError(HTTPStatus.BAD_REQUEST, "Empty request body")
+        if length > self.args.max_upload_mb * 1024 * 1024:
+            raise JobError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"Upload exceeds {self.args.max_upload_mb} MB")
+
+        args = self._job_args(query)
+        job_id = uuid.uuid4().hex[:16]
+        job_dir = os.path.join(self.work_dir, job_id)
+        os.makedirs(job_dir)
+        input_path = os.path.join(job_dir, "input" + ext)
+        with open(input_path, "wb") as f:
+            remaining = length
+            while remaining:
+                chunk = stream.read(min(remaining, 1024 * 1024))
+                if not chunk:
+                    shutil.rmtree(job_dir, ignore_errors=True)
+                    raise JobError(HTTPStatus.BAD_REQUEST, "Upload ended early")
+                f.write(chunk)
+                remaining -= len(chunk)
+
+        output_name = os.path.splitext(name)[0] + ".pptx"
+        job = Job(job_id, name, input_path, os.path.join(job_dir, output_name), args)
+        with self.lock:
+            self.jobs[job_id] = job
+            job.future = self.pool.submit(input_path, job.output_path, args, job_id)
+        job.future.add_done_callback(lambda future: self._finish(job, future))
+        print(f"Job {job_id}: {name} queued ({args.mode} mode)")
+        return job
+
+    def _job_args(self, query):
+        argv = []
+        actions = {action.dest: action for action in self.option_parser._actions}
+        for key, value in query:
+            if key == "name":
+                continue
+            action = actions.get(key.replace("-", "_"))
+            if action is None:
+                raise JobError(HTTPStatus.BAD_REQUEST, f"Unknown option '{key}'")
+            if action.nargs == 0:
+                if value.lower() in ("1", "true", "yes"):
+                    argv.append(action.option_strings[0])
+            else:
+                argv += [action.option_strings[0], value]
+        args = self.option_parser.parse_args(argv, namespace=copy.copy(self.job_args))
+        if args.pages:
+            try:
+                pdf2pptx.parse_page_spec(args.pages)
+            except pdf2pptx.PageSelectionError as e:
+                raise JobError(HTTPStatus.BAD_REQUEST, str(e))
+        return args
+
+    def _finish(self, job, future):
+        with self.lock:
+            job.finished = time.time()
+            if future.cancelled():
+                job.status = "cancelled"
+                return
+            try:
+                summary = future.result()
+            except Exception as e:
+                # The worker process itself died
+                job.status = "error"
+                job.error = f"{type(e).__name__}: {e}"
+            else:
+                job.summary = summary
+                job.status = {"ok": "done", "cancelled": "cancelled"}.get(summary["status"], "error")
+                job.error = summary["error"]
+                if job.status == "done":
+                    job.pages_done = job.pages_total = summary["pages"]
+        print(f"Job {job.id}: {job.status}" + (f" ({job.error})" if job.error else ""))
+
+    def get(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+        if job is None:
+            raise JobError(HTTPStatus.NOT_FOUND, f"No job '{job_id}'")
+        return job
+
+    def list(self):
+        with self.lock:
+            return [job.to_dict() for job in self.jobs.values()]
+
+    def delete(self, job_id):
+        job = self.get(job_id)
+        if job.status == "queued" and not job.future.cancel():
+            raise JobError(HTTPStatus.CONFLICT, "Job is already running")
+        if job.status == "running":
+            raise JobError(HTTPStatus.CONFLICT, "Job is running")
+        with self.lock:
+            self.jobs.pop(job_id, None)
+        shutil.rmtree(os.path.dirname(job.input_path), ignore_errors=True)
+
+    def health(self):
+        counts = {}
+        with self.lock:
+            for job in self.jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+        return {"status": "ok", "workers": self.workers, "model": getattr(self.analyzer, "model", None), "jobs": counts}
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    server_version = "pdf2pptx-service"
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def address_string(self):
+        # Unix socket peers have no address
+        return self.client_address[0] if self.client_address else "unix"
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_file(self, path, filename):
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", PPTX_MIME)
+        self.send_header("Content-Length", str(os.path.getsize(path)))
+        self.send_header("Content-Disposition", f"attachment; filename*=UTF-8''{quote(filename)}")
+        self.end_headers()
+        with open(path, "rb") as f:
+            shutil.copyfileobj(f, self.wfile)
+
+    def _route(self, method):
+        url = urlsplit(self.path)
+        parts = [part for part in url.path.split("/") if part]
+        try:
+            if method == "GET" and parts == ["health"]:
+                return self._send_json(HTTPStatus.OK, self.service.health())
+            if parts[:1] != ["jobs"] or len(parts) > 3:
+                raise JobError(HTTPStatus.NOT_FOUND, f"No route for {method} {url.path}")
+
+            if len(parts) == 1:
+                if method == "GET":
+                    return self._send_json(HTTPStatus.OK, {"jobs": self.service.list()})
+                if method == "POST":
+                    query = parse_qsl(url.query, keep_blank_values=True)
+                    name = dict(query).get("name")
+                    length = int(self.headers.get("Content-Length") or 0)
+                    job = self.service.submit(name, self.rfile, length, query)
+                    return self._send_json(HTTPStatus.ACCEPTED, job.to_dict())
+            elif len(parts) == 2:
+                if method == "GET":
+                    return self._send_json(HTTPStatus.OK, self.service.get(parts[1]).to_dict())
+                if method == "DELETE":
+                    self.service.delete(parts[1])
+                    return self._send_json(HTTPStatus.OK, {"deleted": parts[1]})
+            elif parts[2] == "result" and method == "GET":
+                job = self.service.get(parts[1])
+                if job.status != "done":
+                    raise JobError(HTTPStatus.CONFLICT, f"Job is {job.status}")
+                return self._send_file(job.output_path, os.path.basename(job.output_path))
+            raise JobError(HTTPStatus.METHOD_NOT_ALLOWED, f"{method} not allowed on {url.path}")
+        except JobError as e:
+            if method == "POST":
+                # Unread upload bytes would be taken for the next request
+                self.close_connection = True
+            self._send_json(e.status, {"error": str(e)})
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_POST(self):
+        self._route("POST")
+
+    def do_DELETE(self):
+        self._route("DELETE")
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def add_service_args(parser):
+    parser.add_argument("--host", help="Address to listen on", default="127.0.0.1")
+    parser.add_argument("--port", help="TCP port to listen on", default=8765, type=int)
+    parser.add_argument("--socket", help="Listen on this Unix socket instead of TCP")
+    parser.add_argument("--work_dir", help="Where uploads and results are kept (default: a temp dir)")
+    parser.add_argument("--workers", help="Number of worker processes for rendering and assembly", default=os.cpu_count() or 2, type=int)
+    parser.add_argument("--analysis_concurrency", help="Number of Gemini requests in flight across all workers", default=8, type=int)
+    parser.add_argument("--max_upload_mb", help="Largest accepted upload in MB", default=200, type=int)
+
+
+def cmd_serve(args):
+    if not pdf2pptx._check_api_key(args):
+        return
+
+    service = ConversionService(args)
+    print(f"Starting {service.workers} workers...")
+    service.warm_up()
+
+    if args.socket:
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        httpd = UnixHTTPServer(args.socket, ServiceHandler)
+        where = args.socket
+    else:
+        httpd = ThreadingHTTPServer((args.host, args.port), ServiceHandler)
+        where = f"http://{args.host}:{httpd.server_address[1]}"
+    httpd.service = service
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+
+    # Shut the worker pool down on a plain `kill` too
+    signal.signal(signal.SIGTERM, stop)
+    print(f"Serving on {where} (jobs in {service.work_dir})")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("Shutting down...")
+    finally:
+        httpd.server_close()
+        service.close()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)